@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Athena result retrieval benchmark for the processor Glue job, offline.
+
+Runs the landing query against the SQLite backed LocalAthenaClient and loads the result
+either page by page through GetQueryResults (what pd.read_sql over a pyathena cursor does)
+or by streaming the result file (athena_landing_source with fetch='bulk'), and with --shards
+as date shard queries that run --concurrency at a time. --latency adds a simulated round trip to
+every Athena API call, --seconds-per-row the run time of a query per scanned row.
+
+    python benchmarks/athena_fetch.py --rows 100000 --latency 0.1
+    python benchmarks/athena_fetch.py --rows 400000 --days 365 --seconds-per-row 0.00002 --shards 8 --concurrency 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), "processor", "assets"))
+
+import pandas as pd
+from local_aws import LocalAthenaClient, LocalS3Client, PagedResultsConnection
+from script import athena_landing_source, build_query
+
+COLUMNS = ['id', 'services', 'title', 'link', 'date', 'description']
+
+def write_landing(s3, rows, days=1):
+    """ rows spread over one landing object per day, uploaded on consecutive days """
+    for day in range(days):
+        lines = ["id;category;title;link;published;summary"]
+        lines += [
+            f"{i:040x};general:products/amazon-s3,marketing:marchitecture/storage;Announcement {i};"
+            f"https://aws.amazon.com/about-aws/whats-new/{i}/;Thu, 15 Sep 2022 17:37:29 +0000;<p>Summary of {i}</p>"
+            for i in range(rows * day // days, rows * (day + 1) // days)
+        ]
+        uploaded = datetime(2022, 9, 15) + timedelta(days=day)
+        s3.put_object(Bucket='bucket', Key=f'landing/{uploaded:%Y-%m-%d}T00:02:00_feed.csv', Body="\n".join(lines) + "\n")
+
+def read_landing(athena, s3, **kwargs):
+    """ This function reads the landing table with a bulk athena_landing_source, in one DataFrame """
+    source = athena_landing_source('bucket', 'aws_feed', 'aws_feed_landing', athena=athena, s3=s3, **kwargs)
+    return pd.concat(list(source()), ignore_index=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every Athena API call")
+    parser.add_argument("--days", type=int, default=1, help="days of landing objects the rows are spread over")
+    parser.add_argument("--seconds-per-row", type=float, default=0.0, help="simulated query run time per scanned row")
+    parser.add_argument("--shards", type=int, default=1, help="also read the landing table in this many date shards")
+    parser.add_argument("--concurrency", type=int, default=4, help="shard queries running at the same time")
+    args = parser.parse_args()
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as root:
+        s3 = LocalS3Client(root)
+        write_landing(s3, args.rows, args.days)
+        athena = LocalAthenaClient(s3, latency=args.latency, seconds_per_row=args.seconds_per_row)
+        athena.register_landing_table('aws_feed', 'aws_feed_landing', 'bucket', 'landing/', COLUMNS)
+
+        start = time.perf_counter()
+        pd.read_sql(build_query('aws_feed', 'aws_feed_landing'), PagedResultsConnection(athena, 's3://bucket/athena_output/'))
+        timings['paged'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        read_landing(athena, s3)
+        timings['bulk'] = time.perf_counter() - start
+
+        if args.shards > 1:
+            start = time.perf_counter()
+            df = read_landing(athena, s3, shards=args.shards, concurrency=args.concurrency)
+            timings[f'{args.shards} shards'] = time.perf_counter() - start
+            assert len(df) == args.rows
+
+    print(f"{'fetch':<10} {'seconds':>8} {'rows/s':>12}")
+    for name, seconds in timings.items():
+        print(f"{name:<10} {seconds:8.2f} {args.rows / seconds:12,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark for the collector Lambda.
+
+Every sample runs in a fresh interpreter, the same way a Lambda cold start does: it imports
+lambda_function and encodes a batch of synthetic entries with the given csv engine.
+The stdlib engine never imports pandas, the pandas engine imports it on first use.
+
+    python benchmarks/collector_cold_start.py --runs 10 --entries 100
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "collector", "lambda")
+
+SAMPLE = """
+import sys, time, json
+t0 = time.perf_counter()
+sys.path.insert(0, {lambda_dir!r})
+import lambda_function
+from common_utilities.csv_encoding import encode_records
+t1 = time.perf_counter()
+records = [
+    {{'id': '%040x' % i, 'category': [{{'term': 'general:products/amazon-s3', 'scheme': None, 'label': None}}],
+      'title': 'title %d' % i, 'link': 'https://aws.amazon.com/%d' % i,
+      'published': 'Thu, 15 Sep 2022 17:37:29 GMT', 'summary': '<p>summary; "quoted"</p>'}}
+    for i in range({entries})
+]
+body = encode_records(records, {engine!r})
+t2 = time.perf_counter()
+print(json.dumps({{'import': t1 - t0, 'first_encode': t2 - t1, 'total': t2 - t0,
+                   'pandas_loaded': 'pandas' in sys.modules, 'bytes': len(body)}}))
+"""
+
+def run_sample(engine, entries):
+    code = SAMPLE.format(lambda_dir=LAMBDA_DIR, engine=engine, entries=entries)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--entries", type=int, default=100)
+    parser.add_argument("--engines", default="stdlib,pandas")
+    args = parser.parse_args()
+
+    print(f"{'engine':<8} {'import ms':>10} {'encode ms':>10} {'total ms':>10} {'pandas':>7}")
+    for engine in args.engines.split(","):
+        try:
+            samples = [run_sample(engine, args.entries) for _ in range(args.runs)]
+        except subprocess.CalledProcessError as e:
+            print(f"{engine:<8} failed: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        median = lambda key: statistics.median(sample[key] for sample in samples) * 1000
+        print(f"{engine:<8} {median('import'):>10.1f} {median('first_encode'):>10.1f} {median('total'):>10.1f} "
+              f"{str(samples[0]['pandas_loaded']):>7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+End to end benchmark of the collector Lambda and the processor Glue job, offline.
+
+For every size a synthetic RSS feed is served from a local HTTP server and the pipeline runs
+against the stand-ins of local_aws (filesystem S3, SQLite Athena, recording SNS and Glue):
+
+    collector        lambda_handler: fetch, parse, dedup, landing csv upload, state, SNS
+                     followed by its own stages (indented), from its EMF metrics file
+    collector_rerun  lambda_handler again, the feed is unchanged (conditional request)
+    trigger          processor Lambda with an SQS batch of the landing events, starts the Glue workflow
+    query            athena_landing_source, the landing query through Athena
+    pipeline         run_pipeline like the Glue job: dedup over the ids, then read, cleanup, enrich,
+                     explode (not with --report-layout normalized), save and aggregate per chunk,
+                     followed by its own stages (indented), from its EMF metrics file
+    save_aggregates  store_aggregates, the announcement counts by product, category and period
+    notify           send_sns_message
+
+Every stage reports rows, wall clock seconds, rows/s and the peak of traced Python memory.
+Memory tracing slows the run down, --no-memory measures time only.
+
+    python benchmarks/end_to_end.py --sizes 1000,10000,100000
+    python benchmarks/end_to_end.py --sizes 1000000 --parse-mode stream --no-memory
+"""
+import argparse
+import contextlib
+import functools
+import hashlib
+import http.server
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from unittest import mock
+from xml.sax.saxutils import escape
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "collector", "lambda"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "processor", "assets"))
+
+from common_utilities.metrics import read_metrics_file
+from local_aws import LocalAthenaClient, LocalGlueClient, LocalS3Client, LocalSNSClient, local_boto3
+
+BUCKET = 'bucket'
+DATABASE = 'aws_feed'
+TABLE = 'aws_feed_landing'
+TOPIC_ARN = 'arn:aws:sns:us-east-1:000000000000:local'
+WORKFLOW = 'local-workflow'
+# columns of the landing table in ProcessorStack, in the order of the landing csv columns
+LANDING_COLUMNS = ['id', 'services', 'title', 'link', 'date', 'description']
+
+PRODUCTS = ['amazon-s3', 'amazon-ec2', 'aws-lambda', 'amazon-athena', 'aws-glue', 'amazon-sns', 'amazon-rds']
+CATEGORIES = ['storage', 'compute', 'serverless', 'analytics', 'databases', 'application-services']
+
+
+def write_synthetic_feed(path, entries, newest=None):
+    """
+    This function writes an RSS 2.0 feed with the given number of items, newest first and one second
+    apart, with 1 to 3 products and 1 to 2 categories per item like the AWS What's New feed.
+    """
+    newest = (newest or datetime.now(timezone.utc)).replace(microsecond=0)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0"><channel>'
+                f'<title>Synthetic feed</title><lastBuildDate>{format_datetime(newest)}</lastBuildDate>\n')
+        for i in range(entries):
+            categories = [f'general:products/{PRODUCTS[(i + j) % len(PRODUCTS)]}' for j in range(1 + i % 3)]
+            categories += [f'marketing:marchitecture/{CATEGORIES[(i + j) % len(CATEGORIES)]}' for j in range(1 + i % 2)]
+            f.write(
+                f'<item><guid isPermaLink="false">{hashlib.sha1(str(i).encode()).hexdigest()}</guid>'
+                f'<title>Announcement {i}</title>'
+                f'<link>https://aws.amazon.com/about-aws/whats-new/{i}/</link>'
+                f'<pubDate>{format_datetime(newest - timedelta(seconds=i))}</pubDate>'
+                f'<description>{escape(f"<p>Synthetic announcement {i}; details follow.</p>")}</description>'
+                + "".join(f'<category>{category}</category>' for category in categories)
+                + '</item>\n'
+            )
+        f.write('</channel></rss>\n')
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve_directory(directory):
+    """ Serves a directory over HTTP on a free local port, yields the base url """
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class StageTimer:
+    """ Collects wall clock time and peak traced memory per stage """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.results = []
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        result = {'stage': name, 'rows': rows}
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield result
+        finally:
+            result['seconds'] = time.perf_counter() - start
+            if self.trace_memory:
+                result['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+            self.results.append(result)
+
+
+def load_processor_trigger():
+    """ The processor Lambda is also named lambda_function, load it under another module name """
+    path = os.path.join(ROOT_DIR, "processor", "lambda", "lambda_function.py")
+    spec = importlib.util.spec_from_file_location("processor_trigger", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def metric_stages(path):
+    """ This function returns the stages of an EMF metrics file as indented stage results """
+    return [
+        {'stage': f"  {document['Stage']}", 'rows': document.get('Rows'),
+         'seconds': document['Duration'] / 1000, 'bytes': document.get('Bytes')}
+        for document in read_metrics_file(path)
+        # documents of extra metrics, like the number of duplicates, have no duration
+        if 'Duration' in document
+    ]
+
+
+def run_pipeline(root, entries, parse_mode='feedparser', report_layout='exploded', trace_memory=True,
+                 compression='none'):
+    """ This function runs the collector and the processor once over a synthetic feed, returns the stage results """
+    import lambda_function
+    import script
+    from common_utilities import aws_clients as collector_clients
+    import aws_clients as processor_clients
+
+    timer = StageTimer(trace_memory)
+    feed_dir = os.path.join(root, 'feeds')
+    os.makedirs(feed_dir)
+    write_synthetic_feed(os.path.join(feed_dir, 'feed.xml'), entries)
+
+    s3 = LocalS3Client(os.path.join(root, 's3'))
+    sns = LocalSNSClient()
+    athena = LocalAthenaClient(s3)
+    workflow_runs = []
+    glue = LocalGlueClient(on_run=lambda name, properties: workflow_runs.append(name))
+    clients = {'s3': s3, 'sns': sns, 'athena': athena, 'glue': glue}
+    # the stage metrics of the collector, they break the collector stage down
+    metrics_file = os.path.join(root, 'metrics.jsonl')
+
+    # the collector and the Glue script import the client registry under different module names
+    collector_clients.reset_clients()
+    processor_clients.reset_clients()
+    with serve_directory(feed_dir) as base_url, local_boto3(clients), mock.patch.dict(os.environ, {
+        'FEED_URLS': f"{base_url}/feed.xml",
+        'BUCKET_NAME': BUCKET,
+        'DAYS_RANGE': '3650',
+        'SNS_TOPIC_ARN': TOPIC_ARN,
+        'FEED_TIMEOUT': '3600',
+        'PARSE_MODE': parse_mode,
+        'COMPRESSION': compression,
+        'GLUE_WORKFLOW_NAME': WORKFLOW,
+        'METRICS_FILE': metrics_file,
+    }):
+        with timer.stage('collector', entries) as result:
+            response = lambda_function.lambda_handler({}, None)
+        if response['statusCode'] != 200:
+            raise Exception(f"Collector failed: {response}")
+        timer.results.extend(metric_stages(metrics_file))
+        landing = s3.list_objects_v2(Bucket=BUCKET, Prefix='landing/')['Contents']
+        result['bytes'] = sum(item['Size'] for item in landing)
+
+        with timer.stage('collector_rerun', entries):
+            lambda_function.lambda_handler({}, None)
+
+        trigger = load_processor_trigger()
+        event = {'Records': [
+            {'body': json.dumps({'detail': {'bucket': {'name': BUCKET}, 'object': {'key': item['Key']}}})}
+            for item in landing
+        ]}
+        with timer.stage('trigger', 1):
+            trigger.lambda_handler(event, None)
+        if workflow_runs != [WORKFLOW]:
+            raise Exception(f"Expected one workflow run, got {workflow_runs}")
+
+        # the stages of main() of the Glue script, in the same order
+        athena.register_landing_table(DATABASE, TABLE, BUCKET, 'landing/', LANDING_COLUMNS)
+        with timer.stage('query', 1):
+            source = script.athena_landing_source(BUCKET, DATABASE, TABLE, athena=athena, s3=s3)
+        writer = script.report_writer(f"s3://{BUCKET}", report_layout, compression=compression)
+        processor_metrics_file = os.path.join(root, 'processor_metrics.jsonl')
+        with timer.stage('pipeline') as result:
+            pipeline = script.run_pipeline(source, writer, report_layout,
+                                           metrics=script.MetricsLogger('processor', path=processor_metrics_file))
+            result['rows'] = pipeline['rows'] + pipeline['duplicates']
+            result['output_rows'] = pipeline['output_rows']
+        timer.results.extend(metric_stages(processor_metrics_file))
+        with timer.stage('save_aggregates') as result:
+            script.store_aggregates(BUCKET, pipeline['aggregates'], incremental=False, stats=result)
+        with timer.stage('notify', 1):
+            script.send_sns_message(TOPIC_ARN, pipeline['uri'])
+    collector_clients.reset_clients()
+    processor_clients.reset_clients()
+
+    return timer.results
+
+
+def print_results(entries, results):
+    print(f"\n{entries:,} entries")
+    print(f"{'stage':<16} {'rows':>10} {'seconds':>9} {'rows/s':>12} {'peak MB':>9}")
+    for result in results:
+        rows = result['rows'] or 0
+        rate = rows / result['seconds'] if rows and result['seconds'] else 0
+        peak = f"{result['peak_mb']:9.1f}" if 'peak_mb' in result else f"{'-':>9}"
+        print(f"{result['stage']:<16} {rows:>10,} {result['seconds']:9.3f} {rate:12,.0f} {peak}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated numbers of feed entries")
+    parser.add_argument("--parse-mode", default="feedparser", choices=["feedparser", "stream"])
+    parser.add_argument("--report-layout", default="exploded", choices=["exploded", "normalized"])
+    parser.add_argument("--compression", default="none", choices=["none", "gzip", "zstd"])
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory, time only")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    report = {}
+    for entries in [int(size) for size in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as root:
+            results = run_pipeline(root, entries, args.parse_mode, args.report_layout, not args.no_memory,
+                                   args.compression)
+        print_results(entries, results)
+        report[entries] = results
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+"""
+Local stand-ins for the AWS clients used by the collector and the processor.
+
+They implement the subset of the boto3 client API the pipeline calls, so tests and
+benchmarks can run offline:
+
+- LocalS3Client stores objects as files under a root directory
+- LocalAthenaClient runs queries with SQLite over the ';' separated landing csv files in
+  LocalS3Client, and writes results to the output location the same way Athena does
+  (a csv file with every value quoted and NULL as an empty field)
+- LocalSNSClient and LocalGlueClient record published messages and started workflow runs
+
+local_boto3 patches boto3.client and boto3.resource so unmodified pipeline code uses them.
+"""
+import contextlib
+import csv
+import functools
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from unittest import mock
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+class LocalClientError(ClientError):
+    """ A botocore ClientError, so pipeline code that catches ClientError handles it the same way """
+
+    def __init__(self, code, message='', operation_name='Local'):
+        super().__init__({'Error': {'Code': code, 'Message': message}}, operation_name)
+
+
+def split_s3_uri(uri):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+class _Paginator:
+
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        yield self.method(**kwargs)
+
+
+class LocalS3Client:
+    """ A filesystem backed S3 client: s3://bucket/key is stored as root/bucket/key """
+
+    def __init__(self, root):
+        self.root = root
+        self.multipart_uploads = {}
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        elif hasattr(Body, 'read'):
+            Body = Body.read()
+        with open(path, 'wb') as f:
+            f.write(Body)
+        if kwargs.get('Metadata'):
+            with open(path + '.metadata', 'w') as f:
+                json.dump(kwargs['Metadata'], f)
+        return {'ETag': f'"{uuid.uuid4().hex}"'}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise LocalClientError('NoSuchKey', Key)
+        with open(path, 'rb') as f:
+            body = f.read()
+        return {'Body': io.BytesIO(body), 'ContentLength': len(body), 'Metadata': self._metadata(path)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise LocalClientError('404', Key)
+        return {'ContentLength': os.path.getsize(path), 'Metadata': self._metadata(path)}
+
+    def _metadata(self, path):
+        if not os.path.isfile(path + '.metadata'):
+            return {}
+        with open(path + '.metadata') as f:
+            return json.load(f)
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        base = os.path.join(self.root, Bucket)
+        contents = []
+        for directory, _, files in os.walk(base):
+            for name in files:
+                if name.endswith('.metadata'):
+                    continue
+                key = os.path.relpath(os.path.join(directory, name), base).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    contents.append({'Key': key, 'Size': os.path.getsize(os.path.join(directory, name))})
+        contents.sort(key=lambda item: item['Key'])
+        return {'Contents': contents, 'KeyCount': len(contents)}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        return self.delete_objects(Bucket=Bucket, Delete={'Objects': [{'Key': Key}]})
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete['Objects']:
+            path = self._path(Bucket, item['Key'])
+            for candidate in (path, path + '.metadata'):
+                if os.path.isfile(candidate):
+                    os.remove(candidate)
+        return {}
+
+    def get_paginator(self, operation):
+        return _Paginator(getattr(self, operation))
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        self.multipart_uploads[upload_id] = {'Bucket': Bucket, 'Key': Key, 'Parts': {}, 'Args': kwargs}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if UploadId not in self.multipart_uploads:
+            raise LocalClientError('NoSuchUpload', UploadId)
+        # parts are kept on disk, so memory measured around an upload is the memory of the uploader
+        path = os.path.join(self.root, '.multipart', UploadId, str(PartNumber))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(Body)
+        etag = f'"{uuid.uuid4().hex}"'
+        self.multipart_uploads[UploadId]['Parts'][PartNumber] = (etag, path)
+        return {'ETag': etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.multipart_uploads.pop(UploadId, None)
+        if upload is None:
+            raise LocalClientError('NoSuchUpload', UploadId)
+        requested = MultipartUpload['Parts']
+        paths = []
+        for i, part in enumerate(requested):
+            etag, path = upload['Parts'][part['PartNumber']]
+            if etag != part['ETag']:
+                raise LocalClientError('InvalidPart', str(part['PartNumber']))
+            # like S3, every part but the last must be at least 5 MiB
+            if i < len(requested) - 1 and os.path.getsize(path) < 5 * 1024 * 1024:
+                raise LocalClientError('EntityTooSmall', str(part['PartNumber']))
+            paths.append(path)
+
+        target = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            for path in paths:
+                with open(path, 'rb') as part:
+                    shutil.copyfileobj(part, f)
+        shutil.rmtree(os.path.join(self.root, '.multipart', UploadId))
+        if upload['Args'].get('Metadata'):
+            with open(target + '.metadata', 'w') as f:
+                json.dump(upload['Args']['Metadata'], f)
+        return {'Location': f"s3://{Bucket}/{Key}"}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.multipart_uploads.pop(UploadId, None)
+        shutil.rmtree(os.path.join(self.root, '.multipart', UploadId), ignore_errors=True)
+        return {}
+
+
+class _LocalS3Object:
+
+    def __init__(self, client, bucket, key):
+        self.client = client
+        self.bucket_name = bucket
+        self.key = key
+
+    def put(self, **kwargs):
+        return self.client.put_object(Bucket=self.bucket_name, Key=self.key, **kwargs)
+
+    def get(self, **kwargs):
+        return self.client.get_object(Bucket=self.bucket_name, Key=self.key, **kwargs)
+
+
+class LocalS3Resource:
+    """ The part of boto3.resource('s3') the pipeline uses: s3.Object(bucket, key).put(Body=...) """
+
+    def __init__(self, client):
+        self.meta = mock.Mock(client=client)
+
+    def Object(self, bucket_name, key):
+        return _LocalS3Object(self.meta.client, bucket_name, key)
+
+
+class LocalSNSClient:
+    """ Records published messages in self.messages """
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, TopicArn, Message, Subject=None, **kwargs):
+        message_id = uuid.uuid4().hex
+        self.messages.append({'TopicArn': TopicArn, 'Subject': Subject, 'Message': Message, 'MessageId': message_id})
+        return {'MessageId': message_id}
+
+
+class LocalGlueClient:
+    """
+    Records workflow runs in self.runs. on_run, if given, is called with the workflow name and
+    run properties of every run, which lets a benchmark execute the job synchronously.
+    max_concurrent_runs mirrors the workflow setting: runs that are not marked finished with
+    finish_workflow_run count as running.
+    """
+
+    class exceptions:
+        ConcurrentRunsExceededException = type('ConcurrentRunsExceededException', (ClientError,), {})
+        EntityNotFoundException = type('EntityNotFoundException', (ClientError,), {})
+
+    def __init__(self, on_run=None, max_concurrent_runs=None):
+        self.on_run = on_run
+        self.max_concurrent_runs = max_concurrent_runs
+        self.runs = []
+
+    def start_workflow_run(self, Name, RunProperties=None, **kwargs):
+        running = [run for run in self.runs if run['Name'] == Name and run['Status'] == 'RUNNING']
+        if self.max_concurrent_runs is not None and len(running) >= self.max_concurrent_runs:
+            raise self.exceptions.ConcurrentRunsExceededException(
+                {'Error': {'Code': 'ConcurrentRunsExceededException', 'Message': Name}}, 'StartWorkflowRun'
+            )
+        run = {'Name': Name, 'RunId': uuid.uuid4().hex, 'RunProperties': dict(RunProperties or {}), 'Status': 'RUNNING'}
+        self.runs.append(run)
+        if self.on_run is not None:
+            self.on_run(Name, run['RunProperties'])
+            run['Status'] = 'COMPLETED'
+        return {'RunId': run['RunId']}
+
+    def finish_workflow_run(self, run_id):
+        for run in self.runs:
+            if run['RunId'] == run_id:
+                run['Status'] = 'COMPLETED'
+
+    def get_workflow_run_properties(self, Name, RunId):
+        for run in self.runs:
+            if run['Name'] == Name and run['RunId'] == RunId:
+                return {'RunProperties': run['RunProperties']}
+        raise self.exceptions.EntityNotFoundException(
+            {'Error': {'Code': 'EntityNotFoundException', 'Message': RunId}}, 'GetWorkflowRunProperties'
+        )
+
+
+@contextlib.contextmanager
+def local_boto3(clients):
+    """
+    Patches boto3.client, boto3.resource and boto3.Session to return the local stand-ins in clients,
+    a dict like {'s3': LocalS3Client(root), 'sns': LocalSNSClient()}. Asking for any other service
+    fails, so nothing reaches AWS by accident. Clients cached by common_utilities/aws_clients
+    outlive the patch, reset them with reset_clients() before and after.
+    """
+    def client(service_name, *args, **kwargs):
+        if service_name not in clients:
+            raise KeyError(f"No local stand-in for the {service_name} client")
+        return clients[service_name]
+
+    def resource(service_name, *args, **kwargs):
+        if service_name != 's3':
+            raise KeyError(f"No local stand-in for the {service_name} resource")
+        return LocalS3Resource(clients['s3'])
+
+    def session(*args, **kwargs):
+        return mock.Mock(client=client, resource=resource)
+
+    with mock.patch.object(boto3, 'client', client), mock.patch.object(boto3, 'resource', resource), \
+            mock.patch.object(boto3, 'Session', session):
+        yield clients
+
+
+# called for every row, with the few distinct "$path" values of a table
+@functools.lru_cache(maxsize=4096)
+def _regexp_extract(value, pattern):
+    if value is None:
+        return None
+    match = re.search(pattern, value)
+    return match.group(0) if match else None
+
+
+class LocalAthenaClient:
+    """
+    An Athena client backed by SQLite.
+
+    register_landing_table loads every csv object under a prefix of the LocalS3Client into a SQLite
+    table with a "$path" column, the same pseudo column Athena exposes. Queries reference tables as
+    database.table like in Athena, regexp_extract is available as a SQL function.
+
+    A query is executed when it is started, but it is reported as RUNNING for query_seconds plus
+    seconds_per_row for every scanned row of its table, which models the run time of Athena
+    queries. Queries may be started from several threads; max_running is the most queries that
+    were running at the same time.
+    """
+
+    def __init__(self, s3, latency=0.0, query_seconds=0.0, seconds_per_row=0.0):
+        self.s3 = s3
+        self.latency = latency
+        self.query_seconds = query_seconds
+        self.seconds_per_row = seconds_per_row
+        self.connection = sqlite3.connect(':memory:', check_same_thread=False)
+        self.connection.create_function('regexp_extract', 2, _regexp_extract)
+        self.lock = threading.Lock()
+        self.executions = {}
+        self.tables = {}
+        self.row_counts = {}
+        self.max_running = 0
+
+    def register_landing_table(self, database, table, bucket, prefix, columns):
+        """ columns are the table columns, in the order of the csv columns of the landing files """
+        name = f"{database}_{table}"
+        quoted = ", ".join(f'"{column}" TEXT' for column in ['$path'] + columns)
+        self.connection.execute(f'DROP TABLE IF EXISTS "{name}"')
+        self.connection.execute(f'CREATE TABLE "{name}" ({quoted})')
+        keys = [item['Key'] for item in self.s3.list_objects_v2(Bucket=bucket, Prefix=prefix)['Contents']]
+        for key in keys:
+            body = self.s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+            if key.endswith('.gz'):
+                # like Athena, csv files are decompressed by extension
+                body = gzip.decompress(body)
+            body = body.decode('utf-8')
+            reader = csv.reader(io.StringIO(body), delimiter=';')
+            next(reader, None)
+            path = f"s3://{bucket}/{key}"
+            self.connection.executemany(
+                f'INSERT INTO "{name}" VALUES ({", ".join("?" * (len(columns) + 1))})',
+                ([path] + (row + [None] * len(columns))[:len(columns)] for row in reader)
+            )
+        self.connection.commit()
+        self.tables[name] = columns
+        self.row_counts[name] = self.connection.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+
+    def _scanned_rows(self, query, translated, result_rows):
+        # a query restricted to year/month/day partitions or to objects by file name only scans those
+        # (the landing queries have no other filter, so that is the result), anything else the whole table
+        if re.search(r'\byear\s*=|\) >= \'|\) < \'', query):
+            return result_rows
+        match = re.search(r'FROM "(\w+)"', translated)
+        return self.row_counts.get(match.group(1), 0) if match else result_rows
+
+    def _translate(self, query):
+        # database.table -> "database_table", and like in Athena * does not include "$path"
+        match = re.search(r'\bFROM\s+(\w+)\.(\w+)', query, flags=re.I)
+        if match:
+            name = f"{match.group(1)}_{match.group(2)}"
+            query = query[:match.start()] + f'FROM "{name}"' + query[match.end():]
+            if name in self.tables:
+                visible = ", ".join(f'"{column}"' for column in self.tables[name])
+                query = re.sub(r'^\s*SELECT\s+\*', f'SELECT {visible}', query, flags=re.I)
+        return query
+
+    def start_query_execution(self, QueryString, ResultConfiguration=None, **kwargs):
+        time.sleep(self.latency)
+        execution_id = uuid.uuid4().hex
+        output_location = (ResultConfiguration or {}).get('OutputLocation', 's3://local/athena_output/')
+        output = f"{output_location.rstrip('/')}/{execution_id}.csv"
+        translated = self._translate(QueryString)
+        try:
+            with self.lock:
+                cursor = self.connection.execute(translated)
+                columns = [description[0] for description in cursor.description]
+                rows = cursor.fetchall()
+                scanned = self._scanned_rows(QueryString, translated, len(rows))
+        except sqlite3.Error as e:
+            self.executions[execution_id] = {'State': 'FAILED', 'StateChangeReason': str(e), 'OutputLocation': output}
+            return {'QueryExecutionId': execution_id}
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        writer.writerow(columns)
+        for row in rows:
+            # Athena writes NULL as an empty unquoted field
+            buffer.write(",".join('' if value is None else '"' + str(value).replace('"', '""') + '"' for value in row) + '\n')
+        bucket, key = split_s3_uri(output)
+        self.s3.put_object(Bucket=bucket, Key=key, Body=buffer.getvalue())
+        now = time.monotonic()
+        with self.lock:
+            self.executions[execution_id] = {
+                'State': 'SUCCEEDED', 'OutputLocation': output, 'Columns': columns, 'Rows': rows,
+                'Finishes': now + self.query_seconds + scanned * self.seconds_per_row,
+            }
+            running = sum(1 for execution in self.executions.values() if execution.get('Finishes', 0) > now)
+            self.max_running = max(self.max_running, running)
+        return {'QueryExecutionId': execution_id}
+
+    def get_query_execution(self, QueryExecutionId):
+        execution = self.executions[QueryExecutionId]
+        state = execution['State']
+        if state == 'SUCCEEDED' and time.monotonic() < execution['Finishes']:
+            state = 'RUNNING'
+        return {'QueryExecution': {
+            'QueryExecutionId': QueryExecutionId,
+            'Status': {'State': state, 'StateChangeReason': execution.get('StateChangeReason', '')},
+            'ResultConfiguration': {'OutputLocation': execution['OutputLocation']},
+        }}
+
+    def get_query_results(self, QueryExecutionId, MaxResults=1000, NextToken=None):
+        """ Pages of at most 1000 rows like Athena, the first page starts with the header row """
+        time.sleep(self.latency)
+        execution = self.executions[QueryExecutionId]
+        columns = execution['Columns']
+        rows = [tuple(columns)] + execution['Rows']
+        start = int(NextToken or 0)
+        end = start + min(MaxResults, 1000)
+        response = {
+            'ResultSet': {
+                'Rows': [{'Data': [{} if value is None else {'VarCharValue': str(value)} for value in row]}
+                         for row in rows[start:end]],
+                'ResultSetMetadata': {'ColumnInfo': [{'Name': column, 'Type': 'varchar'} for column in columns]},
+            }
+        }
+        if end < len(rows):
+            response['NextToken'] = str(end)
+        return response
+
+
+class PagedResultsConnection:
+    """
+    A minimal DB-API connection over LocalAthenaClient that fetches results page by page through
+    get_query_results and converts every value in Python, the way a pyathena cursor does.
+    pd.read_sql accepts it in place of pyathena.connect(...).
+    """
+
+    def __init__(self, athena, output_location):
+        self.athena = athena
+        self.output_location = output_location
+
+    def cursor(self):
+        return _PagedCursor(self.athena, self.output_location)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _PagedCursor:
+
+    def __init__(self, athena, output_location):
+        self.athena = athena
+        self.output_location = output_location
+        self.description = None
+        self._rows = []
+
+    def execute(self, query, *args):
+        execution_id = self.athena.start_query_execution(
+            QueryString=query, ResultConfiguration={'OutputLocation': self.output_location}
+        )['QueryExecutionId']
+        status = self.athena.get_query_execution(execution_id)['QueryExecution']['Status']
+        while status['State'] == 'RUNNING':
+            time.sleep(0.01)
+            status = self.athena.get_query_execution(execution_id)['QueryExecution']['Status']
+        if status['State'] != 'SUCCEEDED':
+            raise sqlite3.OperationalError(status['StateChangeReason'])
+
+        rows, token, header = [], None, True
+        while True:
+            kwargs = {'QueryExecutionId': execution_id, 'MaxResults': 1000}
+            if token:
+                kwargs['NextToken'] = token
+            response = self.athena.get_query_results(**kwargs)
+            for row in response['ResultSet']['Rows']:
+                values = tuple(value.get('VarCharValue') for value in row['Data'])
+                if header:
+                    header = False
+                    continue
+                rows.append(values)
+            token = response.get('NextToken')
+            if not token:
+                break
+        columns = response['ResultSet']['ResultSetMetadata']['ColumnInfo']
+        self.description = [(column['Name'], None, None, None, None, None, None) for column in columns]
+        self._rows = rows
+        return self
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate clustering benchmark for the processor Glue job.
+
+Builds a synthetic history of announcements in which some launches are repeated for several regions,
+clusters it with the MinHash/LSH index of the processor (in batches, like incremental runs) and
+compares the clusters with the generated ones. With --pairwise it also compares every pair of
+signatures, the O(n^2) approach, on the same entries.
+
+    python benchmarks/near_duplicates.py --entries 50000 --batch 5000
+    python benchmarks/near_duplicates.py --entries 5000 --pairwise
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "processor", "assets"))
+
+import numpy as np
+from minhash import MinHashIndex, minhash_signatures, CLUSTER_THRESHOLD
+
+REGIONS = ["US East (Ohio)", "US West (Oregon)", "Europe (Paris)", "Europe (Milan)", "Asia Pacific (Tokyo)",
+           "Asia Pacific (Seoul)", "South America (Sao Paulo)", "Canada (Central)", "Middle East (UAE)"]
+
+def synthetic_history(entries, seed=1):
+    """ Returns (texts, launch of every text): a third of the launches are announced for 2 to 6 regions """
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(20000)]
+    texts, launches = [], []
+    launch = 0
+    while len(texts) < entries:
+        body = " ".join(rng.choices(vocabulary, k=rng.randint(30, 80)))
+        regions = rng.sample(REGIONS, rng.randint(2, 6)) if rng.random() < 1 / 3 else [rng.choice(REGIONS)]
+        for region in regions[:entries - len(texts)]:
+            texts.append(f"Service {launch} is now available in the AWS {region} Region. {body}")
+            launches.append(launch)
+        launch += 1
+    return texts, np.array(launches)
+
+def pair_scores(clusters, launches):
+    """ Precision and recall of the pairs of entries placed in the same cluster """
+    def pairs(labels):
+        _, counts = np.unique(labels, return_counts=True)
+        return int((counts * (counts - 1) // 2).sum())
+    both = pairs(clusters.astype(np.int64) * (int(launches.max()) + 1) + launches)
+    found, expected = pairs(clusters), pairs(launches)
+    return both / found if found else 1.0, both / expected if expected else 1.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=50_000)
+    parser.add_argument("--batch", type=int, default=5_000, help="entries per run, matched against the stored index")
+    parser.add_argument("--pairwise", action="store_true", help="also compare all pairs of signatures")
+    args = parser.parse_args()
+
+    texts, launches = synthetic_history(args.entries)
+    ids = np.array([f"id{i}" for i in range(len(texts))], dtype=object)
+
+    index = MinHashIndex()
+    clusters = []
+    start = time.perf_counter()
+    for first in range(0, len(texts), args.batch):
+        # every batch goes through a stored index, like one incremental Glue run
+        index = MinHashIndex.from_bytes(index.to_bytes())
+        clusters.append(index.assign(ids[first:first + args.batch], texts[first:first + args.batch]))
+    lsh = time.perf_counter() - start
+    precision, recall = pair_scores(np.concatenate(clusters), launches)
+    print(f"{'method':<10} {'seconds':>8} {'precision':>10} {'recall':>8}")
+    print(f"{'lsh':<10} {lsh:8.2f} {precision:10.3f} {recall:8.3f}")
+
+    if args.pairwise:
+        start = time.perf_counter()
+        signatures = minhash_signatures(texts)
+        labels = np.arange(len(texts))
+        for i in range(len(texts)):
+            # the first earlier entry that is similar enough, like a union with the oldest cluster
+            similar = np.flatnonzero((signatures[:i] == signatures[i]).mean(axis=1) >= CLUSTER_THRESHOLD)
+            if len(similar):
+                labels[i] = labels[similar[0]]
+        pairwise = time.perf_counter() - start
+        precision, recall = pair_scores(labels, launches)
+        print(f"{'pairwise':<10} {pairwise:8.2f} {precision:10.3f} {recall:8.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Polling schedule simulation for the collector.
+
+Replays a feed history against the daily schedule, an hourly schedule and the adaptive schedule
+of common_utilities/polling.py, and prints the number of polls and the latency from publishing
+to collection of every entry. The history is a json list of publish times, a directory of feed
+XML snapshots, or a synthetic feed that publishes in bursts on weekdays.
+
+    python benchmarks/polling_simulation.py --days 28
+    python benchmarks/polling_simulation.py --history publish_times.json --train-days 14
+    python benchmarks/polling_simulation.py --snapshots ./snapshots
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "collector", "lambda"))
+
+from common_utilities.polling import simulate
+
+def synthetic_history(start, days, seed=1):
+    """ Publish times of a feed that posts bursts of 1-6 entries 2-5 times per working day, rarely on weekends """
+    rng = random.Random(seed)
+    times = []
+    for day in range(days):
+        date = start + timedelta(days=day)
+        bursts = rng.randint(2, 5) if date.weekday() < 5 else rng.randint(0, 1)
+        for _ in range(bursts):
+            burst = date + timedelta(hours=rng.uniform(14, 24))
+            times.extend(burst + timedelta(seconds=rng.uniform(0, 300)) for _ in range(rng.randint(1, 6)))
+    return sorted(times)
+
+def snapshot_history(directory) -> list:
+    """ Publish times of the distinct entries of the feed snapshots in a directory, see lambda/backfill.py """
+    from backfill import list_snapshots, parse_snapshots
+    from common_utilities.date_helpers import string_to_date
+    records = parse_snapshots(list_snapshots(directory))
+    return sorted(string_to_date(record['published']) for record in records.values())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", help="json list of ISO publish times")
+    parser.add_argument("--snapshots", help="directory of feed XML snapshots")
+    parser.add_argument("--days", type=int, default=28, help="days of the synthetic history")
+    parser.add_argument("--train-days", type=int, default=7,
+                        help="days at the start of the history that the adaptive schedule learns from and that are not scored")
+    args = parser.parse_args()
+
+    if args.history:
+        with open(args.history) as f:
+            times = sorted(datetime.fromisoformat(value) for value in json.load(f))
+    elif args.snapshots:
+        times = snapshot_history(args.snapshots)
+    else:
+        times = synthetic_history(datetime(2026, 1, 5), args.days)
+    if not times:
+        sys.exit("The history is empty")
+
+    start = times[0].replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=args.train_days)
+    end = times[-1] + timedelta(days=1)
+    print(f"{len(times)} entries, scored from {start:%Y-%m-%d} to {end:%Y-%m-%d}")
+    print(f"{'schedule':<10} {'polls':>7} {'detected':>9} {'mean':>9} {'median':>9} {'p95':>9} {'max':>9}")
+    schedules = [
+        ("daily", {"fixed_interval": timedelta(days=1)}),
+        ("hourly", {"fixed_interval": timedelta(hours=1)}),
+        ("adaptive", {}),
+    ]
+    for name, options in schedules:
+        summary = simulate(times, start, end, **options)
+        latencies = [summary.get(key, 0) / 60 for key in ("mean_latency", "median_latency", "p95_latency", "max_latency")]
+        print(f"{name:<10} {summary['polls']:>7} {summary['detected']:>9} "
+              + " ".join(f"{value:>7.1f}m" for value in latencies))
+
+if __name__ == "__main__":
+    main()
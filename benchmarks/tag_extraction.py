@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tag extraction benchmark for the processor Glue job.
+
+Compares the per row extract_product_names/extract_category_names functions with the
+factorized single pattern parse_tags on a synthetic 'services' column.
+
+    python benchmarks/tag_extraction.py --rows 1000000 --distinct 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "processor", "assets"))
+
+import pandas as pd
+from script import extract_product_names, extract_category_names, parse_tags
+
+PRODUCTS = [f"amazon-service-{i}" for i in range(300)]
+CATEGORIES = ["analytics", "compute", "storage", "databases", "security-identity-and-compliance",
+              "machine-learning", "networking-and-content-delivery", "management-and-governance"]
+
+def synthetic_services(rows, distinct, seed=1):
+    """ Tag strings shaped like the feed's, with a bounded number of distinct values like the real history """
+    rng = random.Random(seed)
+    values = []
+    for _ in range(distinct):
+        tags = [f"general:products/{product}" for product in rng.sample(PRODUCTS, rng.randint(1, 4))]
+        tags += [f"marketing:marchitecture/{category}" for category in rng.sample(CATEGORIES, rng.randint(1, 3))]
+        values.append(",".join(tags))
+    return pd.Series([values[rng.randrange(distinct)] for _ in range(rows)])
+
+def per_row(services):
+    return services.apply(extract_product_names), services.apply(extract_category_names)
+
+def factorized(services):
+    tags = parse_tags(services)
+    return tags['product'], tags['category']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--distinct", type=int, default=20_000, help="distinct tag strings, use --rows for all unique")
+    args = parser.parse_args()
+
+    services = synthetic_services(args.rows, min(args.distinct, args.rows))
+    results = {}
+    for name, function in [("per row apply", per_row), ("parse_tags", factorized)]:
+        start = time.perf_counter()
+        results[name] = function(services)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<14} {elapsed:8.2f} s {args.rows / elapsed:14,.0f} rows/s")
+
+    expected, actual = results["per row apply"], results["parse_tags"]
+    assert expected[0].tolist() == actual[0].tolist() and expected[1].tolist() == actual[1].tolist()
+    print("outputs match")
+
+if __name__ == "__main__":
+    main()
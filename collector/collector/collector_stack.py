@@ -20,8 +20,16 @@ class CollectorStack(Stack):
         bucket_name = self.node.try_get_context("bucket_name")
         days_range = self.node.try_get_context("days_range")
         feed_url = self.node.try_get_context("feed_url")
+        feed_urls = self.node.try_get_context("feed_urls") or [feed_url]
+        feed_timeout = self.node.try_get_context("feed_timeout") or "10"
+        parse_mode = self.node.try_get_context("parse_mode") or "feedparser"
+        csv_engine = self.node.try_get_context("csv_engine") or "stdlib"
+        output_format = self.node.try_get_context("output_format") or "csv"
+        compression = self.node.try_get_context("compression") or "none"
         layer_version_arns = self.node.try_get_context("layer_version_arns")
         sns_topic_arn = self.node.try_get_context("sns_topic_arn")
+        # 'fixed' runs once a day, 'adaptive' runs every 5 minutes and polls each feed on its learned schedule
+        schedule_mode = self.node.try_get_context("schedule_mode") or "fixed"
 
         # create IAM role for lambda function
         lambda_role = iam.Role(self, "LambdaRole",
@@ -34,10 +42,24 @@ class CollectorStack(Stack):
         # provide lambda function with write access to S3 bucket
         lambda_role.add_to_policy(iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
-            actions=["s3:PutObject"],
+            actions=["s3:PutObject", "s3:AbortMultipartUpload"],
             resources=[f"arn:aws:s3:::{bucket_name}/*"]
         ))
 
+        # provide lambda function with read access to the collector state (feed validators)
+        lambda_role.add_to_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["s3:GetObject"],
+            resources=[f"arn:aws:s3:::{bucket_name}/state/*"]
+        ))
+
+        # list access makes a missing state object return 404 instead of 403
+        lambda_role.add_to_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["s3:ListBucket"],
+            resources=[f"arn:aws:s3:::{bucket_name}"]
+        ))
+
         # provide lambda function with access to SNS topic
         lambda_role.add_to_policy(iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
@@ -65,18 +87,29 @@ class CollectorStack(Stack):
             role=lambda_role,
             code=lambda_.Code.from_asset("lambda"),
             handler="lambda_function.lambda_handler",
-            timeout=Duration.seconds(15),
+            # feeds are fetched concurrently, so the timeout covers the slowest feed plus the upload
+            timeout=Duration.seconds(int(feed_timeout) + 20),
             layers=get_layers(layer_version_arns), 
             environment={
                 "BUCKET_NAME": bucket_name,
                 "DAYS_RANGE": days_range,
-                "FEED_URL": feed_url,
-                "SNS_TOPIC_ARN": sns_topic_arn
+                "FEED_URLS": ",".join(feed_urls),
+                "FEED_TIMEOUT": feed_timeout,
+                "PARSE_MODE": parse_mode,
+                "CSV_ENGINE": csv_engine,
+                "OUTPUT_FORMAT": output_format,
+                "COMPRESSION": compression,
+                "SNS_TOPIC_ARN": sns_topic_arn,
+                "SCHEDULE_MODE": schedule_mode
             }
         )
 
-        # event bridge rule to trigger lambda function every midnight
+        # event bridge rule to trigger lambda function every midnight, or every 5 minutes in adaptive mode
+        if schedule_mode == "adaptive":
+            schedule = Schedule.rate(Duration.minutes(5))
+        else:
+            schedule = Schedule.cron(minute="02", hour="00")
         Rule(self, "CollectorRule", 
-            schedule=Schedule.cron(minute="02", hour="00"),
+            schedule=schedule,
             targets=[targets.LambdaFunction(function)]
         )
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Backfill of the landing data from archived feed snapshots.
+
+Reads every feed XML snapshot under a local directory or an s3://bucket/prefix, parses the snapshots
+in a process pool and deduplicates the entries by id (the newest snapshot wins). Entries that are
+already in the seen index of the collector are skipped. The rest is written as one landing file
+per publish date, in the same ';' separated format as the collector Lambda (or as partitioned
+parquet with --output-format parquet), and added to the seen index.
+
+    python backfill.py --source ./snapshots --bucket my-bucket
+    python backfill.py --source s3://archive/feeds/ --bucket my-bucket --workers 16
+    python backfill.py --source ./snapshots --output-dir ./out     # local files, no AWS calls
+"""
+import argparse
+import io
+import logging
+import os
+import time
+from multiprocessing import Pool
+from xml.etree.ElementTree import ParseError
+from common_utilities.aws_clients import get_client, reset_clients
+from common_utilities.csv_encoding import iter_records_csv
+from common_utilities.date_helpers import current_date, string_to_date
+from common_utilities.date_parsing import DateParseException
+from common_utilities.feed_state import split_s3_uri
+from common_utilities.feed_stream import iter_feed_entries, FeedStreamException
+from common_utilities.parquet_output import partition_records
+from common_utilities.seen_index import SeenIndex, load_seen_index, save_seen_index
+from common_utilities.upload import upload_to_s3, upload_partitioned_parquet_to_s3
+
+SNAPSHOT_EXTENSIONS = ('.xml', '.rss', '.atom')
+# snapshots per pool task, large enough that results are deduplicated before they are sent back
+DEFAULT_CHUNK_SIZE = 64
+
+class BackfillException(Exception):
+    pass
+
+def list_snapshots(source) -> list:
+    """ This function lists the snapshot files under a local directory or an s3://bucket/prefix, sorted by name """
+    if source.startswith("s3://"):
+        bucket, prefix = split_s3_uri(source)
+        s3 = get_client('s3')
+        keys = []
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+            keys.extend(item['Key'] for item in page.get('Contents', []))
+        return [f"s3://{bucket}/{key}" for key in sorted(keys) if key.endswith(SNAPSHOT_EXTENSIONS)]
+
+    paths = []
+    for directory, _, files in os.walk(source):
+        paths.extend(os.path.join(directory, name) for name in files if name.endswith(SNAPSHOT_EXTENSIONS))
+    return sorted(paths)
+
+def read_snapshot(location) -> bytes:
+    if location.startswith("s3://"):
+        bucket, key = split_s3_uri(location)
+        return get_client('s3').get_object(Bucket=bucket, Key=key)['Body'].read()
+    with open(location, "rb") as f:
+        return f.read()
+
+def parse_snapshot(body) -> list:
+    """
+    This function returns the entries of a snapshot as landing records. RSS is parsed with the
+    streaming parser, anything else (Atom) with feedparser.
+    """
+    try:
+        return list(iter_feed_entries(io.BytesIO(body)))
+    except FeedStreamException:
+        pass
+    import feedparser
+    feed = feedparser.parse(body)
+    return [
+        {
+            'id': entry['id'],
+            'category': entry.get('tags', []),
+            'title': entry.get('title', ''),
+            'link': entry.get('link', ''),
+            'published': entry.get('published', entry.get('updated', '')),
+            'summary': entry.get('summary', ''),
+        }
+        for entry in feed['entries']
+    ]
+
+def parse_snapshots(locations) -> dict:
+    """
+    This function parses a chunk of snapshots in a worker process and returns {id: record}.
+    Later snapshots overwrite earlier ones, a snapshot that can not be read or parsed is logged and skipped.
+    """
+    records = {}
+    for location in locations:
+        try:
+            snapshot = parse_snapshot(read_snapshot(location))
+        except (OSError, ParseError, FeedStreamException, KeyError) as e:
+            logging.error(f"Skipping snapshot {location}: {e}")
+            continue
+        for record in snapshot:
+            try:
+                # landing files are partitioned by publish date, entries without a valid one are dropped
+                string_to_date(record['published'])
+            except (DateParseException, TypeError):
+                logging.error(f"Skipping entry {record['id']} of {location} with publish date {record['published']!r}")
+                continue
+            if record['id']:
+                records[record['id']] = record
+    return records
+
+def collect_entries(locations, workers=None, chunk_size=DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    This function parses snapshots in a process pool and merges the results in snapshot order,
+    so an entry found in several snapshots keeps the version of the newest one.
+    """
+    chunks = [locations[i:i + chunk_size] for i in range(0, len(locations), chunk_size)]
+    records = {}
+    # boto3 clients must not be shared with forked workers, every worker builds its own
+    with Pool(processes=workers, initializer=reset_clients) as pool:
+        for chunk_records in pool.imap(parse_snapshots, chunks):
+            records.update(chunk_records)
+    return records
+
+def write_local(output_dir, partitions, timestamp) -> list:
+    paths = []
+    for (year, month, day), records in sorted(partitions.items()):
+        path = os.path.join(output_dir, "landing", f"{timestamp}_backfill_{year}-{month}-{day}.csv")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(iter_records_csv(records))
+        paths.append(path)
+    return paths
+
+def write_s3(bucket, partitions, timestamp, output_format='csv', compression='none') -> list:
+    """
+    This function uploads one landing file per publish date. File names start with the upload timestamp
+    like the files of the collector, so incremental processing picks them up after its watermark.
+    """
+    if output_format == 'parquet':
+        records = [record for partition in partitions.values() for record in partition]
+        return upload_partitioned_parquet_to_s3(bucket, records, prefix="landing_parquet",
+                                                file_name=f"{timestamp}_backfill.snappy.parquet")
+    return [
+        upload_to_s3(bucket, records, object_name=f"landing/{timestamp}_backfill_{year}-{month}-{day}.csv",
+                     compression=compression)
+        for (year, month, day), records in sorted(partitions.items())
+    ]
+
+def backfill(source, bucket=None, output_dir=None, seen_index=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+             output_format='csv', compression='none') -> dict:
+    """ This function runs the backfill and returns a summary with counts and the written files """
+    if not bucket and not output_dir:
+        raise BackfillException("Either a bucket or an output directory is required")
+
+    start = time.perf_counter()
+    locations = list_snapshots(source)
+    records = collect_entries(locations, workers, chunk_size)
+    parsed = time.perf_counter() - start
+
+    index = load_seen_index(seen_index) if seen_index else SeenIndex()
+    new = [record for record, is_new in zip(records.values(), index.new_ids(records)) if is_new]
+    partitions = partition_records(new)
+
+    timestamp = current_date()
+    if output_dir:
+        files = write_local(output_dir, partitions, timestamp)
+    else:
+        files = write_s3(bucket, partitions, timestamp, output_format, compression)
+    # like the collector, the index only covers entries once they have been written
+    if seen_index:
+        index.add_many(record['id'] for record in new)
+        save_seen_index(seen_index, index)
+
+    return {
+        'snapshots': len(locations),
+        'entries': len(records),
+        'already_collected': len(records) - len(new),
+        'written': len(new),
+        'files': files,
+        'parse_seconds': parsed,
+        'total_seconds': time.perf_counter() - start,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True, help="directory or s3://bucket/prefix of feed snapshots")
+    parser.add_argument("--bucket", help="landing bucket")
+    parser.add_argument("--output-dir", help="write landing files to this directory instead of S3")
+    parser.add_argument("--seen-index", help="seen index location, s3://<bucket>/state/seen_ids.bin by default with --bucket")
+    parser.add_argument("--workers", type=int, help="worker processes, the number of CPUs by default")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--output-format", default="csv", choices=["csv", "parquet"])
+    parser.add_argument("--compression", default="none", choices=["none", "gzip", "zstd"])
+    args = parser.parse_args()
+
+    seen_index = args.seen_index
+    if seen_index is None and args.bucket and not args.output_dir:
+        seen_index = f"s3://{args.bucket}/state/seen_ids.bin"
+
+    summary = backfill(args.source, args.bucket, args.output_dir, seen_index, args.workers, args.chunk_size,
+                       args.output_format, args.compression)
+    print(f"Parsed {summary['snapshots']} snapshots with {summary['entries']} distinct entries "
+          f"in {summary['parse_seconds']:.1f}s")
+    print(f"Skipped {summary['already_collected']} entries already collected, wrote {summary['written']} "
+          f"to {len(summary['files'])} files in {summary['total_seconds']:.1f}s")
+
+if __name__ == "__main__":
+    main()
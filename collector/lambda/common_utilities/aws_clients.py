@@ -0,0 +1,96 @@
+"""
+Shared boto3 clients for the collector Lambda and the processor Glue job.
+
+Clients are created once per process from one session and cached, so warm Lambda invocations
+reuse their connections instead of building a client (and a new connection pool) on every call.
+Every client uses the same botocore Config: a bounded connection pool and adaptive retries,
+which back off on throttling. The latency of every API call, retries included, is recorded
+per service and operation through botocore event hooks.
+"""
+import threading
+import time
+import boto3
+from botocore.config import Config
+
+MAX_POOL_CONNECTIONS = 16
+MAX_ATTEMPTS = 5
+RETRY_MODE = 'adaptive'
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_latencies = {}
+
+def client_config(max_pool_connections=MAX_POOL_CONNECTIONS, max_attempts=MAX_ATTEMPTS, **kwargs) -> Config:
+    """ This function returns the botocore Config of the shared clients """
+    return Config(
+        max_pool_connections=max_pool_connections,
+        retries={'max_attempts': max_attempts, 'mode': RETRY_MODE},
+        **kwargs
+    )
+
+def _start_timer(model, context, **kwargs):
+    context['latency_name'] = f"{model.service_model.service_name}.{model.name}"
+    context['latency_start'] = time.perf_counter()
+
+def _record_latency(context, **kwargs):
+    start = context.pop('latency_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    name = context['latency_name']
+    with _lock:
+        stats = _latencies.setdefault(name, {'calls': 0, 'total': 0.0, 'max': 0.0})
+        stats['calls'] += 1
+        stats['total'] += elapsed
+        stats['max'] = max(stats['max'], elapsed)
+
+def _register_hooks(client):
+    events = getattr(getattr(client, 'meta', None), 'events', None)
+    if events is None:
+        return
+    # before-call and after-call wrap the whole API call, retries included.
+    # after-call-error is emitted instead of after-call when the request fails without a response
+    events.register('before-call', _start_timer)
+    events.register('after-call', _record_latency)
+    events.register('after-call-error', _record_latency)
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.Session()
+        return _session
+
+def get_client(service_name, region_name=None):
+    """
+    This function returns the shared client of a service (and region), it is created on first use
+    with client_config() and reused by every later call in the process.
+    """
+    key = (service_name, region_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    session = get_session()
+    with _lock:
+        if key not in _clients:
+            client = session.client(service_name, region_name=region_name, config=client_config())
+            _register_hooks(client)
+            _clients[key] = client
+        return _clients[key]
+
+def call_latencies() -> dict:
+    """ This function returns {'service.Operation': {'calls', 'total', 'max', 'mean'}} with times in seconds """
+    with _lock:
+        return {
+            name: dict(stats, mean=stats['total'] / stats['calls'])
+            for name, stats in sorted(_latencies.items())
+        }
+
+def reset_clients():
+    """ This function drops the cached session, clients and latencies, the next get_client builds new ones """
+    global _session
+    with _lock:
+        _session = None
+        _clients.clear()
+        _latencies.clear()
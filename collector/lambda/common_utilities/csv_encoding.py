@@ -0,0 +1,54 @@
+import csv
+import io
+from common_utilities.streaming_upload import iter_dataframe_csv, DEFAULT_CHUNK_ROWS
+
+# columns of a landing file, the Glue table in ProcessorStack reads them as id;services;title;link;date;description
+COLUMNS = ['id', 'category', 'title', 'link', 'published', 'summary']
+ENGINE_STDLIB = 'stdlib'
+ENGINE_PANDAS = 'pandas'
+
+class CsvEncodingException(Exception):
+    pass
+
+def records_to_csv(records, columns=COLUMNS) -> str:
+    """
+    This function encodes plain records as ';' separated csv with the standard library.
+    The output is the same as DataFrame.to_csv(index=False, sep=';'): pandas uses the csv
+    module with minimal quoting too, lists are written with str() and None as an empty field.
+    """
+    return "".join(iter_records_csv(records, columns))
+
+def iter_records_csv(records, columns=COLUMNS, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """ This function yields the csv of records_to_csv in chunks of chunk_rows rows, the header first """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', lineterminator='\n')
+    writer.writerow(columns)
+    for i, record in enumerate(records, 1):
+        writer.writerow([record.get(column) for column in columns])
+        if i % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def records_to_dataframe(records, columns=COLUMNS):
+    """ This function builds a DataFrame from plain records, pandas is only imported when this is called """
+    import pandas as pd
+    return pd.DataFrame.from_records(list(records), columns=columns)
+
+def encode_records(records, engine=ENGINE_STDLIB) -> str:
+    """ This function encodes records in the landing csv format with the given engine """
+    if engine == ENGINE_STDLIB:
+        return records_to_csv(records)
+    if engine == ENGINE_PANDAS:
+        return records_to_dataframe(records).to_csv(index=False, sep=';')
+    raise CsvEncodingException(f"Unknown csv engine {engine}")
+
+def iter_encoded_records(records, engine=ENGINE_STDLIB, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """ This function yields the landing csv of encode_records in chunks, for streaming uploads """
+    if engine == ENGINE_STDLIB:
+        return iter_records_csv(records, chunk_rows=chunk_rows)
+    if engine == ENGINE_PANDAS:
+        return iter_dataframe_csv(records_to_dataframe(records), chunk_rows=chunk_rows)
+    raise CsvEncodingException(f"Unknown csv engine {engine}")
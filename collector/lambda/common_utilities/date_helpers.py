@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from common_utilities.date_parsing import parse_rfc822
 
 def current_date():
     return datetime.now().replace(
@@ -7,13 +8,12 @@ def current_date():
 
 def generate_start_date(days_range) -> datetime:
     """ This function creates a datetime object in the past by subtracting number of days from now. """
-    result = (datetime.utcnow() - timedelta(days=days_range)).strftime("%a, %d %b %Y 00:00:05 GMT")
-    return string_to_date(result)
+    return (datetime.utcnow() - timedelta(days=days_range)).replace(hour=0, minute=0, second=5, microsecond=0)
 
 def string_to_date(string):
-    """ This function converts a string representation of date to the datetime object """
-    return datetime.strptime(string, "%a, %d %b %Y %H:%M:%S %Z")
+    """ This function converts a string representation of date (any RFC 822 variant) to the datetime object """
+    return parse_rfc822(string)
 
 def date_to_string(datetime_obj):
     """ This function converts datetime object to a string """
-    return datetime_obj.strftime("%a, %d %b %Y %H:%M:%S")
\ No newline at end of file
+    return datetime_obj.strftime("%a, %d %b %Y %H:%M:%S")
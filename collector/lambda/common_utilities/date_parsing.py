@@ -0,0 +1,109 @@
+"""
+RFC 822 / RFC 1123 date parsing shared by the collector Lambda and the processor Glue job.
+
+Single dates are parsed with a precompiled pattern and cached, parse_rfc822_series parses a pandas
+Series once per distinct value (pandas is only imported there).
+All functions return naive datetimes in UTC, the same convention as the rest of the collector.
+"""
+import re
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+
+CACHE_SIZE = 8192
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+
+# offsets of the zone names allowed by RFC 822, in hours
+ZONES = {
+    'gmt': 0, 'ut': 0, 'utc': 0, 'z': 0,
+    'est': -5, 'edt': -4, 'cst': -6, 'cdt': -5,
+    'mst': -7, 'mdt': -6, 'pst': -8, 'pdt': -7,
+}
+
+RFC822_PATTERN = re.compile(
+    r'^\s*(?:[A-Za-z]{3},?\s*)?'
+    r'(\d{1,2})\s+([A-Za-z]{3})[a-z]*\s+(\d{2,4})\s+'
+    r'(\d{1,2}):(\d{2})(?::(\d{2}))?'
+    r'\s*([+-]\d{2}:?\d{2}|[A-Za-z]{1,5})?\s*$'
+)
+
+class DateParseException(ValueError):
+    pass
+
+def _offset(zone) -> timedelta:
+    if not zone:
+        return timedelta(0)
+    if zone[0] in '+-':
+        digits = zone[1:].replace(':', '')
+        offset = timedelta(hours=int(digits[:2]), minutes=int(digits[2:]))
+        return -offset if zone[0] == '-' else offset
+    hours = ZONES.get(zone.lower())
+    if hours is None:
+        # RFC 822 says unknown military zones must be treated as UTC
+        return timedelta(0)
+    return timedelta(hours=hours)
+
+def _parse(value) -> datetime:
+    match = RFC822_PATTERN.match(value)
+    if match:
+        day, month, year, hour, minute, second, zone = match.groups()
+        month = MONTHS.get(month.lower())
+        if month is not None:
+            year = int(year)
+            if year < 100:
+                year += 2000 if year < 50 else 1900
+            result = datetime(year, month, int(day), int(hour), int(minute), int(second or 0))
+            return result - _offset(zone)
+
+    # slow path for anything the fast pattern does not cover, including ISO 8601 dates of Atom feeds
+    try:
+        result = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        try:
+            result = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        except ValueError:
+            raise DateParseException(f"Unable to parse date {value!r}")
+    if result.tzinfo is not None:
+        result = result.astimezone(timezone.utc).replace(tzinfo=None)
+    return result
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_rfc822(value) -> datetime:
+    """
+    This function converts an RFC 822/1123 date string (named zones like GMT or numeric offsets
+    like +0000) to a naive UTC datetime. Results are memoized: feeds repeat the same timestamps a lot.
+    """
+    return _parse(value)
+
+def parse_rfc822_many(values, errors='raise') -> list:
+    """
+    This function parses a sequence of date strings, every distinct value is parsed once.
+    With errors='coerce' values that can not be parsed become None.
+    """
+    parsed = {}
+    result = []
+    for value in values:
+        if value not in parsed:
+            try:
+                parsed[value] = parse_rfc822(value)
+            except (DateParseException, TypeError, AttributeError):
+                if errors != 'coerce':
+                    raise
+                parsed[value] = None
+        result.append(parsed[value])
+    return result
+
+def parse_rfc822_series(series):
+    """
+    This function parses a pandas Series of date strings into a datetime64 Series.
+    Only the distinct values are parsed, then mapped back onto the column. Missing or invalid
+    values become NaT.
+    """
+    import pandas as pd
+    uniques = series.dropna().unique()
+    mapping = dict(zip(uniques, parse_rfc822_many(uniques, errors='coerce')))
+    return pd.to_datetime(series.map(mapping))
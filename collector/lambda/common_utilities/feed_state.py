@@ -0,0 +1,66 @@
+import os
+import json
+import logging
+from common_utilities.aws_clients import get_client
+from botocore.exceptions import ClientError
+
+class FeedStateException(Exception):
+    pass
+
+def split_s3_uri(uri):
+    """ This function splits s3://bucket/key into bucket and key """
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+def read_state_object(location):
+    """
+    This function reads a state object from an s3://bucket/key uri or a local file path.
+    A missing object returns None.
+    """
+    if location.startswith("s3://"):
+        bucket, key = split_s3_uri(location)
+        s3 = get_client('s3')
+        try:
+            return s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            logging.error(e)
+            raise FeedStateException(e)
+
+    if not os.path.exists(location):
+        return None
+    with open(location, "rb") as f:
+        return f.read()
+
+def write_state_object(location, body) -> str:
+    """ This function writes a state object to an s3://bucket/key uri or a local file path """
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if location.startswith("s3://"):
+        bucket, key = split_s3_uri(location)
+        s3 = get_client('s3')
+        try:
+            s3.put_object(Bucket=bucket, Key=key, Body=body)
+        except ClientError as e:
+            logging.error(e)
+            raise FeedStateException(e)
+        return location
+
+    with open(location, "wb") as f:
+        f.write(body)
+    return location
+
+def load_feed_state(location) -> dict:
+    """
+    This function loads per feed state (HTTP validators and last seen entry) from a json document.
+    The location is either an s3://bucket/key uri or a local file path. A missing document is an empty state.
+    """
+    body = read_state_object(location)
+    if body is None:
+        return {}
+    return json.loads(body)
+
+def save_feed_state(location, state) -> str:
+    """ This function saves per feed state to an s3://bucket/key uri or a local file path """
+    return write_state_object(location, json.dumps(state, indent=2, sort_keys=True))
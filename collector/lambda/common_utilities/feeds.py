@@ -0,0 +1,129 @@
+import logging
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+from common_utilities.feed_stream import iter_feed_entries
+
+DEFAULT_FEED_TIMEOUT = 10
+DEFAULT_MAX_WORKERS = 8
+PARSE_MODE_FEEDPARSER = 'feedparser'
+PARSE_MODE_STREAM = 'stream'
+USER_AGENT = 'aws-rss-feed-collector'
+
+class FeedFetchException(Exception):
+    pass
+
+class _CountingReader:
+    """ Wraps a response and counts the bytes read from it """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+def parse_feed_urls(value) -> list:
+    """ This function splits a comma or newline separated list of feed urls and drops duplicates """
+    urls = []
+    for url in value.replace("\n", ",").split(","):
+        url = url.strip()
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+def fetch_feed(url, timeout=DEFAULT_FEED_TIMEOUT, etag=None, modified=None,
+               parse_mode=PARSE_MODE_FEEDPARSER, start_time=None) -> dict:
+    """
+    This function downloads a single feed with a socket timeout and parses it.
+    When etag or modified validators are given the request is conditional. If the server answers
+    304 Not Modified the body is neither downloaded nor parsed, and an empty feed with status 304
+    is returned, the same way feedparser.parse(url, etag=..., modified=...) reports it.
+    In the stream parse mode the body is parsed incrementally while it is downloaded, entries are
+    plain records and reading stops at the first entry that is not newer than start_time.
+    feedparser is only imported by the feedparser parse mode, results are read with item access
+    (feed['feed'], feed['entries']) which works for both a FeedParserDict and a plain dict.
+    The number of body bytes read is returned in feed['bytes'].
+    """
+    request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    if etag:
+        request.add_header('If-None-Match', etag)
+    if modified:
+        request.add_header('If-Modified-Since', modified)
+
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            raise
+        return {'status': 304, 'href': url, 'etag': etag, 'modified': modified, 'feed': {}, 'entries': [], 'bytes': 0}
+
+    with response:
+        body = _CountingReader(response)
+        if parse_mode == PARSE_MODE_STREAM:
+            channel = {}
+            entries = list(iter_feed_entries(body, start_time, channel))
+            feed = {'feed': {}, 'entries': entries}
+            if channel.get('lastBuildDate'):
+                feed['feed']['updated'] = channel['lastBuildDate']
+        else:
+            import feedparser
+            feed = feedparser.parse(body.read())
+            if feed.bozo and not feed.entries:
+                raise FeedFetchException(f"Unable to parse feed {url}: {feed.bozo_exception}")
+
+    feed['parse_mode'] = parse_mode
+    feed['status'] = response.status
+    feed['href'] = url
+    feed['etag'] = response.headers.get('ETag')
+    feed['modified'] = response.headers.get('Last-Modified')
+    feed['bytes'] = body.bytes_read
+    return feed
+
+def fetch_feeds(urls, timeout=DEFAULT_FEED_TIMEOUT, max_workers=DEFAULT_MAX_WORKERS, state=None,
+                parse_mode=PARSE_MODE_FEEDPARSER, start_times=None):
+    """
+    This function fetches feeds concurrently in a bounded thread pool.
+    Every feed is isolated: a failure or a timeout of one feed is recorded in the errors dict
+    and does not affect the others. The whole call takes about as long as the slowest feed,
+    and never much longer than the timeout.
+    The optional state maps a url to its stored validators ({'etag': ..., 'modified': ...})
+    which are sent as a conditional request. start_times maps a url to the date where the stream
+    parse mode stops reading.
+    Returns a tuple of two dicts: {url: feed} and {url: exception}, both in the order of urls.
+    """
+    feeds, errors = {}, {}
+    state = state or {}
+    start_times = start_times or {}
+    if not urls:
+        return feeds, errors
+
+    executor = ThreadPoolExecutor(max_workers=min(len(urls), max_workers))
+    futures = {
+        executor.submit(
+            fetch_feed, url, timeout, state.get(url, {}).get('etag'), state.get(url, {}).get('modified'),
+            parse_mode, start_times.get(url)
+        ): url
+        for url in urls
+    }
+    # urlopen timeout applies per socket operation, so also bound the total wall clock time
+    done, _ = wait(futures, timeout=timeout + 1)
+
+    # results are collected in the order of urls, not in the order the feeds completed
+    for future, url in futures.items():
+        if future not in done:
+            future.cancel()
+            logging.error(f"Timed out fetching feed {url}")
+            errors[url] = FeedFetchException(f"Timed out after {timeout}s fetching feed {url}")
+            continue
+        try:
+            feeds[url] = future.result()
+        except Exception as e:
+            logging.error(f"Failed to fetch feed {url}: {e}")
+            errors[url] = e
+
+    # do not wait for stuck workers, their results are discarded
+    executor.shutdown(wait=False)
+    return feeds, errors
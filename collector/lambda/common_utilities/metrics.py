@@ -0,0 +1,97 @@
+"""
+Stage timing in CloudWatch Embedded Metric Format, shared by the collector Lambda and the processor Glue job.
+
+Every stage is written as one EMF JSON line with the metrics Duration (milliseconds), Rows and
+Bytes and the dimensions Service and Stage. Lines go to stdout, where the Lambda log agent turns
+them into CloudWatch metrics, or to a local file (one JSON document per line) for tests and
+benchmarks.
+"""
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+NAMESPACE = 'RssFeedPipeline'
+DIMENSIONS = ['Service', 'Stage']
+UNITS = {
+    'Duration': 'Milliseconds', 'Rows': 'Count', 'Bytes': 'Bytes', 'Errors': 'Count', 'Duplicates': 'Count',
+    'PagesPerSecond': 'Count/Second', 'CacheHitRatio': 'Percent',
+}
+
+def emf_document(namespace, dimensions, metrics, timestamp=None) -> dict:
+    """
+    This function builds an EMF document. dimensions maps dimension names to values, metrics maps
+    metric names to values, units come from UNITS (None for any other metric).
+    """
+    document = {
+        '_aws': {
+            'Timestamp': int((timestamp or time.time()) * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': UNITS.get(name, 'None')} for name in metrics],
+            }],
+        },
+    }
+    document.update(dimensions)
+    document.update(metrics)
+    return document
+
+
+class MetricsLogger:
+    """
+    Emits one EMF document per stage of a service. With path set documents are appended to that
+    file instead of being printed.
+
+        metrics = MetricsLogger('collector')
+        with metrics.stage('fetch') as stage:
+            feeds = fetch_feeds(urls)
+            stage['rows'] = len(feeds)
+    """
+
+    def __init__(self, service, namespace=NAMESPACE, path=None):
+        self.service = service
+        self.namespace = namespace
+        self.path = path
+
+    def write(self, document):
+        line = json.dumps(document, separators=(',', ':'))
+        if self.path:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+        else:
+            print(line)
+            sys.stdout.flush()
+
+    def emit(self, stage, metrics):
+        """ This function emits the metrics of a stage, metrics with a None value are left out """
+        metrics = {name: value for name, value in metrics.items() if value is not None}
+        self.write(emf_document(self.namespace, {'Service': self.service, 'Stage': stage}, metrics))
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        This function times a block and emits its Duration, plus Rows and Bytes when they are set
+        in the yielded dict ('rows', 'bytes'). A block that raises is emitted with Errors = 1.
+        """
+        values = {'rows': rows, 'bytes': None}
+        start = time.perf_counter()
+        errors = 0
+        try:
+            yield values
+        except Exception:
+            errors = 1
+            raise
+        finally:
+            self.emit(name, {
+                'Duration': (time.perf_counter() - start) * 1000,
+                'Rows': values['rows'],
+                'Bytes': values['bytes'],
+                'Errors': errors,
+            })
+
+
+def read_metrics_file(path) -> list:
+    """ This function reads the EMF documents of a metrics file written by MetricsLogger """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -1,11 +1,11 @@
-import boto3
+from common_utilities.aws_clients import get_client
 from botocore.exceptions import ClientError
 
 class SNSException(Exception):
     pass
 
 def publish_sns_message(topic_arn, subject, message):
-    sns = boto3.client('sns')
+    sns = get_client('sns')
     try:
         sns.publish(TopicArn=topic_arn, Subject=subject, Message=message)
     except ClientError as e:
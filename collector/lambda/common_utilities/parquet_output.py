@@ -0,0 +1,46 @@
+import io
+from common_utilities.csv_encoding import COLUMNS
+from common_utilities.date_helpers import string_to_date
+
+# parquet columns are resolved by name, so they are written with the names of the Glue table
+TABLE_COLUMNS = {
+    'id': 'id',
+    'category': 'services',
+    'title': 'title',
+    'link': 'link',
+    'published': 'date',
+    'summary': 'description',
+}
+COMPRESSION = 'snappy'
+
+def partition_records(records) -> dict:
+    """ This function groups records by their publish date, keys are (year, month, day) zero padded strings """
+    partitions = {}
+    for record in records:
+        published = string_to_date(record['published'])
+        key = (f"{published.year:04d}", f"{published.month:02d}", f"{published.day:02d}")
+        partitions.setdefault(key, []).append(record)
+    return partitions
+
+def partition_path(prefix, key) -> str:
+    year, month, day = key
+    return f"{prefix}/year={year}/month={month}/day={day}"
+
+def records_to_parquet(records, compression=COMPRESSION) -> bytes:
+    """
+    This function encodes records as a compressed parquet file with string columns.
+    Values are converted the same way as in the csv landing file (tags are written with str()).
+    pyarrow is imported lazily, it ships with the AWSSDKPandas layer.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = {
+        TABLE_COLUMNS[column]: pa.array(
+            [None if record.get(column) is None else str(record[column]) for record in records], type=pa.string()
+        )
+        for column in COLUMNS
+    }
+    buffer = io.BytesIO()
+    pq.write_table(pa.table(columns), buffer, compression=compression)
+    return buffer.getvalue()
@@ -0,0 +1,148 @@
+"""
+Adaptive polling schedule of a feed.
+
+The collector Lambda is started at a fixed short rate (every MIN_INTERVAL), but a feed is only
+requested when its schedule is due. The schedule learns the update cadence of the feed from the
+publish times of its entries (and the channel update time): within the hours of the day in which
+the feed usually publishes, it is polled POLLS_PER_UPDATE times per typical gap between updates.
+Outside of them the interval grows by BACKOFF with every poll that finds nothing new, up to
+MAX_INTERVAL, but the feed is polled again when its next active hour starts. A poll that finds
+new entries resets the backoff. Failed polls are retried after MIN_INTERVAL, backing off by BACKOFF
+with every consecutive failure up to MAX_INTERVAL, so a feed that is gone is not requested (and
+reported) on every run.
+
+The schedule is a json serializable dict kept per feed in the collector state. This module is pure
+Python without I/O, so schedules can be simulated offline against recorded feed histories, see simulate().
+"""
+from datetime import datetime, timedelta
+
+MIN_INTERVAL = timedelta(minutes=5)
+MAX_INTERVAL = timedelta(hours=6)
+# polls per typical gap between updates
+POLLS_PER_UPDATE = 4
+BACKOFF = 1.5
+# updates closer to each other than this count as one, announcements are often published in bursts
+BURST = timedelta(minutes=10)
+HISTORY_SIZE = 100
+# an hour of the day is active when updates were published in it on this many days
+ACTIVE_DAYS = 2
+
+def _clamp(interval, low=MIN_INTERVAL, high=MAX_INTERVAL) -> timedelta:
+    return max(low, min(high, interval))
+
+def _times(values) -> list:
+    return [value if isinstance(value, datetime) else datetime.fromisoformat(value) for value in values]
+
+def estimate_interval(update_times):
+    """
+    This function returns the median gap between bursts of updates, None with fewer than two bursts.
+    Updates less than BURST apart are one burst.
+    """
+    bursts = []
+    for time in sorted(_times(update_times)):
+        if not bursts or time - bursts[-1] >= BURST:
+            bursts.append(time)
+    gaps = sorted(later - earlier for earlier, later in zip(bursts, bursts[1:]))
+    if not gaps:
+        return None
+    return gaps[len(gaps) // 2]
+
+def active_hours(update_times) -> set:
+    """ This function returns the hours of the day (UTC) in which updates were published on at least ACTIVE_DAYS different days """
+    days = {}
+    for time in _times(update_times):
+        days.setdefault(time.hour, set()).add(time.date())
+    return {hour for hour, dates in days.items() if len(dates) >= ACTIVE_DAYS}
+
+def poll_interval(schedule, now) -> timedelta:
+    """
+    This function returns the interval from now until the next poll of a schedule. Within the active
+    hours of the feed it polls POLLS_PER_UPDATE times per typical gap, outside of them the interval
+    grows with every idle poll, but never passes the start of the next active hour.
+    """
+    updates = schedule.get('updates', [])
+    typical = estimate_interval(updates)
+    base = _clamp(typical / POLLS_PER_UPDATE) if typical else MIN_INTERVAL
+    hours = active_hours(updates)
+    if now.hour in hours:
+        return base
+    # the exponent is bounded, MAX_INTERVAL is reached long before
+    interval = _clamp(base * BACKOFF ** min(schedule.get('idle_polls', 0), 64))
+    if hours:
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        next_active = min(hour + timedelta(hours=(active - now.hour) % 24 or 24) for active in hours)
+        interval = max(MIN_INTERVAL, min(interval, next_active - now))
+    return interval
+
+def is_due(schedule, now) -> bool:
+    """ This function tells whether a feed should be polled now, a feed without a schedule always is """
+    if not schedule or not schedule.get('next_poll'):
+        return True
+    return now >= datetime.fromisoformat(schedule['next_poll'])
+
+def observe(schedule, now, update_times=(), failed=False) -> dict:
+    """
+    This function returns the schedule after a poll at now. update_times are the publish times of the
+    new entries found by the poll (plus a new channel update time), none means the feed was idle.
+    A failed poll does not count as idle, it is retried after MIN_INTERVAL times BACKOFF per earlier
+    consecutive failure.
+    """
+    schedule = dict(schedule or {})
+    known = _times(schedule.get('updates', []))
+    latest = max(known) if known else None
+    new = sorted({time for time in _times(update_times) if latest is None or time > latest})
+    schedule['updates'] = [time.isoformat() for time in (known + new)[-HISTORY_SIZE:]]
+    schedule['last_poll'] = now.isoformat()
+    if failed:
+        failures = schedule.get('failed_polls', 0)
+        schedule['failed_polls'] = failures + 1
+        schedule['next_poll'] = (now + _clamp(MIN_INTERVAL * BACKOFF ** min(failures, 64))).isoformat()
+        return schedule
+    schedule['failed_polls'] = 0
+    schedule['idle_polls'] = 0 if new else schedule.get('idle_polls', 0) + 1
+    schedule['next_poll'] = (now + poll_interval(schedule, now)).isoformat()
+    return schedule
+
+def simulate(publish_times, start, end, tick=MIN_INTERVAL, fixed_interval=None, schedule=None) -> dict:
+    """
+    This function replays a feed history: the invocations run every tick from start to end, every
+    entry becomes visible at its publish time. Polls follow the adaptive schedule, or run every
+    fixed_interval when it is set. Entries published before start are the stored history the
+    schedule starts from. Returns the number of polls and the latency (publish to first poll that
+    sees it, in seconds) of the detected entries: mean, median, p95 and max.
+    """
+    publish_times = sorted(_times(publish_times))
+    seen = sum(1 for time in publish_times if time < start)
+    schedule = dict(schedule or {})
+    if seen and not schedule:
+        schedule = observe({}, start, publish_times[:seen])
+        schedule['next_poll'] = start.isoformat()
+    polls, latencies = 0, []
+    next_fixed = start
+    now = start
+    while now <= end:
+        due = now >= next_fixed if fixed_interval else is_due(schedule, now)
+        if due:
+            polls += 1
+            visible = seen
+            while visible < len(publish_times) and publish_times[visible] <= now:
+                visible += 1
+            found = publish_times[seen:visible]
+            latencies.extend((now - time).total_seconds() for time in found)
+            seen = visible
+            if fixed_interval:
+                next_fixed = now + fixed_interval
+            else:
+                schedule = observe(schedule, now, found)
+        now += tick
+
+    latencies.sort()
+    summary = {'polls': polls, 'detected': len(latencies), 'pending': len(publish_times) - seen}
+    if latencies:
+        summary.update({
+            'mean_latency': sum(latencies) / len(latencies),
+            'median_latency': latencies[len(latencies) // 2],
+            'p95_latency': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'max_latency': latencies[-1],
+        })
+    return summary
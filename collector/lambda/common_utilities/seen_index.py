@@ -0,0 +1,85 @@
+import bisect
+import hashlib
+import heapq
+from common_utilities.feed_state import read_state_object, write_state_object
+
+DIGEST_SIZE = 20
+
+class SeenIndexException(Exception):
+    pass
+
+def id_to_digest(entry_id) -> bytes:
+    """
+    This function converts an entry id to a 20 byte SHA-1 digest.
+    The AWS feeds already use a hex encoded SHA-1 as the id, any other id is hashed with SHA-1.
+    """
+    if len(entry_id) == DIGEST_SIZE * 2:
+        try:
+            return bytes.fromhex(entry_id)
+        except ValueError:
+            pass
+    return hashlib.sha1(entry_id.encode("utf-8")).digest()
+
+
+class _Records:
+    """ A read-only sequence view of fixed size records in a bytes object, used for bisect """
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data) // DIGEST_SIZE
+
+    def __getitem__(self, i):
+        return self.data[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]
+
+
+class SeenIndex:
+    """
+    A set of entry ids that were already written to landing.
+    Ids are kept as a sorted array of 20 byte digests in a single bytes object, so memory is
+    20 bytes per id and lookups are a binary search, even with years of history.
+    """
+
+    def __init__(self, data=b""):
+        if len(data) % DIGEST_SIZE:
+            raise SeenIndexException(f"Index size {len(data)} is not a multiple of {DIGEST_SIZE}")
+        self._data = bytes(data)
+
+    def __len__(self):
+        return len(self._data) // DIGEST_SIZE
+
+    def __contains__(self, entry_id):
+        return self._contains_digest(id_to_digest(entry_id))
+
+    def _contains_digest(self, digest):
+        records = _Records(self._data)
+        i = bisect.bisect_left(records, digest)
+        return i < len(records) and records[i] == digest
+
+    def new_ids(self, entry_ids) -> list:
+        """ This function returns a boolean mask, True for every id that is not in the index yet """
+        return [not self._contains_digest(id_to_digest(entry_id)) for entry_id in entry_ids]
+
+    def add_many(self, entry_ids):
+        """ This function adds ids to the index with a single merge of the sorted arrays """
+        digests = sorted({id_to_digest(entry_id) for entry_id in entry_ids})
+        digests = [digest for digest in digests if not self._contains_digest(digest)]
+        if not digests:
+            return
+        records = _Records(self._data)
+        existing = (records[i] for i in range(len(records)))
+        self._data = b"".join(heapq.merge(existing, digests))
+
+    def to_bytes(self) -> bytes:
+        return self._data
+
+
+def load_seen_index(location) -> SeenIndex:
+    """ This function loads the seen index from an s3://bucket/key uri or a local file path """
+    body = read_state_object(location)
+    return SeenIndex(body or b"")
+
+def save_seen_index(location, index) -> str:
+    """ This function saves the seen index to an s3://bucket/key uri or a local file path """
+    return write_state_object(location, index.to_bytes())
@@ -0,0 +1,157 @@
+"""
+Streaming, optionally compressed uploads to S3, shared by the collector Lambda and the processor Glue job.
+
+Text is encoded and compressed chunk by chunk and sent with S3 multipart upload, so at most one
+part (plus the chunk being written) is held in memory instead of the whole object.
+Objects smaller than one part are sent with a single put_object. zstandard is only imported for zstd.
+"""
+import logging
+import zlib
+
+# S3 rejects multipart parts smaller than 5 MiB, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_CHUNK_ROWS = 10000
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+# Athena picks the codec of a csv object from its extension
+EXTENSIONS = {COMPRESSION_NONE: '', COMPRESSION_GZIP: '.gz', COMPRESSION_ZSTD: '.zst'}
+
+class StreamingUploadException(Exception):
+    pass
+
+def compressed_key(key, compression=COMPRESSION_NONE) -> str:
+    """ This function appends the extension of the compression codec to an object key """
+    if compression not in EXTENSIONS:
+        raise StreamingUploadException(f"Unknown compression {compression}")
+    return key + EXTENSIONS[compression]
+
+class _Identity:
+
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+def _compressor(compression):
+    if compression in (None, COMPRESSION_NONE):
+        return _Identity()
+    if compression == COMPRESSION_GZIP:
+        # wbits 16 + 15 writes a gzip header and trailer
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if compression == COMPRESSION_ZSTD:
+        import zstandard
+        return zstandard.ZstdCompressor().compressobj()
+    raise StreamingUploadException(f"Unknown compression {compression}")
+
+
+class MultipartWriter:
+    """
+    A binary writer to an S3 object. Written data is compressed and buffered, every full part is
+    uploaded with upload_part and the multipart upload is only started once the first part is full.
+    close() completes the upload, abort() (or an exception inside a with block, or a failure of
+    close() itself) cancels it so no incomplete parts are left behind.
+    """
+
+    def __init__(self, s3, bucket, key, compression=COMPRESSION_NONE, part_size=DEFAULT_PART_SIZE, **put_args):
+        if part_size < MIN_PART_SIZE:
+            raise StreamingUploadException(f"Part size {part_size} is smaller than {MIN_PART_SIZE}")
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.put_args = put_args
+        self.compressor = _compressor(compression)
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.bytes_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.buffer += self.compressor.compress(data)
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+
+    def _upload_part(self, body):
+        if self.upload_id is None:
+            self.upload_id = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self.key, **self.put_args)['UploadId']
+        number = len(self.parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=body
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': number})
+        self.bytes_written += len(body)
+
+    def close(self) -> str:
+        """ This function flushes the compressor and completes the upload, returns the S3 URI """
+        self.buffer += self.compressor.flush()
+        if self.upload_id is None:
+            # small object, a single request
+            self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer), **self.put_args)
+            self.bytes_written += len(self.buffer)
+        else:
+            try:
+                if self.buffer:
+                    self._upload_part(bytes(self.buffer))
+                self.s3.complete_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': self.parts}
+                )
+            except Exception:
+                # the uploaded parts are billed until the upload is aborted
+                self.abort()
+                raise
+        self.buffer = bytearray()
+        return f"s3://{self.bucket}/{self.key}"
+
+    def abort(self):
+        if self.upload_id is not None:
+            try:
+                self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            except Exception as e:
+                logging.error(f"Failed to abort the multipart upload of {self.key}: {e}")
+        self.buffer = bytearray()
+
+
+def add_bytes(stats, size):
+    """ This function adds size to stats['bytes'] when a stats dict is given, see metrics.MetricsLogger.stage """
+    if stats is not None:
+        stats['bytes'] = (stats.get('bytes') or 0) + size
+
+def upload_chunks(s3, bucket, key, chunks, compression=COMPRESSION_NONE, part_size=DEFAULT_PART_SIZE,
+                  stats=None, **put_args) -> str:
+    """
+    This function uploads an iterable of text or bytes chunks as one S3 object, streaming through
+    MultipartWriter. Returns the S3 URI. The key is used as is, see compressed_key for the extension.
+    The uploaded (compressed) size is added to the optional stats dict.
+    """
+    with MultipartWriter(s3, bucket, key, compression, part_size, **put_args) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    add_bytes(stats, writer.bytes_written)
+    return f"s3://{bucket}/{key}"
+
+def iter_dataframe_csv(df, columns=None, sep=';', chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    This function yields a DataFrame as csv text in slices of chunk_rows rows, the header with the
+    first slice. The concatenated chunks are the same as df.to_csv(index=False, sep=sep, columns=columns).
+    """
+    if len(df) == 0:
+        yield df.to_csv(index=False, sep=sep, columns=columns)
+        return
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, sep=sep, columns=columns, header=start == 0)
@@ -1,20 +1,123 @@
+import hashlib
+import json
 import logging
-import boto3
+from datetime import datetime
 from botocore.exceptions import ClientError
-from common_utilities.date_helpers import current_date
+from common_utilities.aws_clients import get_client
+from common_utilities.csv_encoding import iter_encoded_records, ENGINE_STDLIB, COLUMNS
+from common_utilities.feed_state import read_state_object, write_state_object
+from common_utilities.streaming_upload import upload_chunks, compressed_key, add_bytes, COMPRESSION_NONE
+from common_utilities.parquet_output import partition_records, partition_path, records_to_parquet
+
+# object metadata key of the record digest, x-amz-meta-content-sha256
+DIGEST_METADATA = 'content-sha256'
+# digests kept in the upload manifest, the oldest are dropped first
+MAX_MANIFEST_ENTRIES = 1000
 
 class S3UploadException(Exception):
     pass
 
-def upload_to_s3(bucket_name, df, object_name) -> str:
-    """ This function publishes a dataframe to S3 bucket """
-    s3 = boto3.resource('s3')
+def records_digest(records, columns=COLUMNS) -> str:
+    """
+    This function returns the SHA-256 of a record set. Records are normalized first: sorted by id,
+    every value encoded like the csv writer does (str(), None as empty), so the digest does not depend
+    on the order of the records, the csv engine or the compression.
+    """
+    digest = hashlib.sha256()
+    rows = sorted(['' if record.get(column) is None else str(record.get(column)) for column in columns] for record in records)
+    for row in rows:
+        digest.update(json.dumps(row, ensure_ascii=False).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+def load_upload_manifest(location) -> dict:
+    """ This function loads the upload manifest, {digest: {'uris', 'uploaded'}}, an empty one when it does not exist yet """
+    body = read_state_object(location)
+    if body is None:
+        return {}
+    return json.loads(body)
+
+def save_upload_manifest(location, manifest) -> str:
+    # entries are in upload order, only the newest MAX_MANIFEST_ENTRIES are kept
+    entries = sorted(manifest.items(), key=lambda item: item[1]['uploaded'])[-MAX_MANIFEST_ENTRIES:]
+    return write_state_object(location, json.dumps(dict(entries), indent=2))
+
+def previous_upload(manifest_location, digest):
+    """ This function returns the S3 URIs of an earlier upload of the same records, None if there was none """
+    if not manifest_location:
+        return None
+    entry = load_upload_manifest(manifest_location).get(digest)
+    return entry['uris'] if entry else None
+
+def record_upload(manifest_location, digest, uris):
+    """ This function adds the S3 URIs of an upload to the manifest under the digest of its records """
+    if not manifest_location:
+        return
+    manifest = load_upload_manifest(manifest_location)
+    manifest[digest] = {'uris': uris, 'uploaded': datetime.utcnow().isoformat()}
+    save_upload_manifest(manifest_location, manifest)
+
+def upload_to_s3(bucket_name, records, object_name, engine=ENGINE_STDLIB, compression=COMPRESSION_NONE, stats=None,
+                 manifest=None) -> str:
+    """
+    This function publishes records to S3 bucket as a ';' separated csv file.
+    The csv is encoded and uploaded in chunks, gzip or zstd compression adds .gz or .zst to the object name.
+    The uploaded size is added to the optional stats dict.
+    With a manifest location (s3://bucket/key or a local path) the digest of the records is stored in the
+    object metadata and the manifest. Records already uploaded with the same digest are not written again,
+    the URI of the earlier object is returned and stats['skipped'] is set.
+    """
+    s3 = get_client('s3')
 
+    digest = records_digest(records) if manifest else None
+    previous = previous_upload(manifest, digest)
+    if previous:
+        print(f"Skipping the upload of {len(records)} records, they were uploaded before as {previous[0]}")
+        if stats is not None:
+            stats['skipped'] = True
+        return previous[0]
+
+    object_name = compressed_key(object_name, compression)
+    put_args = {'Metadata': {DIGEST_METADATA: digest}} if digest else {}
     try:
-        s3.Object(bucket_name, object_name).put(Body=df.to_csv(index=False, sep=';'))
+        upload_chunks(s3, bucket_name, object_name, iter_encoded_records(records, engine), compression, stats=stats,
+                      **put_args)
     except ClientError as e:
         logging.error(e)
         raise S3UploadException(e)
     
     s3_uri = f"s3://{bucket_name}/{object_name}"
-    return s3_uri
\ No newline at end of file
+    record_upload(manifest, digest, [s3_uri])
+    return s3_uri
+
+
+def upload_partitioned_parquet_to_s3(bucket_name, records, prefix, file_name, stats=None, manifest=None) -> list:
+    """
+    This function publishes records to S3 bucket as compressed parquet files partitioned by publish date,
+    one file per prefix/year=YYYY/month=MM/day=DD partition. Returns the list of S3 URIs.
+    A manifest location skips records that were uploaded before, like upload_to_s3.
+    """
+    s3 = get_client('s3')
+
+    digest = records_digest(records) if manifest else None
+    previous = previous_upload(manifest, digest)
+    if previous:
+        print(f"Skipping the upload of {len(records)} records, they were uploaded before as {previous}")
+        if stats is not None:
+            stats['skipped'] = True
+        return previous
+
+    put_args = {'Metadata': {DIGEST_METADATA: digest}} if digest else {}
+    s3_uris = []
+    for key, partition in sorted(partition_records(records).items()):
+        object_name = f"{partition_path(prefix, key)}/{file_name}"
+        try:
+            body = records_to_parquet(partition)
+            s3.put_object(Bucket=bucket_name, Key=object_name, Body=body, **put_args)
+            add_bytes(stats, len(body))
+        except ClientError as e:
+            logging.error(e)
+            raise S3UploadException(e)
+        s3_uris.append(f"s3://{bucket_name}/{object_name}")
+    record_upload(manifest, digest, s3_uris)
+    return s3_uris
@@ -1,74 +1,291 @@
 import os
-import sys
 import logging
 import json
-import pandas as pd
-import feedparser
+from datetime import datetime, timedelta
 from common_utilities.date_helpers import generate_start_date, string_to_date, date_to_string, current_date
-from common_utilities.upload import upload_to_s3
+from common_utilities.date_parsing import DateParseException
+from common_utilities.csv_encoding import ENGINE_STDLIB
+from common_utilities.feeds import (
+    parse_feed_urls, fetch_feeds, DEFAULT_FEED_TIMEOUT, DEFAULT_MAX_WORKERS, PARSE_MODE_FEEDPARSER, PARSE_MODE_STREAM
+)
+from common_utilities.feed_state import load_feed_state, save_feed_state
+from common_utilities.seen_index import load_seen_index, save_seen_index
+from common_utilities.streaming_upload import COMPRESSION_NONE
+from common_utilities.upload import upload_to_s3, upload_partitioned_parquet_to_s3
 from common_utilities.notifications import publish_sns_message
+from common_utilities.aws_clients import call_latencies
+from common_utilities.metrics import MetricsLogger
+from common_utilities.polling import is_due, observe
 
+# 'fixed' polls every feed on every run (a daily schedule), 'adaptive' runs every few minutes and only
+# polls the feeds whose schedule is due, collecting everything after the watermark of the feed
+SCHEDULE_FIXED = 'fixed'
+SCHEDULE_ADAPTIVE = 'adaptive'
 
-def check_new_entries_exist(feed, start_time):
-    feed_update_time = string_to_date(feed.feed['updated'])
-    check_if_feed_was_updated_recently(start_time, feed_update_time)
 
-def check_if_feed_was_updated_recently(start_time, update_time):
+def check_new_entries_exist(feed, start_time) -> bool:
+    if 'updated' not in feed['feed']:
+        # feeds without a channel level update time are always checked entry by entry
+        return True
+    feed_update_time = string_to_date(feed['feed']['updated'])
+    return check_if_feed_was_updated_recently(start_time, feed_update_time)
+
+def check_if_feed_was_updated_recently(start_time, update_time) -> bool:
     if update_time > start_time:
         print(f"New entries found! Feed was updated on {update_time}")
-    else:
-        print(f"No new entries since {date_to_string(start_time)}")
-        sys.exit(123)
-
-def convert_feedparser_to_dataframe(feed, start_time) -> pd.DataFrame:
-    df = pd.DataFrame()
-    df['id'] = [entry.id for entry in feed.entries]
-    df['category'] = [entry['tags'] for entry in feed['entries']]
-    df['title'] = [entry['title'] for entry in feed['entries']]
-    df['link'] = [entry['link'] for entry in feed['entries']]
-    df['published'] = [entry['published'] for entry in feed['entries']]
-    df['summary'] = [entry['summary'] for entry in feed['entries']]
+        return True
+    print(f"No new entries since {date_to_string(start_time)}")
+    return False
+
+def convert_feedparser_to_records(feed, start_time) -> list:
+    records = [
+        {
+            'id': entry['id'],
+            'category': entry['tags'],
+            'title': entry['title'],
+            'link': entry['link'],
+            'published': entry['published'],
+            'summary': entry['summary'],
+        }
+        for entry in feed['entries']
+    ]
 
     # filter out old entries
-    df = df[df['published'].apply(string_to_date) > start_time]
-    return df
+    return [record for record in records if string_to_date(record['published']) > start_time]
+
+def feed_start_time(days_range, last_seen=None, watermark=False) -> datetime:
+    """
+    This function returns the publish time after which entries are collected. A fixed schedule always
+    collects the last days_range days, so entries published late are still found; the seen index drops
+    the ones an earlier run has already collected. With watermark set the last seen entry is the only
+    bound once there is one, so runs that failed or were skipped do not leave a gap; days_range only
+    limits the first run. The bound is one second before the last seen entry, so entries published in
+    the same second are collected too.
+    """
+    if watermark and last_seen is not None:
+        return last_seen - timedelta(seconds=1)
+    return generate_start_date(days_range)
+
+def update_times(feed, feed_state, previous_state) -> list:
+    """
+    This function returns the publish times of the entries of a feed, plus the channel update time when it changed.
+    All entries are returned, so the first poll learns from the whole feed, the schedule only counts the new ones.
+    """
+    values = [entry.get('published') for entry in feed['entries']]
+    updated = feed_state.get('updated')
+    if updated and updated != previous_state.get('updated'):
+        values.append(updated)
+    times = []
+    for value in values:
+        try:
+            times.append(string_to_date(value))
+        except (DateParseException, TypeError) as e:
+            logging.error(f"Ignoring the update time {value!r}: {e}")
+    return times
+
+def update_schedules(state, new_state, urls, found, errors, now) -> dict:
+    """
+    This function records the poll of every polled feed in its adaptive schedule (see common_utilities.polling).
+    found maps a feed to the update times of the poll, see update_times.
+    """
+    for url in urls:
+        schedule = state.get(url, {}).get('schedule')
+        feed_state = dict(new_state.get(url, {}))
+        feed_state['schedule'] = observe(schedule, now, found.get(url, []), failed=url in errors)
+        new_state[url] = feed_state
+    return new_state
 
-def generate_table(feed, days_range) -> pd.DataFrame:   
-    start_time = generate_start_date(days_range)
-    
-    check_new_entries_exist(feed, start_time)
-    return convert_feedparser_to_dataframe(feed, start_time)
+def generate_table(feed, start_time) -> list:
+    if not check_new_entries_exist(feed, start_time):
+        return []
+    if feed.get('parse_mode') == PARSE_MODE_STREAM:
+        # records of the stream parser are already filtered by date
+        return feed['entries']
+    return convert_feedparser_to_records(feed, start_time)
 
+def merge_tables(tables) -> list:
+    """ This function merges per feed records into one list, an entry shared by several feeds is kept once """
+    records, ids = [], set()
+    for table in tables:
+        for record in table:
+            if record['id'] not in ids:
+                ids.add(record['id'])
+                records.append(record)
+    return records
 
-def get_feed_data(url) -> feedparser.FeedParserDict:
+def drop_seen_entries(records, index) -> list:
+    """ This function drops entries that were already written to landing by an earlier run """
+    mask = index.new_ids(record['id'] for record in records)
+    return [record for record, new in zip(records, mask) if new]
+
+def update_feed_state(feed_state, feed, records) -> dict:
+    """ This function returns the feed state with the validators of the response and the newest collected entry """
+    last_seen = feed_state.get('last_seen')
+    if records:
+        newest = max(string_to_date(record['published']) for record in records).isoformat()
+        last_seen = max(last_seen, newest) if last_seen else newest
+    return {
+        'etag': feed.get('etag'),
+        'modified': feed.get('modified'),
+        'updated': feed['feed'].get('updated', feed_state.get('updated')),
+        'last_seen': last_seen,
+    }
+
+
+def get_feed_data(url):
+    import feedparser
     feed = feedparser.parse(url)
     return feed
 
 
 def lambda_handler(event, context):
-    
-    FEED_URL = os.environ['FEED_URL']
+
+    # FEED_URLS takes a comma separated list of feeds, FEED_URL is kept for single feed deployments
+    FEED_URLS = parse_feed_urls(os.environ.get('FEED_URLS') or os.environ['FEED_URL'])
     BUCKET_NAME = os.environ['BUCKET_NAME']
     DAYS_RANGE = int(os.environ['DAYS_RANGE'])
     SNS_TOPIC_ARN = os.environ['SNS_TOPIC_ARN']
+    FEED_TIMEOUT = int(os.environ.get('FEED_TIMEOUT', DEFAULT_FEED_TIMEOUT))
+    MAX_WORKERS = int(os.environ.get('MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    # s3://bucket/key or a local file path, keeps ETag/Last-Modified and the last seen entry per feed
+    FEED_STATE = os.environ.get('FEED_STATE', f"s3://{BUCKET_NAME}/state/feed_state.json")
+    # sorted array of the SHA-1 ids of every entry written to landing so far
+    SEEN_INDEX = os.environ.get('SEEN_INDEX', f"s3://{BUCKET_NAME}/state/seen_ids.bin")
+    # 'stream' parses RSS incrementally and stops reading at the first old entry
+    PARSE_MODE = os.environ.get('PARSE_MODE', PARSE_MODE_FEEDPARSER)
+    # 'stdlib' writes the landing csv with the csv module, 'pandas' with DataFrame.to_csv
+    CSV_ENGINE = os.environ.get('CSV_ENGINE', ENGINE_STDLIB)
+    # 'parquet' writes snappy parquet partitioned by publish date under landing_parquet/ instead of a csv file
+    OUTPUT_FORMAT = os.environ.get('OUTPUT_FORMAT', 'csv')
+    # 'gzip' or 'zstd' compresses the landing csv file while it is uploaded
+    COMPRESSION = os.environ.get('COMPRESSION', COMPRESSION_NONE)
+    # digests of the uploaded record sets, records uploaded before are not written (nor processed) again. empty disables it
+    UPLOAD_MANIFEST = os.environ.get('UPLOAD_MANIFEST', f"s3://{BUCKET_NAME}/state/landing_manifest.json")
+    # stage metrics are printed as CloudWatch EMF, or appended to this file when it is set
+    METRICS_FILE = os.environ.get('METRICS_FILE')
+    SCHEDULE_MODE = os.environ.get('SCHEDULE_MODE', SCHEDULE_FIXED)
+    adaptive = SCHEDULE_MODE == SCHEDULE_ADAPTIVE
+
+    metrics = MetricsLogger('collector', path=METRICS_FILE)
 
     try:
-        feed = get_feed_data(FEED_URL)  
-        
-        df = generate_table(feed, DAYS_RANGE)
-        
-        s3_uri = upload_to_s3(BUCKET_NAME, df, object_name=f"landing/{current_date()}_feed.csv")
-        
-        publish_sns_message(
-            topic_arn=SNS_TOPIC_ARN, 
-            subject="RSS Feed Collector. New entries found!",
-            message=f"""There are {df.shape[0]} new entries. 
-            S3 URI: {s3_uri}"""
-        )
-        
+        with metrics.stage('load_state') as stage:
+            state = load_feed_state(FEED_STATE)
+            now = datetime.utcnow()
+            urls = FEED_URLS
+            if adaptive:
+                urls = [url for url in FEED_URLS if is_due(state.get(url, {}).get('schedule'), now)]
+            start_times = {}
+            for url in urls:
+                last_seen = state.get(url, {}).get('last_seen')
+                start_times[url] = feed_start_time(DAYS_RANGE, datetime.fromisoformat(last_seen) if last_seen else None,
+                                                   watermark=adaptive)
+            stage['rows'] = len(state)
+
+        if not urls:
+            print("No feed is due")
+            return {
+                'statusCode': 200,
+                'body': json.dumps('No feed is due')
+            }
+
+        with metrics.stage('fetch') as stage:
+            feeds, errors = fetch_feeds(
+                urls, timeout=FEED_TIMEOUT, max_workers=MAX_WORKERS, state=state,
+                parse_mode=PARSE_MODE, start_times=start_times
+            )
+            stage['rows'] = sum(len(feed['entries']) for feed in feeds.values())
+            stage['bytes'] = sum(feed.get('bytes', 0) for feed in feeds.values())
+        if not feeds:
+            if adaptive:
+                # the failed polls are recorded, so the feeds are retried with a backoff instead of on every run
+                with metrics.stage('save_state'):
+                    save_feed_state(FEED_STATE, update_schedules(state, dict(state), urls, {}, errors, now))
+            raise Exception(f"All {len(urls)} feeds failed: {errors}")
+
+        # date filtering and conversion to records
+        with metrics.stage('filter') as stage:
+            tables = []
+            found = {}
+            new_state = dict(state)
+            for url in urls:
+                if url not in feeds:
+                    continue
+                feed = feeds[url]
+                if feed['status'] == 304:
+                    print(f"Feed {url} was not modified since the last run")
+                    continue
+                print(f"Processing feed {url}")
+                try:
+                    table = generate_table(feed, start_times[url])
+                    new_state[url] = update_feed_state(state.get(url, {}), feed, table)
+                    tables.append(table)
+                    found[url] = update_times(feed, new_state[url], state.get(url, {}))
+                except Exception as e:
+                    logging.error(f"Failed to process feed {url}: {e}")
+                    errors[url] = e
+            records = merge_tables(tables)
+            stage['rows'] = len(records)
+            if adaptive:
+                new_state = update_schedules(state, new_state, urls, found, errors, now)
+
+        with metrics.stage('dedup') as stage:
+            index = load_seen_index(SEEN_INDEX)
+            collected = len(records)
+            records = drop_seen_entries(records, index)
+            print(f"Dropped {collected - len(records)} entries already collected by an earlier run")
+            stage['rows'] = len(records)
+            stage['bytes'] = len(index.to_bytes())
+
+        if not records:
+            # the validators of the feeds that answered are kept, whatever happened to the others
+            with metrics.stage('save_state'):
+                save_feed_state(FEED_STATE, new_state)
+            if errors:
+                raise Exception(f"No new entries and {len(errors)} feeds failed: {errors}")
+            return {
+                'statusCode': 200,
+                'body': json.dumps('No new entries')
+            }
+
+        # csv or parquet encoding and the S3 upload
+        with metrics.stage('upload', len(records)) as stage:
+            if OUTPUT_FORMAT == 'parquet':
+                s3_uris = upload_partitioned_parquet_to_s3(
+                    BUCKET_NAME, records, prefix="landing_parquet", file_name=f"{current_date()}_feed.snappy.parquet",
+                    stats=stage, manifest=UPLOAD_MANIFEST
+                )
+                s3_uri = "\n            ".join(s3_uris)
+            else:
+                s3_uri = upload_to_s3(BUCKET_NAME, records, object_name=f"landing/{current_date()}_feed.csv", engine=CSV_ENGINE,
+                                     compression=COMPRESSION, stats=stage, manifest=UPLOAD_MANIFEST)
+        skipped = stage.get('skipped', False)
+        # the index and the validators are only persisted once the entries they cover have been uploaded
+        with metrics.stage('save_state', len(records)) as stage:
+            index.add_many(record['id'] for record in records)
+            save_seen_index(SEEN_INDEX, index)
+            save_feed_state(FEED_STATE, new_state)
+            stage['bytes'] = len(index.to_bytes())
+
+        if skipped:
+            # an earlier run uploaded these records and failed before it saved the state, nothing new landed
+            return {
+                'statusCode': 200,
+                'body': json.dumps(f'Entries were already uploaded to {s3_uri}')
+            }
+
+        failed_feeds = "".join(f"\n            Failed feed {url}: {e}" for url, e in errors.items())
+        with metrics.stage('notify'):
+            publish_sns_message(
+                topic_arn=SNS_TOPIC_ARN,
+                subject="RSS Feed Collector. New entries found!",
+                message=f"""There are {len(records)} new entries from {len(feeds)} feeds.
+            S3 URI: {s3_uri}{failed_feeds}"""
+            )
+
         return {
             'statusCode': 200,
-            'body': json.dumps(f'Feed successfully uploaded to S3! New entries added {df.shape[0]}')
+            'body': json.dumps(f'Feed successfully uploaded to S3! New entries added {len(records)}')
         }
     except Exception as e:
         logging.error(e)
@@ -77,4 +294,7 @@ def lambda_handler(event, context):
             subject="RSS Feed Collector. Exception!",
             message=f"""Exception occured: {e}"""
         )
-        raise e
\ No newline at end of file
+        raise e
+    finally:
+        # clients are reused by warm invocations, so these cover every call since the cold start
+        print(f"AWS call latencies: {json.dumps(call_latencies())}")
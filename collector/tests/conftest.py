@@ -0,0 +1,74 @@
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# the Lambda code is deployed from the lambda directory, make its modules importable the same way
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda"))
+
+
+def rss_feed(days, build_date="Fri, 16 Sep 2022 10:00:00 GMT"):
+    """ An RSS 2.0 document with one entry per day of September 2022, in the given order """
+    items = "".join(
+        f"<item><guid>id{day}</guid><title>title {day}</title><link>https://example.com/{day}</link>"
+        f"<category>general:products/amazon-s3</category>"
+        f"<pubDate>Thu, {day:02d} Sep 2022 17:00:00 GMT</pubDate><description>text {day}</description></item>"
+        for day in days
+    )
+    return (
+        "<?xml version='1.0'?><rss version='2.0'><channel><title>feed</title>"
+        f"<lastBuildDate>{build_date}</lastBuildDate>{items}</channel></rss>"
+    ).encode()
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    # name: {'body': bytes, 'etag': str, 'modified': str, 'delay': seconds, 'status': int}
+    feeds = {}
+    requests = []
+
+    def do_GET(self):
+        name = self.path.rsplit('/', 1)[-1]
+        FeedHandler.requests.append((name, self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since')))
+        feed = FeedHandler.feeds.get(name)
+        if feed is None or feed.get('status', 200) != 200:
+            self.send_error(feed.get('status', 404) if feed else 404)
+            return
+        time.sleep(feed.get('delay', 0))
+        try:
+            self._respond(feed)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting for a slow feed
+            pass
+
+    def _respond(self, feed):
+        if feed.get('etag') and self.headers.get('If-None-Match') == feed['etag']:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/rss+xml')
+        self.send_header('Content-Length', str(len(feed['body'])))
+        if feed.get('etag'):
+            self.send_header('ETag', feed['etag'])
+        if feed.get('modified'):
+            self.send_header('Last-Modified', feed['modified'])
+        self.end_headers()
+        self.wfile.write(feed['body'])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def feed_server():
+    """ Serves FeedHandler.feeds under http://127.0.0.1:<port>/feeds/<name> """
+    FeedHandler.feeds = {}
+    FeedHandler.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/feeds"
+    httpd.shutdown()
@@ -0,0 +1,28 @@
+from botocore.awsrequest import AWSResponse
+
+from common_utilities import aws_clients
+
+
+class EmptyBody:
+
+    def stream(self, **kwargs):
+        yield b''
+
+
+def test_clients_are_shared_and_record_latencies(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    aws_clients.reset_clients()
+
+    s3 = aws_clients.get_client('s3', region_name='us-east-1')
+    assert aws_clients.get_client('s3', region_name='us-east-1') is s3
+    assert s3.meta.config.retries['mode'] == 'adaptive'
+    assert s3.meta.config.max_pool_connections == aws_clients.MAX_POOL_CONNECTIONS
+
+    # answer every request locally instead of sending it
+    s3.meta.events.register('before-send', lambda request, **kwargs: AWSResponse(request.url, 200, {}, EmptyBody()))
+    s3.put_object(Bucket='bucket', Key='a', Body=b'a')
+    s3.put_object(Bucket='bucket', Key='b', Body=b'b')
+
+    assert aws_clients.call_latencies()['s3.PutObject']['calls'] == 2
+    aws_clients.reset_clients()
@@ -0,0 +1,41 @@
+import os
+
+from backfill import backfill
+from common_utilities.seen_index import SeenIndex, save_seen_index
+
+
+def snapshot(items):
+    body = "".join(
+        f"<item><guid>{guid}</guid><title>{title}</title><link>https://aws.amazon.com/{guid}</link>"
+        f"<pubDate>{published}</pubDate><description>text</description>"
+        f"<category>general:products/amazon-s3</category></item>"
+        for guid, title, published in items
+    )
+    return f"<?xml version='1.0'?><rss version='2.0'><channel><title>feed</title>{body}</channel></rss>"
+
+
+def test_backfill_deduplicates_and_partitions_by_date(tmp_path):
+    source = tmp_path / "snapshots"
+    source.mkdir()
+    (source / "2022-09-15.xml").write_text(snapshot([
+        ("a", "old title", "Thu, 15 Sep 2022 10:00:00 GMT"),
+        ("b", "b", "Wed, 14 Sep 2022 10:00:00 GMT"),
+    ]))
+    (source / "2022-09-16.xml").write_text(snapshot([
+        ("c", "c", "Fri, 16 Sep 2022 10:00:00 GMT"),
+        ("a", "new title", "Thu, 15 Sep 2022 10:00:00 GMT"),
+    ]))
+    (source / "broken.xml").write_text("<rss><channel><item>")
+    seen_index = str(tmp_path / "seen_ids.bin")
+    index = SeenIndex()
+    index.add_many(["b"])
+    save_seen_index(seen_index, index)
+
+    summary = backfill(str(source), output_dir=str(tmp_path / "out"), seen_index=seen_index, workers=2, chunk_size=1)
+
+    assert (summary['snapshots'], summary['entries'], summary['already_collected'], summary['written']) == (3, 3, 1, 2)
+    names = sorted(os.path.basename(path).split("_backfill_")[1] for path in summary['files'])
+    assert names == ["2022-09-15.csv", "2022-09-16.csv"]
+    content = "".join(open(path).read() for path in summary['files'])
+    # the newest snapshot wins
+    assert "new title" in content and "old title" not in content
@@ -0,0 +1,18 @@
+from common_utilities.csv_encoding import records_to_csv
+
+
+def test_landing_csv_format():
+    records = [{
+        'id': 'abc',
+        'category': [{'term': 'general:products/amazon-s3', 'scheme': None, 'label': None}],
+        'title': 'S3; now faster',
+        'link': 'https://aws.amazon.com/',
+        'published': 'Thu, 15 Sep 2022 17:37:29 +0000',
+        'summary': '<a href="x">text</a>',
+    }]
+
+    assert records_to_csv(records) == (
+        "id;category;title;link;published;summary\n"
+        "abc;[{'term': 'general:products/amazon-s3', 'scheme': None, 'label': None}];\"S3; now faster\";"
+        "https://aws.amazon.com/;Thu, 15 Sep 2022 17:37:29 +0000;\"<a href=\"\"x\"\">text</a>\"\n"
+    )
@@ -0,0 +1,26 @@
+from datetime import datetime
+
+import pytest
+
+from common_utilities.date_parsing import DateParseException, parse_rfc822, parse_rfc822_many
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("Thu, 15 Sep 2022 17:37:29 GMT", datetime(2022, 9, 15, 17, 37, 29)),
+    ("Fri, 02 Sep 2022 17:54:29 +0000", datetime(2022, 9, 2, 17, 54, 29)),
+    ("Fri, 02 Sep 2022 17:54:29 -0700", datetime(2022, 9, 3, 0, 54, 29)),
+    ("Fri, 02 Sep 2022 17:54:29 +05:30", datetime(2022, 9, 2, 12, 24, 29)),
+    ("2 Sep 22 17:54 EST", datetime(2022, 9, 2, 22, 54)),
+    ("2022-09-02T17:54:29Z", datetime(2022, 9, 2, 17, 54, 29)),
+])
+def test_parse_rfc822_variants(value, expected):
+    assert parse_rfc822(value) == expected
+
+
+def test_parse_many_coerces_invalid_values():
+    values = ["Thu, 15 Sep 2022 17:37:29 GMT", "not a date", "Thu, 15 Sep 2022 17:37:29 GMT"]
+    assert parse_rfc822_many(values, errors='coerce') == [
+        datetime(2022, 9, 15, 17, 37, 29), None, datetime(2022, 9, 15, 17, 37, 29)
+    ]
+    with pytest.raises(DateParseException):
+        parse_rfc822_many(values)
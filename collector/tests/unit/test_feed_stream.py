@@ -0,0 +1,88 @@
+import io
+
+from common_utilities.date_helpers import string_to_date
+from common_utilities.feed_stream import iter_feed_entries
+
+
+def build_feed(days):
+    items = "".join(
+        f"<item><guid>id{day}</guid><title>title {day}</title><link>https://example.com/{day}</link>"
+        f"<category>general:products/amazon-s3,marketing:marchitecture/storage</category>"
+        f"<pubDate>Thu, {day:02d} Sep 2022 17:00:00 GMT</pubDate><description>&lt;p&gt;text</description></item>"
+        for day in days
+    )
+    return (
+        "<?xml version='1.0'?><rss version='2.0'><channel><title>feed</title>"
+        f"<lastBuildDate>Fri, 16 Sep 2022 10:00:00 GMT</lastBuildDate>{items}</channel></rss>"
+    ).encode()
+
+
+class CountingStream(io.BytesIO):
+    bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def test_records_have_feedparser_fields():
+    channel = {}
+    records = list(iter_feed_entries(io.BytesIO(build_feed([16, 15])), channel=channel))
+
+    assert [record['id'] for record in records] == ['id16', 'id15']
+    assert records[0]['category'] == [
+        {'term': 'general:products/amazon-s3,marketing:marchitecture/storage', 'scheme': None, 'label': None}
+    ]
+    assert records[0]['summary'] == '<p>text'
+    assert channel['lastBuildDate'] == 'Fri, 16 Sep 2022 10:00:00 GMT'
+
+
+def test_stops_reading_at_first_old_entry():
+    body = build_feed(range(16, 0, -1))
+    stream = CountingStream(body)
+    start_time = string_to_date("Wed, 14 Sep 2022 00:00:05 GMT")
+
+    records = list(iter_feed_entries(stream, start_time, chunk_size=256))
+
+    assert [record['id'] for record in records] == ['id16', 'id15', 'id14']
+    assert stream.bytes_read < len(body) / 2
+
+
+FIXTURE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>What's New</title>
+<lastBuildDate> Fri, 16 Sep 2022 10:00:00 GMT </lastBuildDate>
+<item>
+  <guid isPermaLink="false">
+    a1b2c3 </guid>
+  <title> Amazon S3 &amp; Amazon EFS add
+    a feature </title>
+  <link> https://aws.amazon.com/about-aws/whats-new/2022/09/s3-efs/ </link>
+  <category> general:products/amazon-s3,general:products/amazon-efs </category>
+  <pubDate> Fri, 16 Sep 2022 08:00:00 GMT </pubDate>
+  <description>  &lt;p&gt;Amazon S3 &lt;b&gt;now&lt;/b&gt; supports &lt;a href="https://aws.amazon.com/s3/"&gt;this&lt;/a&gt;.&lt;/p&gt; </description>
+</item>
+<item>
+  <guid>d4e5f6</guid>
+  <title>Amazon EC2 launches M7g</title>
+  <link>https://aws.amazon.com/about-aws/whats-new/2022/09/m7g/</link>
+  <category>general:products/amazon-ec2</category>
+  <category>marketing:marchitecture/compute</category>
+  <pubDate>Thu, 15 Sep 2022 17:00:00 GMT</pubDate>
+  <description><![CDATA[<p>M7g instances are powered by AWS Graviton3.</p>]]></description>
+</item>
+</channel></rss>"""
+
+
+def test_both_parse_modes_give_the_same_records():
+    import feedparser
+    from lambda_function import convert_feedparser_to_records
+    start_time = string_to_date("Wed, 14 Sep 2022 00:00:00 GMT")
+
+    expected = convert_feedparser_to_records(feedparser.parse(FIXTURE), start_time)
+    channel = {}
+    records = list(iter_feed_entries(io.BytesIO(FIXTURE), start_time, channel))
+
+    assert records == expected
+    assert records[0]['title'] == 'Amazon S3 & Amazon EFS add\n    a feature'
+    assert channel['lastBuildDate'] == 'Fri, 16 Sep 2022 10:00:00 GMT'
@@ -0,0 +1,62 @@
+import time
+
+from common_utilities.feeds import fetch_feeds, PARSE_MODE_STREAM
+from tests.conftest import FeedHandler, rss_feed
+
+
+def test_a_slow_feed_times_out_without_delaying_the_others(feed_server):
+    FeedHandler.feeds = {
+        'fast': {'body': rss_feed([16, 15])},
+        'slow': {'body': rss_feed([16]), 'delay': 3},
+    }
+    urls = [f"{feed_server}/fast", f"{feed_server}/slow"]
+
+    start = time.perf_counter()
+    feeds, errors = fetch_feeds(urls, timeout=0.5)
+
+    assert time.perf_counter() - start < 2
+    assert list(feeds) == urls[:1]
+    assert [entry['id'] for entry in feeds[urls[0]]['entries']] == ['id16', 'id15']
+    assert list(errors) == urls[1:]
+    assert 'timed out' in str(errors[urls[1]]).lower()
+
+
+def test_a_failing_feed_does_not_affect_the_others(feed_server):
+    FeedHandler.feeds = {
+        'one': {'body': rss_feed([16])},
+        'broken': {'body': b'<html>not a feed'},
+        'two': {'body': rss_feed([15])},
+    }
+    urls = [f"{feed_server}/{name}" for name in ('one', 'missing', 'broken', 'two')]
+
+    feeds, errors = fetch_feeds(urls, parse_mode=PARSE_MODE_STREAM)
+
+    assert list(feeds) == [urls[0], urls[3]]
+    assert list(errors) == urls[1:3]
+    assert feeds[urls[3]]['entries'][0]['id'] == 'id15'
+
+
+def test_results_follow_the_order_of_the_urls(feed_server):
+    # the first feeds answer last
+    FeedHandler.feeds = {f"f{n}": {'body': rss_feed([n + 1]), 'delay': 0.05 * (5 - n)} for n in range(5)}
+    urls = [f"{feed_server}/f{n}" for n in range(5)]
+
+    feeds, errors = fetch_feeds(urls, max_workers=5)
+
+    assert not errors
+    assert list(feeds) == urls
+    assert [feeds[url]['entries'][0]['id'] for url in urls] == [f"id{n + 1}" for n in range(5)]
+
+
+def test_not_modified_feeds_have_no_entries_and_keep_the_validators(feed_server):
+    FeedHandler.feeds = {'feed': {'body': rss_feed([16]), 'etag': '"v1"'}}
+    url = f"{feed_server}/feed"
+    state = {url: {'etag': '"v1"', 'modified': 'Fri, 16 Sep 2022 10:00:00 GMT'}}
+
+    feeds, errors = fetch_feeds([url], state=state)
+
+    assert not errors
+    assert feeds[url]['status'] == 304
+    assert feeds[url]['entries'] == []
+    assert (feeds[url]['etag'], feeds[url]['modified']) == ('"v1"', 'Fri, 16 Sep 2022 10:00:00 GMT')
+    assert FeedHandler.requests == [('feed', '"v1"', 'Fri, 16 Sep 2022 10:00:00 GMT')]
@@ -0,0 +1,119 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import lambda_function
+from tests.conftest import FeedHandler, rss_feed
+
+
+@pytest.fixture
+def handler_env(feed_server, tmp_path, monkeypatch):
+    """ Runs the handler against the local feed server with the state in local files, returns the sent SNS subjects """
+    messages = []
+    monkeypatch.setattr(lambda_function, 'publish_sns_message', lambda topic_arn, subject, message: messages.append(subject))
+    monkeypatch.setenv('BUCKET_NAME', 'bucket')
+    monkeypatch.setenv('DAYS_RANGE', '1')
+    monkeypatch.setenv('SNS_TOPIC_ARN', 'arn:aws:sns:us-east-1:123456789012:topic')
+    monkeypatch.setenv('FEED_STATE', str(tmp_path / "feed_state.json"))
+    monkeypatch.setenv('SEEN_INDEX', str(tmp_path / "seen_ids.bin"))
+    monkeypatch.setenv('UPLOAD_MANIFEST', '')
+    monkeypatch.setenv('METRICS_FILE', str(tmp_path / "metrics.jsonl"))
+    return messages
+
+
+def read_state(tmp_path):
+    return json.loads((tmp_path / "feed_state.json").read_text())
+
+
+def test_failed_feeds_do_not_discard_the_state_of_the_others(feed_server, handler_env, tmp_path, monkeypatch):
+    # every entry is older than DAYS_RANGE, the feed has nothing new
+    FeedHandler.feeds = {'old': {'body': rss_feed([15]), 'etag': '"v1"', 'modified': 'Fri, 16 Sep 2022 10:00:00 GMT'}}
+    urls = [f"{feed_server}/old", f"{feed_server}/missing"]
+    monkeypatch.setenv('FEED_URLS', ",".join(urls))
+
+    with pytest.raises(Exception, match="1 feeds failed"):
+        lambda_function.lambda_handler({}, None)
+
+    state = read_state(tmp_path)
+    assert state[urls[0]]['etag'] == '"v1"'
+    assert state[urls[0]]['modified'] == 'Fri, 16 Sep 2022 10:00:00 GMT'
+    assert urls[1] not in state
+    assert handler_env == ["RSS Feed Collector. Exception!"]
+
+
+def test_validators_are_sent_and_updated_across_runs(feed_server, handler_env, tmp_path, monkeypatch):
+    url = f"{feed_server}/feed"
+    monkeypatch.setenv('FEED_URLS', url)
+    FeedHandler.feeds = {'feed': {'body': rss_feed([15]), 'etag': '"v1"', 'modified': 'Thu, 15 Sep 2022 18:00:00 GMT'}}
+    lambda_function.lambda_handler({}, None)
+
+    FeedHandler.feeds['feed'] = {'body': rss_feed([16, 15]), 'etag': '"v2"', 'modified': 'Fri, 16 Sep 2022 18:00:00 GMT'}
+    lambda_function.lambda_handler({}, None)
+    assert FeedHandler.requests[-1] == ('feed', '"v1"', 'Thu, 15 Sep 2022 18:00:00 GMT')
+    state = read_state(tmp_path)[url]
+    assert (state['etag'], state['modified']) == ('"v2"', 'Fri, 16 Sep 2022 18:00:00 GMT')
+
+    # not modified: nothing is collected and the stored validators are kept
+    response = lambda_function.lambda_handler({}, None)
+    assert FeedHandler.requests[-1] == ('feed', '"v2"', 'Fri, 16 Sep 2022 18:00:00 GMT')
+    assert json.loads(response['body']) == 'No new entries'
+    assert read_state(tmp_path)[url] == state
+    assert handler_env == []
+
+
+@pytest.mark.parametrize('names', [('old', 'missing'), ('missing',)])
+def test_failed_feeds_are_not_polled_again_on_the_next_adaptive_run(feed_server, handler_env, tmp_path, monkeypatch,
+                                                                       names):
+    FeedHandler.feeds = {'old': {'body': rss_feed([15]), 'etag': '"v1"'}}
+    urls = [f"{feed_server}/{name}" for name in names]
+    monkeypatch.setenv('FEED_URLS', ",".join(urls))
+    monkeypatch.setenv('SCHEDULE_MODE', 'adaptive')
+
+    with pytest.raises(Exception, match="failed"):
+        lambda_function.lambda_handler({}, None)
+
+    state = read_state(tmp_path)
+    schedule = state[f"{feed_server}/missing"]['schedule']
+    assert schedule['failed_polls'] == 1
+    assert schedule['next_poll'] > schedule['last_poll']
+    if 'old' in names:
+        assert state[f"{feed_server}/old"]['etag'] == '"v1"'
+    # a run before the retry time has no feed to poll, and sends no other notification
+    requests = len(FeedHandler.requests)
+    response = lambda_function.lambda_handler({}, None)
+    assert json.loads(response['body']) == 'No feed is due'
+    assert len(FeedHandler.requests) == requests
+    assert handler_env == ["RSS Feed Collector. Exception!"]
+
+
+def item(guid, published):
+    return (f"<item><guid>{guid}</guid><title>{guid}</title><link>https://example.com/{guid}</link>"
+            f"<category>general:products/amazon-s3</category><pubDate>{published}</pubDate>"
+            f"<description>{guid}</description></item>")
+
+
+def feed_document(*items):
+    return ("<?xml version='1.0'?><rss version='2.0'><channel><title>feed</title>"
+            + "".join(items) + "</channel></rss>").encode()
+
+
+@pytest.mark.parametrize('schedule_mode', ['fixed', 'adaptive'])
+def test_late_and_same_second_entries_are_collected_once(feed_server, handler_env, monkeypatch, schedule_mode):
+    uploads = []
+    monkeypatch.setattr(lambda_function, 'upload_to_s3',
+                        lambda bucket, records, **kwargs: uploads.append([record['id'] for record in records]) or 's3://bucket/landing')
+    monkeypatch.setattr(lambda_function, 'is_due', lambda schedule, now: True)
+    monkeypatch.setenv('FEED_URLS', f"{feed_server}/feed")
+    monkeypatch.setenv('DAYS_RANGE', str((datetime.utcnow() - datetime(2022, 9, 1)).days))
+    monkeypatch.setenv('SCHEDULE_MODE', schedule_mode)
+
+    newest = "Fri, 16 Sep 2022 17:00:00 GMT"
+    FeedHandler.feeds = {'feed': {'body': feed_document(item('a', newest))}}
+    lambda_function.lambda_handler({}, None)
+    # the next run finds an entry of the same second and, in a fixed window, one published before the last run
+    late = [item('late', "Thu, 15 Sep 2022 17:00:00 GMT")] if schedule_mode == 'fixed' else []
+    FeedHandler.feeds['feed']['body'] = feed_document(item('b', newest), item('a', newest), *late)
+    lambda_function.lambda_handler({}, None)
+
+    assert uploads == [['a'], ['b'] + ['late'] * (schedule_mode == 'fixed')]
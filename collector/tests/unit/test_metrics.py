@@ -0,0 +1,21 @@
+import pytest
+
+from common_utilities.metrics import MetricsLogger, read_metrics_file
+
+
+def test_stage_writes_emf(tmp_path):
+    path = str(tmp_path / 'metrics.jsonl')
+    metrics = MetricsLogger('collector', path=path)
+
+    with metrics.stage('upload', rows=10) as stage:
+        stage['bytes'] = 512
+    with pytest.raises(ValueError):
+        with metrics.stage('notify'):
+            raise ValueError()
+
+    upload, notify = read_metrics_file(path)
+    assert upload['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['Service', 'Stage']]
+    assert [metric['Name'] for metric in upload['_aws']['CloudWatchMetrics'][0]['Metrics']] == ['Duration', 'Rows', 'Bytes', 'Errors']
+    assert (upload['Service'], upload['Stage'], upload['Rows'], upload['Bytes'], upload['Errors']) == ('collector', 'upload', 10, 512, 0)
+    # metrics that were not set are left out of the document
+    assert 'Rows' not in notify and notify['Errors'] == 1
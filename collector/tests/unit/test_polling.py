@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+from common_utilities.polling import (
+    MAX_INTERVAL, MIN_INTERVAL, estimate_interval, is_due, observe, poll_interval, simulate
+)
+
+START = datetime(2026, 3, 2)
+
+
+def daily_history(days, hours=(15, 18, 21)):
+    return [START + timedelta(days=day, hours=hour) for day in range(days) for hour in hours]
+
+
+def test_interval_is_the_median_gap_between_bursts():
+    burst = [START, START + timedelta(minutes=2), START + timedelta(minutes=4)]
+    times = burst + [START + timedelta(hours=3), START + timedelta(hours=6), START + timedelta(hours=20)]
+    assert estimate_interval(times) == timedelta(hours=3)
+    assert estimate_interval(burst) is None
+
+
+def test_a_feed_without_schedule_is_due():
+    assert is_due(None, START)
+    assert is_due({}, START)
+    schedule = observe({}, START)
+    next_poll = datetime.fromisoformat(schedule['next_poll'])
+    assert next_poll >= START + MIN_INTERVAL
+    assert not is_due(schedule, next_poll - timedelta(seconds=1))
+    assert is_due(schedule, next_poll)
+
+
+def test_active_hours_poll_at_a_fraction_of_the_typical_gap():
+    schedule = observe({}, START, daily_history(5))
+    # publishes every 3 hours within the day, polled 4 times per gap
+    assert poll_interval(schedule, START.replace(hour=16)) == timedelta(minutes=45)
+
+
+def test_idle_polls_back_off_until_the_next_active_hour():
+    schedule = observe({}, START + timedelta(days=4, hours=22), daily_history(5))
+    intervals = []
+    now = START + timedelta(days=4, hours=22)
+    for _ in range(10):
+        schedule = observe(schedule, now)
+        interval = datetime.fromisoformat(schedule['next_poll']) - now
+        intervals.append(interval)
+        now += interval
+    assert intervals[1] > intervals[0]
+    assert max(intervals) <= MAX_INTERVAL
+    # the night is skipped, but the first active hour of the next day is polled
+    assert START + timedelta(days=5, hours=15) in {START + timedelta(days=4, hours=22) + sum(intervals[:i], timedelta())
+                                                 for i in range(1, 11)}
+
+
+def test_new_entries_reset_the_backoff():
+    schedule = {'idle_polls': 7}
+    schedule = observe(schedule, START, [START - timedelta(minutes=1)])
+    assert schedule['idle_polls'] == 0
+    # entries that are already known are not new
+    schedule = observe(schedule, START + MIN_INTERVAL, [START - timedelta(minutes=1)])
+    assert schedule['idle_polls'] == 1
+    assert len(schedule['updates']) == 1
+
+
+def test_failed_polls_are_retried_soon_and_do_not_count_as_idle():
+    schedule = observe({'idle_polls': 3}, START, failed=True)
+    assert schedule['idle_polls'] == 3
+    assert schedule['next_poll'] == (START + MIN_INTERVAL).isoformat()
+
+
+def test_consecutive_failures_back_off_until_a_poll_succeeds():
+    schedule, now, intervals = {}, START, []
+    for _ in range(20):
+        schedule = observe(schedule, now, failed=True)
+        intervals.append(datetime.fromisoformat(schedule['next_poll']) - now)
+        now += intervals[-1]
+    assert intervals[1] > intervals[0] == MIN_INTERVAL
+    assert intervals[-1] == MAX_INTERVAL
+
+    schedule = observe(schedule, now)
+    assert schedule['failed_polls'] == 0
+    assert observe(schedule, now, failed=True)['next_poll'] == (now + MIN_INTERVAL).isoformat()
+
+
+def test_simulation_detects_every_entry_with_fewer_polls_than_a_fixed_rate():
+    history = daily_history(21)
+    start, end = START + timedelta(days=7), START + timedelta(days=21)
+    adaptive = simulate(history, start, end)
+    fixed = simulate(history, start, end, fixed_interval=MIN_INTERVAL)
+
+    assert adaptive['detected'] == fixed['detected'] == 14 * 3
+    assert adaptive['pending'] == 0
+    assert adaptive['polls'] < fixed['polls'] / 4
+    assert adaptive['p95_latency'] <= timedelta(minutes=45).total_seconds()
@@ -0,0 +1,30 @@
+import hashlib
+
+from common_utilities.seen_index import SeenIndex, id_to_digest
+
+
+def test_hex_sha1_ids_are_stored_as_raw_digests():
+    entry_id = hashlib.sha1(b"entry").hexdigest()
+    assert id_to_digest(entry_id) == hashlib.sha1(b"entry").digest()
+    assert len(id_to_digest("https://aws.amazon.com/blogs/aws/some-post/")) == 20
+
+
+def test_add_and_lookup():
+    ids = [hashlib.sha1(str(i).encode()).hexdigest() for i in range(1000)]
+    index = SeenIndex()
+    index.add_many(ids[:600])
+    index.add_many(ids[500:800])
+
+    assert len(index) == 800
+    assert len(index.to_bytes()) == 800 * 20
+    assert ids[0] in index and ids[799] in index
+    assert ids[800] not in index
+    assert index.new_ids(ids[795:805]) == [False] * 5 + [True] * 5
+
+
+def test_round_trip_through_bytes():
+    index = SeenIndex()
+    index.add_many(["b", "a", "c", "a"])
+    restored = SeenIndex(index.to_bytes())
+    assert len(restored) == 3
+    assert "a" in restored and "d" not in restored
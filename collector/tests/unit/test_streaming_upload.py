@@ -0,0 +1,79 @@
+import gzip
+
+import pytest
+
+from common_utilities.streaming_upload import MultipartWriter, MIN_PART_SIZE, compressed_key, upload_chunks
+
+
+class RecordingS3:
+
+    def __init__(self, fail_complete=False):
+        self.objects = {}
+        self.parts = []
+        self.aborted = False
+        self.fail_complete = fail_complete
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key):
+        return {'UploadId': 'upload'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.parts.append(Body)
+        return {'ETag': str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        if self.fail_complete:
+            raise ConnectionError("complete_multipart_upload failed")
+        self.objects[Key] = b''.join(self.parts)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted = True
+
+
+def test_small_object_is_a_single_put():
+    s3 = RecordingS3()
+    assert upload_chunks(s3, 'bucket', 'a.csv', ['a;b\n', '1;2\n']) == 's3://bucket/a.csv'
+    assert s3.objects['a.csv'] == b'a;b\n1;2\n'
+    assert s3.parts == []
+
+
+def test_large_object_is_uploaded_in_bounded_parts():
+    s3 = RecordingS3()
+    chunk = 'x' * (1024 * 1024) + '\n'
+    upload_chunks(s3, 'bucket', 'a.csv', (chunk for _ in range(12)), part_size=MIN_PART_SIZE)
+
+    assert [len(part) for part in s3.parts[:-1]] == [MIN_PART_SIZE, MIN_PART_SIZE]
+    assert s3.objects['a.csv'] == chunk.encode() * 12
+
+
+def test_gzip_round_trip():
+    s3 = RecordingS3()
+    key = compressed_key('a.csv', 'gzip')
+    upload_chunks(s3, 'bucket', key, ['a;b\n'] * 1000, compression='gzip')
+
+    assert key == 'a.csv.gz'
+    assert gzip.decompress(s3.objects[key]) == b'a;b\n' * 1000
+
+
+def test_failed_upload_is_aborted():
+    s3 = RecordingS3()
+    with pytest.raises(ValueError):
+        with MultipartWriter(s3, 'bucket', 'a.csv', part_size=MIN_PART_SIZE) as writer:
+            writer.write(b'x' * MIN_PART_SIZE)
+            raise ValueError()
+
+    assert s3.aborted
+    assert 'a.csv' not in s3.objects
+
+
+def test_failed_completion_is_aborted():
+    s3 = RecordingS3(fail_complete=True)
+    with pytest.raises(ConnectionError):
+        with MultipartWriter(s3, 'bucket', 'a.csv', part_size=MIN_PART_SIZE) as writer:
+            writer.write(b'x' * (MIN_PART_SIZE + 1))
+
+    assert len(s3.parts) == 2
+    assert s3.aborted
+    assert 'a.csv' not in s3.objects
@@ -0,0 +1,72 @@
+import io
+import json
+
+import pyarrow.parquet as pq
+
+import common_utilities.upload as upload
+from common_utilities.upload import records_digest, upload_partitioned_parquet_to_s3, upload_to_s3, DIGEST_METADATA
+
+
+class RecordingS3:
+
+    def __init__(self):
+        self.objects = {}
+        self.bodies = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = kwargs.get('Metadata')
+        self.bodies[Key] = Body
+
+
+def records(titles):
+    return [
+        {'id': str(i), 'category': ['general:products/amazon-s3'], 'title': title, 'link': f'https://aws.amazon.com/{i}',
+         'published': 'Thu, 15 Sep 2022 17:37:29 GMT', 'summary': None}
+        for i, title in enumerate(titles)
+    ]
+
+
+def test_digest_ignores_record_order():
+    assert records_digest(records(['a', 'b'])) == records_digest(list(reversed(records(['a', 'b']))))
+    assert records_digest(records(['a', 'b'])) != records_digest(records(['a', 'c']))
+
+
+def test_identical_records_are_uploaded_once(tmp_path, monkeypatch):
+    s3 = RecordingS3()
+    monkeypatch.setattr(upload, 'get_client', lambda service: s3)
+    manifest = str(tmp_path / "landing_manifest.json")
+
+    first = upload_to_s3('bucket', records(['a', 'b']), 'landing/1_feed.csv', manifest=manifest)
+    stats = {}
+    second = upload_to_s3('bucket', records(['a', 'b'])[::-1], 'landing/2_feed.csv', manifest=manifest, stats=stats)
+    third = upload_to_s3('bucket', records(['a', 'c']), 'landing/3_feed.csv', manifest=manifest)
+
+    assert second == first == 's3://bucket/landing/1_feed.csv'
+    assert stats == {'skipped': True}
+    assert third == 's3://bucket/landing/3_feed.csv'
+    assert list(s3.objects) == ['landing/1_feed.csv', 'landing/3_feed.csv']
+    assert s3.objects['landing/1_feed.csv'] == {DIGEST_METADATA: records_digest(records(['a', 'b']))}
+    assert len(json.loads(open(manifest).read())) == 2
+
+
+def test_parquet_files_are_written_to_publish_date_partitions(monkeypatch):
+    s3 = RecordingS3()
+    monkeypatch.setattr(upload, 'get_client', lambda service: s3)
+    rows = records(['a', 'b', 'c'])
+    rows[1]['published'] = 'Fri, 16 Sep 2022 01:00:00 GMT'
+    rows[2]['published'] = 'Sat, 01 Oct 2022 09:00:00 GMT'
+
+    uris = upload_partitioned_parquet_to_s3('bucket', rows, prefix='landing_parquet', file_name='1_feed.snappy.parquet')
+
+    keys = [
+        'landing_parquet/year=2022/month=09/day=15/1_feed.snappy.parquet',
+        'landing_parquet/year=2022/month=09/day=16/1_feed.snappy.parquet',
+        'landing_parquet/year=2022/month=10/day=01/1_feed.snappy.parquet',
+    ]
+    assert uris == [f"s3://bucket/{key}" for key in keys]
+    assert list(s3.objects) == keys
+    table = pq.read_table(io.BytesIO(s3.bodies[keys[0]]))
+    # the partition keys are in the object keys only, the columns have the names of the Glue table
+    assert table.column_names == ['id', 'services', 'title', 'link', 'date', 'description']
+    assert table.column('title').to_pylist() == ['a']
+    assert table.column('description').to_pylist() == [None]
@@ -0,0 +1,244 @@
+"""
+Concurrent download of the announcement pages linked by feed entries, for the articles stage of the Glue job.
+
+Pages are fetched with asyncio: requests run in a thread pool (urllib, like the feeds), at most
+max_concurrency at a time and at most rate_per_host requests per second to every host. The plain
+text of a page is stored in a SQLite cache, keyed by the SHA-256 of the page body, with the
+ETag/Last-Modified validators of every URL. A cached URL is not requested again, or only with a
+conditional request when revalidate is set, so every page is downloaded once across runs as long
+as the cache file is kept.
+"""
+import asyncio
+import hashlib
+import http.client
+import logging
+import re
+import sqlite3
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from html.parser import HTMLParser
+
+DEFAULT_RATE_PER_HOST = 5.0
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 10
+USER_AGENT = 'aws-rss-feed-collector'
+
+# elements whose text is not part of the article
+SKIPPED_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'nav', 'header', 'footer', 'aside', 'form'}
+# elements that hold the article on pages that have them
+CONTENT_TAGS = {'article', 'main'}
+BLOCK_TAGS = {'p', 'div', 'br', 'li', 'ul', 'ol', 'section', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'tr', 'table',
+              'article', 'main', 'blockquote', 'pre'}
+
+class _TextExtractor(HTMLParser):
+    """ Collects the text of a page, separately for the whole body and for article/main elements """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.skipped = 0
+        self.content = 0
+        self.text = []
+        self.content_text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipped += 1
+        elif tag in CONTENT_TAGS:
+            self.content += 1
+        if tag in BLOCK_TAGS:
+            self._append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipped = max(self.skipped - 1, 0)
+        elif tag in CONTENT_TAGS:
+            self.content = max(self.content - 1, 0)
+        if tag in BLOCK_TAGS:
+            self._append('\n')
+
+    def handle_data(self, data):
+        if not self.skipped:
+            # line breaks of the source are whitespace, only block elements separate lines
+            self._append(re.sub(r'\s+', ' ', data))
+
+    def _append(self, data):
+        self.text.append(data)
+        if self.content:
+            self.content_text.append(data)
+
+
+def extract_text(html) -> str:
+    """
+    This function returns the plain text of an HTML page: the text of its article or main elements
+    when it has any, otherwise of the whole page, without scripts, styles and navigation.
+    Whitespace is collapsed, paragraphs are separated by a newline.
+    """
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    text = ''.join(parser.content_text if ''.join(parser.content_text).strip() else parser.text)
+    lines = (re.sub(r' +', ' ', line).strip() for line in text.split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+class ArticleCache:
+    """
+    SQLite cache of page texts. 'urls' holds the validators and the content hash of every fetched URL,
+    'texts' the extracted text once per content hash, so pages with the same body share their text.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT NOT NULL, fetched TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS texts (content_hash TEXT PRIMARY KEY, text TEXT NOT NULL);
+        """)
+
+    def get(self, url):
+        """ This function returns the cached {'etag', 'last_modified', 'content_hash', 'text'} of a URL, None when it is not cached """
+        row = self.connection.execute(
+            "SELECT u.etag, u.last_modified, u.content_hash, t.text FROM urls u JOIN texts t USING (content_hash) WHERE u.url = ?",
+            (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['etag', 'last_modified', 'content_hash', 'text'], row))
+
+    def put(self, url, etag, last_modified, content_hash, text):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO texts VALUES (?, ?)", (content_hash, text))
+            self.connection.execute("INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?)",
+                                    (url, etag, last_modified, content_hash, datetime.utcnow().isoformat()))
+
+    def touch(self, url):
+        with self.connection:
+            self.connection.execute("UPDATE urls SET fetched = ? WHERE url = ?", (datetime.utcnow().isoformat(), url))
+
+    def close(self):
+        self.connection.close()
+
+
+class HostRateLimiter:
+    """ Spaces the requests to every host by at least 1 / rate_per_host seconds """
+
+    def __init__(self, rate_per_host=DEFAULT_RATE_PER_HOST):
+        self.interval = 1.0 / rate_per_host if rate_per_host else 0.0
+        self.locks = {}
+        self.next_start = {}
+
+    async def wait(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        lock = self.locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            start = max(now, self.next_start.get(host, now))
+            self.next_start[host] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+def fetch_page(url, timeout=DEFAULT_TIMEOUT, etag=None, modified=None) -> dict:
+    """
+    This function downloads a page, conditionally when validators are given.
+    Returns {'status', 'body', 'etag', 'last_modified'}, status 304 without a body.
+    A body in an unknown charset is decoded as utf-8.
+    """
+    request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    if etag:
+        request.add_header('If-None-Match', etag)
+    if modified:
+        request.add_header('If-Modified-Since', modified)
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            raise
+        return {'status': 304, 'body': None, 'etag': etag, 'last_modified': modified}
+    with response:
+        body = response.read()
+        charset = response.headers.get_content_charset() or 'utf-8'
+        try:
+            text = body.decode(charset, errors='replace')
+        except LookupError:
+            logging.error(f"Unknown charset {charset!r} of {url}, decoding it as utf-8")
+            text = body.decode('utf-8', errors='replace')
+        return {
+            'status': response.status,
+            'body': text,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+
+
+async def _fetch_article(url, cache, limiter, semaphore, executor, stats, timeout, revalidate):
+    cached = cache.get(url)
+    if cached is not None and not revalidate:
+        stats['hits'] += 1
+        return cached['text']
+
+    loop = asyncio.get_running_loop()
+    # the rate limit is waited for before taking a slot, so slow hosts do not hold the slots of others
+    await limiter.wait(url)
+    async with semaphore:
+        try:
+            page = await loop.run_in_executor(
+                executor, fetch_page, url, timeout,
+                cached['etag'] if cached else None, cached['last_modified'] if cached else None
+            )
+        except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError, LookupError) as e:
+            logging.error(f"Failed to fetch article {url}: {e}")
+            stats['errors'] += 1
+            # a cached text is still better than none, a failed URL is tried again by the next run
+            return cached['text'] if cached else ''
+    stats['requests'] += 1
+
+    if page['status'] == 304:
+        stats['hits'] += 1
+        cache.touch(url)
+        return cached['text']
+    stats['misses'] += 1
+    stats['bytes'] += len(page['body'])
+    content_hash = hashlib.sha256(page['body'].encode('utf-8')).hexdigest()
+    text = extract_text(page['body'])
+    cache.put(url, page['etag'], page['last_modified'], content_hash, text)
+    return text
+
+
+async def fetch_articles_async(urls, cache, rate_per_host=DEFAULT_RATE_PER_HOST, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                               timeout=DEFAULT_TIMEOUT, revalidate=False):
+    """ This function fetches the texts of distinct urls concurrently, see fetch_articles """
+    stats = {'urls': len(urls), 'hits': 0, 'misses': 0, 'requests': 0, 'errors': 0, 'bytes': 0}
+    limiter = HostRateLimiter(rate_per_host)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        texts = await asyncio.gather(*[
+            _fetch_article(url, cache, limiter, semaphore, executor, stats, timeout, revalidate) for url in urls
+        ])
+    return dict(zip(urls, texts)), stats
+
+
+def fetch_articles(urls, cache_path, rate_per_host=DEFAULT_RATE_PER_HOST, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                   timeout=DEFAULT_TIMEOUT, revalidate=False):
+    """
+    This function returns {url: plain text} for the distinct urls and a stats dict: urls, cache hits
+    and misses, requests, errors, downloaded bytes, seconds, pages_per_second (downloaded pages)
+    and hit_ratio. Cached URLs are not requested unless revalidate is set, then a 304 answer counts
+    as a hit. A URL that can not be fetched gets an empty text (or its cached one) and is not cached.
+    """
+    urls = list(dict.fromkeys(url for url in urls if url))
+    cache = ArticleCache(cache_path)
+    start = time.perf_counter()
+    try:
+        texts, stats = asyncio.run(fetch_articles_async(urls, cache, rate_per_host, max_concurrency, timeout, revalidate))
+    finally:
+        cache.close()
+    stats['seconds'] = time.perf_counter() - start
+    stats['pages_per_second'] = stats['misses'] / stats['seconds'] if stats['seconds'] else 0.0
+    stats['hit_ratio'] = stats['hits'] / len(urls) if urls else 0.0
+    return texts, stats
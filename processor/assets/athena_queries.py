@@ -0,0 +1,204 @@
+"""
+Athena queries of the landing table for the Glue job: the query of a date range, watermark or object
+list, its result file streamed in chunks, and wide reads split into date shards whose queries run
+concurrently.
+"""
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import pandas as pd
+
+from streaming_upload import add_bytes
+
+
+def partition_predicate(start_date, end_date) -> str:
+    """
+    This function builds a WHERE clause over the year/month/day partition keys for the days between
+    start_date and end_date (inclusive, 'YYYY-MM-DD'). Every key is compared with literals,
+    so Athena partition projection only reads the partitions of that range.
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    months = {}
+    day = start
+    while day <= end:
+        months.setdefault((f"{day.year:04d}", f"{day.month:02d}"), []).append(f"'{day.day:02d}'")
+        day += timedelta(days=1)
+    clauses = [
+        f"(year = '{year}' AND month = '{month}' AND day IN ({', '.join(days)}))"
+        for (year, month), days in months.items()
+    ]
+    return " OR ".join(clauses) or "false"
+
+def build_query(database, table, start_date=None, end_date=None, after_file=None, paths=None, file_range=None) -> str:
+    """
+    This function builds the Athena query for the landing table.
+    start_date/end_date restrict a table partitioned by publish date to these partitions.
+    after_file only selects rows of landing objects whose file name sorts after it: collector
+    file names start with the upload timestamp, so this reads only objects newer than a watermark.
+    paths (s3://bucket/key uris) only selects rows of these objects, see load_manifest.
+    file_range (first, end) only selects rows of objects whose file name sorts from first (inclusive)
+    to end (exclusive), either may be None, see landing_queries.
+    The file name of every row is returned in the 'source_file' column.
+    """
+    source_file = "regexp_extract(\"$path\", '[^/]+$')"
+    query = f"SELECT *, {source_file} AS source_file FROM {database}.{table}"
+    conditions = []
+    if start_date or end_date:
+        conditions.append(f"({partition_predicate(start_date or '2004-01-01', end_date or datetime.utcnow().strftime('%Y-%m-%d'))})")
+    if after_file:
+        conditions.append(f"{source_file} > '{after_file}'")
+    if file_range is not None:
+        first, end = file_range
+        if first:
+            conditions.append(f"{source_file} >= '{first}'")
+        if end:
+            conditions.append(f"{source_file} < '{end}'")
+    if paths is not None:
+        quoted = ", ".join("'" + path.replace("'", "''") + "'" for path in paths)
+        conditions.append(f"\"$path\" IN ({quoted})" if paths else "false")
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query
+
+# pandas dtypes of Athena result columns, anything else is read as a string
+ATHENA_DTYPES = {
+    'tinyint': 'Int64', 'smallint': 'Int64', 'integer': 'Int64', 'bigint': 'Int64',
+    'float': 'float64', 'real': 'float64', 'double': 'float64', 'decimal': 'float64',
+    'boolean': 'boolean',
+}
+
+def run_athena_query(athena, query, output_location, poll_interval=0.5) -> dict:
+    """ This function starts an Athena query, waits until it finishes and returns the query execution """
+    execution_id = athena.start_query_execution(
+        QueryString=query, ResultConfiguration={'OutputLocation': output_location}
+    )['QueryExecutionId']
+    while True:
+        execution = athena.get_query_execution(QueryExecutionId=execution_id)['QueryExecution']
+        state = execution['Status']['State']
+        if state == 'SUCCEEDED':
+            return execution
+        if state in ('FAILED', 'CANCELLED'):
+            raise Exception(f"Athena query {execution_id} {state}: {execution['Status'].get('StateChangeReason')}")
+        time.sleep(poll_interval)
+
+def query_result_file(athena, query, output_location):
+    """
+    This function runs an Athena query and returns the S3 URI of its result file with the pandas
+    dtypes of its columns. Column types come from the result set metadata (one single row
+    GetQueryResults call).
+    """
+    execution = run_athena_query(athena, query, output_location)
+    execution_id = execution['QueryExecutionId']
+    columns = athena.get_query_results(QueryExecutionId=execution_id, MaxResults=1)['ResultSet']['ResultSetMetadata']['ColumnInfo']
+    dtypes = {column['Name']: ATHENA_DTYPES.get(column['Type'], str) for column in columns}
+    return execution['ResultConfiguration']['OutputLocation'], dtypes
+
+def null_values(dtypes) -> dict:
+    """
+    This function returns the na_values of an Athena result file: text is read as it is, so 'NA', 'null'
+    or "" stay strings, and an empty field is only a null in the columns that are not strings.
+    pandas can not tell the empty unquoted field of a NULL from a quoted "", a NULL string reads as ''.
+    """
+    return {name: [''] for name, dtype in dtypes.items() if dtype is not str}
+
+def iter_query_results(s3, result_uri, dtypes, chunk_rows, columns=None, stats=None):
+    """
+    This function streams the result file of an Athena query as DataFrames of chunk_rows rows,
+    optionally only the given columns, see null_values for the NULL values. The size of the result file is added to the optional stats dict.
+    """
+    result_bucket, _, result_key = result_uri[len('s3://'):].partition('/')
+    response = s3.get_object(Bucket=result_bucket, Key=result_key)
+    add_bytes(stats, response.get('ContentLength', 0))
+    dtypes = {name: dtype for name, dtype in dtypes.items() if columns is None or name in columns}
+    yield from pd.read_csv(response['Body'], dtype=dtypes, usecols=columns, chunksize=chunk_rows,
+                           keep_default_na=False, na_values=null_values(dtypes))
+
+# --- sharded reads: a wide read is split into date shards whose Athena queries run concurrently
+
+# Athena queries of a sharded read that run at the same time
+DEFAULT_SHARD_CONCURRENCY = 4
+PARTITION_DATE = re.compile(r'year=(\d{4})/month=(\d{2})/day=(\d{2})/')
+
+def landing_date_range(keys, input_format='csv'):
+    """
+    This function returns the first and last date ('YYYY-MM-DD') of the landing object keys, None when there
+    are none: the publish date partitions of the parquet table, the upload date that starts the file
+    names of the csv table (see build_query).
+    """
+    dates = set()
+    for key in keys:
+        if input_format == 'parquet':
+            match = PARTITION_DATE.search(key)
+            if match:
+                dates.add('-'.join(match.groups()))
+        else:
+            name = key.rsplit('/', 1)[-1]
+            try:
+                dates.add(datetime.strptime(name[:10], '%Y-%m-%d').strftime('%Y-%m-%d'))
+            except ValueError:
+                continue
+    if not dates:
+        return None
+    return min(dates), max(dates)
+
+def date_shards(start_date, end_date, shards) -> list:
+    """
+    This function splits the days from start_date to end_date (inclusive, 'YYYY-MM-DD') into at most
+    shards contiguous (first, last) ranges with about the same number of days.
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    days = (datetime.strptime(end_date, '%Y-%m-%d') - start).days + 1
+    shards = max(1, min(shards, days))
+    return [
+        ((start + timedelta(days=days * i // shards)).strftime('%Y-%m-%d'),
+         (start + timedelta(days=days * (i + 1) // shards - 1)).strftime('%Y-%m-%d'))
+        for i in range(shards)
+    ]
+
+def landing_queries(database, table, start_date, end_date, shards, input_format='csv', after_file=None) -> list:
+    """
+    This function builds one landing query per date shard. Shards of the parquet table read their
+    publish date partitions. Shards of the csv table read the objects uploaded on their days,
+    by file name; the first and the last shard are open ended, so together they read every object.
+    """
+    ranges = date_shards(start_date, end_date, shards)
+    if input_format == 'parquet':
+        return [build_query(database, table, first, last, after_file) for first, last in ranges]
+    queries = []
+    for i, (first, last) in enumerate(ranges):
+        end = (datetime.strptime(last, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        file_range = (first if i > 0 else None, end if i < len(ranges) - 1 else None)
+        queries.append(build_query(database, table, after_file=after_file, file_range=file_range))
+    return queries
+
+def submit_queries(athena, queries, output_location, concurrency=DEFAULT_SHARD_CONCURRENCY):
+    """
+    This function starts the queries in a pool of concurrency threads, so at most that many run at a
+    time, and returns an iterator of (query index, result file uri, dtypes) in the order the queries
+    finish. A failed query raises when its result is reached.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    futures = {executor.submit(query_result_file, athena, query, output_location): i for i, query in enumerate(queries)}
+    # the submitted queries keep running, the pool goes away once they are done
+    executor.shutdown(wait=False)
+    return ((futures[future],) + future.result() for future in as_completed(futures))
+
+def sharded_landing_queries(database, table, start_date=None, end_date=None, after_file=None, shards=1,
+                            input_format='csv', list_keys=None):
+    """
+    This function returns the landing queries of a sharded read, None when the read should not be sharded.
+    Missing range ends come from the landing objects (see landing_date_range), whose keys are returned by
+    list_keys, only called then. The csv table starts at the upload date of the after_file watermark.
+    """
+    if shards <= 1:
+        return None
+    if not (start_date and end_date):
+        objects = landing_date_range(list_keys(), input_format)
+        if objects is None:
+            return None
+        start_date, end_date = start_date or objects[0], end_date or objects[1]
+    if after_file and input_format != 'parquet':
+        start_date = min(max(start_date, after_file[:10]), end_date)
+    return landing_queries(database, table, start_date, end_date, shards, input_format, after_file)
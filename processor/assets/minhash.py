@@ -0,0 +1,165 @@
+"""
+Near-duplicate clusters of announcements for the clusters stage of the Glue job.
+
+Entries are compared through the MinHash signatures of their word shingles, and only with the
+candidates that share an LSH band bucket with them, see MinHashIndex.
+"""
+import io
+import itertools
+import re
+import numpy as np
+import pandas as pd
+
+
+MINHASH_PERMUTATIONS = 64
+# bands of MINHASH_PERMUTATIONS / LSH_BANDS rows, entries that agree on all rows of a band are candidates
+LSH_BANDS = 16
+# candidates join a cluster when their signatures agree on at least this share of permutations
+CLUSTER_THRESHOLD = 0.6
+SHINGLE_WORDS = 3
+# shingle hashes are processed in blocks of this many, the permutation matrix of a block stays small
+MINHASH_BLOCK = 1 << 16
+MINHASH_SEED = 1
+WORD_PATTERN = re.compile(r'\w+')
+SHINGLE_MULTIPLIER = np.uint64(1000003)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+def shingle_hashes(texts, size=SHINGLE_WORDS):
+    """
+    This function returns the 64 bit hashes of the word shingles (size consecutive lowercase words) of
+    all texts, concatenated, and the number of shingles of every text. A text shorter than size is one
+    shingle. Every distinct word is hashed once, shingle hashes are combined from the word hashes with array operations.
+    """
+    words = [WORD_PATTERN.findall(text.lower()) if isinstance(text, str) else [] for text in texts]
+    lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+    counts = np.where(lengths >= size, lengths - size + 1, (lengths > 0).astype(np.int64))
+    if not counts.sum():
+        return np.zeros(0, dtype=np.uint64), counts
+    codes, uniques = pd.factorize(np.array(list(itertools.chain.from_iterable(words)), dtype=object))
+    word_hashes = pd.util.hash_array(np.asarray(uniques, dtype=object))[codes]
+    ends = np.cumsum(lengths)
+    shingle_starts = np.cumsum(counts) - counts
+    # position of the first word of every shingle, and the end of its text
+    first = np.repeat(ends - lengths - shingle_starts, counts) + np.arange(counts.sum())
+    text_end = np.repeat(ends, counts)
+    hashes = np.zeros(len(first), dtype=np.uint64)
+    for offset in range(size):
+        position = np.minimum(first + offset, len(word_hashes) - 1)
+        hashes = hashes * SHINGLE_MULTIPLIER + np.where(first + offset < text_end, word_hashes[position], np.uint64(0))
+    return hashes, counts
+
+def minhash_signatures(texts, permutations=MINHASH_PERMUTATIONS, seed=MINHASH_SEED) -> np.ndarray:
+    """
+    This function returns the MinHash signatures of texts as a (texts, permutations) uint32 array: for
+    every permutation, a multiply-shift hash (a * x + b mod 2^64) >> 32 of the shingle hashes x, the minimum
+    over the shingles of a text. A text without words has the maximum value everywhere.
+    """
+    rng = np.random.RandomState(seed)
+    a = rng.randint(0, 1 << 64, size=permutations, dtype=np.uint64) | np.uint64(1)
+    b = rng.randint(0, 1 << 64, size=permutations, dtype=np.uint64)
+    hashes, counts = shingle_hashes(texts)
+    signatures = np.full((len(texts), permutations), _MAX_HASH, dtype=np.uint64)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    first = 0
+    while first < len(texts):
+        # a block of whole texts with about MINHASH_BLOCK shingles
+        last = max(int(np.searchsorted(ends, starts[first] + MINHASH_BLOCK, side='right')), first + 1)
+        block = slice(starts[first], ends[last - 1])
+        if block.stop > block.start:
+            # permutations x shingles, so the minimum over the shingles of a text runs over contiguous memory
+            values = (a[:, None] * hashes[None, block] + b[:, None]) >> np.uint64(32)
+            present = np.flatnonzero(counts[first:last])
+            offsets = (starts[first:last] - starts[first])[present]
+            signatures[first + present] = np.minimum.reduceat(values, offsets, axis=1).T
+        first = last
+    return signatures.astype(np.uint32)
+
+def band_keys(signatures, bands=LSH_BANDS) -> np.ndarray:
+    """ This function hashes the rows of every band of the signatures into one uint64 key, a (signatures, bands) array """
+    rows = signatures.reshape(len(signatures), bands, signatures.shape[1] // bands).astype(np.uint64)
+    keys = np.zeros(rows.shape[:2], dtype=np.uint64)
+    for row in range(rows.shape[2]):
+        keys = keys * SHINGLE_MULTIPLIER + rows[:, :, row]
+    return keys
+
+class MinHashIndex:
+    """
+    The MinHash signatures and cluster ids of every entry seen so far, keyed by the 64 bit hash of the
+    entry id. assign() looks up known entries and matches new ones against the stored signatures
+    through the LSH band buckets, so a run only computes the signatures of its new entries.
+    Cluster ids never change once assigned: a new entry joins the cluster of its most similar
+    candidate, or starts a new one.
+    """
+
+    def __init__(self, keys=None, signatures=None, clusters=None, threshold=CLUSTER_THRESHOLD):
+        self.keys = np.zeros(0, dtype=np.uint64) if keys is None else keys
+        self.signatures = np.zeros((0, MINHASH_PERMUTATIONS), dtype=np.uint32) if signatures is None else signatures
+        self.clusters = np.zeros(0, dtype=np.int64) if clusters is None else clusters
+        self.threshold = threshold
+        self.changed = False
+        # band -> {band key: position of the first entry with that key}, entries without words are not bucketed
+        self.buckets = []
+        band = band_keys(self.signatures)
+        bucketed = np.flatnonzero((self.signatures != _MAX_HASH).any(axis=1))
+        for column in band.T:
+            values, first = np.unique(column[bucketed], return_index=True)
+            self.buckets.append(dict(zip(values.tolist(), bucketed[first].tolist())))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def assign(self, ids, texts) -> np.ndarray:
+        """ This function returns the cluster id of every entry, new entries are added to the index """
+        keys = pd.util.hash_array(np.asarray(ids, dtype=object))
+        positions = pd.Index(self.keys).get_indexer(keys)
+        new = np.flatnonzero(positions < 0)
+        # the same new id twice gets the cluster of its first occurrence
+        _, first_new = np.unique(keys[new], return_index=True)
+        new = new[np.sort(first_new)]
+        if len(new):
+            self._add(keys[new], minhash_signatures([texts[i] for i in new]))
+            positions = pd.Index(self.keys).get_indexer(keys)
+        return self.clusters[positions]
+
+    def _add(self, keys, signatures):
+        offset = len(self.keys)
+        all_signatures = np.concatenate([self.signatures, signatures])
+        clusters = np.empty(len(keys), dtype=np.int64)
+        next_cluster = int(self.clusters.max()) + 1 if len(self.clusters) else 0
+        band = band_keys(signatures)
+        for i, signature in enumerate(signatures):
+            position = offset + i
+            if (signature == _MAX_HASH).all():
+                clusters[i], next_cluster = next_cluster, next_cluster + 1
+                continue
+            candidates = {bucket.get(key) for bucket, key in zip(self.buckets, band[i].tolist())}
+            candidates.discard(None)
+            cluster = None
+            if candidates:
+                candidates = np.fromiter(candidates, dtype=np.int64)
+                similarity = (all_signatures[candidates] == signature).mean(axis=1)
+                best = int(np.argmax(similarity))
+                if similarity[best] >= self.threshold:
+                    match = candidates[best]
+                    cluster = self.clusters[match] if match < offset else clusters[match - offset]
+            if cluster is None:
+                cluster, next_cluster = next_cluster, next_cluster + 1
+            clusters[i] = cluster
+            for bucket, key in zip(self.buckets, band[i].tolist()):
+                bucket.setdefault(key, position)
+        self.keys = np.concatenate([self.keys, keys])
+        self.signatures = all_signatures
+        self.clusters = np.concatenate([self.clusters, clusters])
+        self.changed = True
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        # signatures are random numbers, compression would only cost time
+        np.savez(buffer, keys=self.keys, signatures=self.signatures, clusters=self.clusters)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, body, threshold=CLUSTER_THRESHOLD):
+        arrays = np.load(io.BytesIO(body))
+        return cls(arrays['keys'], arrays['signatures'], arrays['clusters'], threshold)
@@ -1,13 +1,62 @@
 from ast import arg
+import collections
+import functools
+import gzip
+import io
+import itertools
+import json
+import os
 import sys
 import re
 import logging
+import time
 from datetime import datetime
-import boto3
-import pyathena
+from multiprocessing import Pool
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 from botocore.exceptions import ClientError
-from awsglue.utils import getResolvedOptions
+
+# modules shared with the collector are shipped to Glue as extra python files,
+# outside of Glue they are imported from the collector Lambda package
+try:
+    from date_parsing import parse_rfc822_series
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'collector', 'lambda', 'common_utilities'))
+    from date_parsing import parse_rfc822_series
+from aws_clients import get_client, call_latencies
+from metrics import MetricsLogger
+from streaming_upload import MultipartWriter, upload_chunks, iter_dataframe_csv, compressed_key, add_bytes, COMPRESSION_NONE
+# modules of the processor next to the script, also shipped as extra python files
+from article_fetch import fetch_articles, DEFAULT_RATE_PER_HOST, DEFAULT_MAX_CONCURRENCY
+from minhash import MinHashIndex
+from athena_queries import build_query, query_result_file, iter_query_results, sharded_landing_queries, submit_queries, DEFAULT_SHARD_CONCURRENCY
+
+
+REPORT_COLUMNS = ['id','date', 'product', 'category', 'link', 'title', 'description']
+ENTRY_COLUMNS = ['id', 'date', 'link', 'title', 'description']
+# full text of the linked announcement page, only present when the articles stage runs
+ARTICLE_COLUMN = 'article'
+ARTICLE_CACHE_KEY = 'state/article_cache.sqlite'
+# near-duplicate cluster of every entry, see MinHashIndex
+CLUSTER_COLUMN = 'cluster_id'
+CLUSTER_INDEX_KEY = 'state/minhash_index.npz'
+NORMALIZED_PREFIX = 'processed/normalized/'
+WATERMARK_KEY = 'state/processor_watermark.json'
+DELTA_PREFIX = 'processed/delta/'
+CONSOLIDATED_REPORT_KEY = 'processed/report_consolidated.csv'
+AGGREGATES_KEY = 'processed/aggregates/announcements.parquet'
+AGGREGATE_COLUMNS = ['period_type', 'period_start', 'product', 'category', 'announcements']
+# parquet metadata of the aggregate table, the landing files counted by the last incremental run
+AGGREGATES_FILES_METADATA = b'source_files'
+# weeks start on monday
+AGGREGATE_PERIODS = {'week': 'W-SUN', 'month': 'M'}
+# rows per chunk of the processing pipeline
+DEFAULT_CHUNK_ROWS = 10000
+# columns of the landing csv files, as named by the landing Glue table
+LANDING_COLUMNS = ['id', 'services', 'title', 'link', 'date', 'description']
+# S3 prefixes of the landing tables, by input format
+LANDING_PREFIXES = {'csv': 'landing/', 'parquet': 'landing_parquet/'}
 
 
 def current_date():
@@ -15,6 +64,18 @@ def current_date():
         microsecond=0
     ).isoformat()
 
+def resolve_optional_args(argv, defaults) -> dict:
+    """
+    getResolvedOptions fails on arguments that are not passed to the job,
+    this function resolves only the optional arguments present in argv and falls back to the defaults.
+    """
+    from awsglue.utils import getResolvedOptions
+    args = dict(defaults)
+    present = [name for name in defaults if f'--{name}' in argv]
+    if present:
+        args.update(getResolvedOptions(argv, present))
+    return args
+
 def extract_product_names(string) -> str:
     """
     This function extracts a product name from a string.
@@ -35,11 +96,196 @@ def extract_category_names(string) -> str:
     return " ".join(categories)
 
 
-def read_file_from_s3(bucket, database, table):
-    """ use pyathena to query data from S3, and save results to a pandas dataframe"""
-    conn = pyathena.connect(s3_staging_dir=f's3://{bucket}/athena_output/', region_name='us-east-1') 
-    df = pd.read_sql(f"SELECT * FROM {database}.{table}", conn)
-    return df
+# precompiled forms of the patterns of extract_product_names and extract_category_names
+PRODUCT_PATTERN = re.compile(r'general:products/([^,]*)')
+CATEGORY_PATTERN = re.compile(r'marketing:[^/,]*/([^,]*)')
+
+def _take(values, codes):
+    """ This function maps factorized codes back to per row values, code -1 (missing) becomes an empty list """
+    array = np.empty(len(values) + 1, dtype=object)
+    array[:-1] = values
+    array[-1] = []
+    return array[codes]
+
+def parse_tags(services) -> pd.DataFrame:
+    """
+    This function parses the tag strings of the 'services' column into product and category arrays.
+    Every distinct tag string is parsed once with precompiled patterns and the results are
+    mapped back to the rows, instead of two uncompiled re.findall calls per row.
+    Returns a DataFrame aligned with the input index, with list columns 'products' and 'categories'
+    and their space separated forms 'product' and 'category' (what extract_product_names and
+    extract_category_names return).
+    """
+    codes, uniques = pd.factorize(services)
+    products = [PRODUCT_PATTERN.findall(value) for value in uniques]
+    categories = [CATEGORY_PATTERN.findall(value) for value in uniques]
+    product = np.array([" ".join(names) for names in products] + [""], dtype=object)
+    category = np.array([" ".join(names) for names in categories] + [""], dtype=object)
+    return pd.DataFrame({
+        'products': _take(products, codes),
+        'categories': _take(categories, codes),
+        'product': product[codes],
+        'category': category[codes],
+    }, index=services.index)
+
+def read_file_from_s3(bucket, database, table, start_date=None, end_date=None, after_file=None, paths=None):
+    """
+    use Athena to query data from S3 through a pyathena cursor, and save results to a pandas dataframe.
+    This is the --athena_fetch cursor read, the bulk read streams the result file, see athena_landing_source.
+    See build_query for the optional date range, watermark and object filters.
+    """
+    import pyathena
+    query = build_query(database, table, start_date, end_date, after_file, paths)
+    conn = pyathena.connect(s3_staging_dir=f's3://{bucket}/athena_output/', region_name='us-east-1')
+    df = pd.read_sql(query, conn)
+    # partition keys are not part of the report
+    return df.drop(columns=['year', 'month', 'day'], errors='ignore')
+
+def workflow_manifest(workflow_name, run_id):
+    """
+    This function returns the S3 URI of the batch manifest of a workflow run, None when the run was
+    started without one. The processor Lambda passes it as the 'manifest' run property.
+    """
+    if not workflow_name or not run_id:
+        return None
+    glue = get_client('glue')
+    properties = glue.get_workflow_run_properties(Name=workflow_name, RunId=run_id)['RunProperties']
+    return properties.get('manifest')
+
+def load_manifest(manifest_uri) -> list:
+    """ This function returns the s3://bucket/key uris of the landing objects listed in a batch manifest """
+    bucket, key = split_location(manifest_uri)
+    s3 = get_client('s3')
+    manifest = json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+    return [f"s3://{manifest['bucket']}/{key}" for key in manifest['keys']]
+
+def pending_manifests(manifest_uri) -> list:
+    """
+    This function returns the uris of the batch manifest of a run and of the manifests left next to it by
+    earlier runs that failed, oldest first. Manifest names start with their creation time, the manifests
+    of later batches sort after the one of the run and are left to their own runs.
+    """
+    bucket, key = split_location(manifest_uri)
+    prefix = key.rsplit('/', 1)[0] + '/'
+    return [f"s3://{bucket}/{name}" for name in list_object_keys(bucket, prefix) if name <= key]
+
+def delete_manifest(manifest_uri):
+    """ This function removes the batch manifest of a run once the run has processed its landing objects """
+    bucket, key = split_location(manifest_uri)
+    s3 = get_client('s3')
+    try:
+        s3.delete_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        logging.error(e)
+        raise e
+
+def load_watermark(bucket, key=WATERMARK_KEY) -> dict:
+    """ This function loads the incremental processing watermark, an empty dict before the first run """
+    return json.loads(read_bytes(f"s3://{bucket}/{key}", default=b'{}'))
+
+def save_watermark(bucket, watermark, key=WATERMARK_KEY):
+    s3 = get_client('s3')
+    try:
+        s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(watermark, indent=2))
+    except ClientError as e:
+        logging.error(e)
+        raise e
+
+def list_object_keys(bucket, prefix, s3=None) -> list:
+    s3 = s3 or get_client('s3')
+    keys = []
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(item['Key'] for item in page.get('Contents', []))
+    return sorted(keys)
+
+# pandas codecs of the extensions added by compressed_key
+READ_COMPRESSION = {'.gz': 'gzip', '.zst': 'zstd'}
+
+def read_report_from_s3(bucket, key) -> pd.DataFrame:
+    s3 = get_client('s3')
+    body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    compression = READ_COMPRESSION.get(os.path.splitext(key)[1])
+    return pd.read_csv(body, sep=';', dtype=str, keep_default_na=False, compression=compression)
+
+def compact_reports(bucket, delta_prefix=DELTA_PREFIX, consolidated_key=CONSOLIDATED_REPORT_KEY,
+                    compression=COMPRESSION_NONE) -> str:
+    """
+    This function merges the delta reports of incremental runs into the consolidated report
+    and deletes the merged deltas. Rows repeated across deltas are written once.
+    Deltas and earlier consolidated reports are read whatever their compression, so the
+    compression can change between runs.
+    """
+    s3 = get_client('s3')
+    delta_keys = list_object_keys(bucket, delta_prefix)
+    reports = [read_report_from_s3(bucket, key) for key in list_object_keys(bucket, consolidated_key)]
+    reports += [read_report_from_s3(bucket, key) for key in delta_keys]
+    df = pd.concat(reports, ignore_index=True).drop_duplicates(subset=REPORT_COLUMNS, keep='last')
+
+    s3_uri = save_df_to_s3(bucket, df, consolidated_key, REPORT_COLUMNS + optional_columns(df), compression=compression)
+    # deltas are removed only after the consolidated report has been written
+    for i in range(0, len(delta_keys), 1000):
+        s3.delete_objects(
+            Bucket=bucket, Delete={'Objects': [{'Key': key} for key in delta_keys[i:i + 1000]], 'Quiet': True}
+        )
+    return s3_uri
+
+def latest_positions(keys, ranks) -> np.ndarray:
+    """
+    This function returns the sorted positions of the row with the highest rank of every key,
+    the last of them on ties. keys are hashes, rows are grouped in a hash table without sorting them.
+    """
+    if ranks is None:
+        return np.flatnonzero(~pd.Series(keys).duplicated(keep='last').to_numpy())
+    # idxmax keeps the first maximum, reversed rows make it the last one
+    reversed_positions = pd.Series(ranks[::-1]).groupby(keys[::-1], sort=False).idxmax().to_numpy()
+    return np.sort(len(keys) - 1 - reversed_positions)
+
+def optional_columns(df) -> list:
+    """ This function returns the optional report columns present in a dataframe """
+    return [column for column in [ARTICLE_COLUMN, CLUSTER_COLUMN] if column in df.columns]
+
+def add_articles(df, cache_path, rate_per_host=DEFAULT_RATE_PER_HOST, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 stats=None):
+    """
+    This function adds the plain text of the page linked by every entry as the 'article' column, see
+    article_fetch.fetch_articles. The fetch statistics are added up in the optional stats dict.
+    """
+    texts, fetched = fetch_articles(df['link'].dropna().unique(), cache_path, rate_per_host, max_concurrency)
+    if stats is not None:
+        for name in ['urls', 'hits', 'misses', 'requests', 'errors', 'bytes', 'seconds']:
+            stats[name] = stats.get(name, 0) + fetched[name]
+    return df.assign(**{ARTICLE_COLUMN: df['link'].map(texts).fillna('')})
+
+def download_article_cache(bucket, path, key=ARTICLE_CACHE_KEY):
+    """ This function copies the article cache from S3 to a local file, a missing cache leaves no file """
+    body = read_bytes(f"s3://{bucket}/{key}")
+    if body is not None:
+        write_bytes(path, body)
+
+def upload_article_cache(bucket, path, key=ARTICLE_CACHE_KEY):
+    with open(path, 'rb') as f:
+        write_bytes(f"s3://{bucket}/{key}", f.read())
+
+def add_clusters(df, index) -> pd.DataFrame:
+    """
+    This function adds the near-duplicate cluster of every entry as the 'cluster_id' column, from the
+    title and description (see MinHashIndex). Entries of a cluster are the same announcement with small
+    differences, like a launch repeated for every region.
+    """
+    entries = df.drop_duplicates(subset='id')
+    texts = (entries['title'].fillna('') + ' ' + entries['description'].fillna('')).tolist()
+    clusters = pd.Series(index.assign(entries['id'].to_numpy(), texts), index=entries['id'].to_numpy())
+    return df.assign(**{CLUSTER_COLUMN: df['id'].map(clusters).astype('int64')})
+
+def load_cluster_index(location) -> MinHashIndex:
+    """ This function loads the cluster index from an s3:// uri or a local path, an empty index when there is none """
+    body = read_bytes(location)
+    return MinHashIndex() if body is None else MinHashIndex.from_bytes(body)
+
+def save_cluster_index(location, index, stats=None):
+    body = index.to_bytes()
+    write_bytes(location, body)
+    add_bytes(stats, len(body))
 
 def cleanup_data(df):
     # drop rows with NaN values
@@ -47,14 +293,16 @@ def cleanup_data(df):
     # remove spaces from the beginning and end of the string in the 'services' column
     df['services'] = df['services'].str.strip()
     #print(df['services'])
+    # parse the RFC 822 'date' column once, keeping the original string for the report
+    df['published_at'] = parse_rfc822_series(df['date'])
     return df
 
 # enrich dataframe with new columns
 def enrich_data(df):
-    # extract product names from the 'services' column
-    df['product'] = df['services'].apply(extract_product_names)
-    # extract category names from the 'services' column
-    df['category'] = df['services'].apply(extract_category_names)
+    # parse product and category names from the 'services' column
+    tags = parse_tags(df['services'])
+    for column in ['products', 'categories', 'product', 'category']:
+        df[column] = tags[column]
     return df
 
 # split cell into multiple rows based on the space separator
@@ -65,18 +313,124 @@ def explode(df):
     df = df.assign(category=df['category'].str.split(' ')).explode('category')
     return df
 
-# save dataframe to s3 as a csv file
-def save_df_to_s3(bucket_name, df, object_name=None) -> str:
-    s3 = boto3.resource('s3')
+def bridge_table(df, list_column, value_column) -> pd.DataFrame:
+    """
+    This function builds an (id, value) bridge table from a list column with array operations:
+    ids are repeated by the list lengths and the lists are concatenated once.
+    """
+    lengths = np.fromiter((len(values) for values in df[list_column]), dtype=np.int64, count=len(df))
+    return pd.DataFrame({
+        'id': np.repeat(df['id'].to_numpy(), lengths),
+        value_column: list(itertools.chain.from_iterable(df[list_column])),
+    })
+
+# normalized alternative to explode(): one row per entry plus (id, product) and (id, category) bridge tables
+def normalize(df):
+    """
+    This function splits the enriched dataframe into an entries table and two bridge tables.
+    Unlike chained explodes, which emit products x categories rows per entry, the row count
+    grows linearly with the number of tags.
+    """
+    entries = df[ENTRY_COLUMNS + optional_columns(df)].drop_duplicates(subset='id')
+    products = bridge_table(df, 'products', 'product').drop_duplicates()
+    categories = bridge_table(df, 'categories', 'category').drop_duplicates()
+    return entries, products, categories
+
+def aggregate_announcements(df) -> pd.DataFrame:
+    """
+    This function counts the announcements of an exploded dataframe by product, category and
+    period (the week and the month of the publish date). An entry is counted once per
+    product x category pair, entries without a publish date are left out.
+    """
+    pairs = df[['id', 'product', 'category', 'published_at']].dropna(subset=['published_at'])
+    pairs = pairs.drop_duplicates(subset=['id', 'product', 'category'])
+    counts = []
+    for period_type, frequency in AGGREGATE_PERIODS.items():
+        period_start = pairs['published_at'].dt.to_period(frequency).dt.start_time.dt.strftime('%Y-%m-%d')
+        period_counts = pairs.groupby([period_start.rename('period_start'), 'product', 'category'], sort=False).size()
+        counts.append(period_counts.rename('announcements').reset_index().assign(period_type=period_type))
+    return pd.concat(counts, ignore_index=True)[AGGREGATE_COLUMNS]
+
+def merge_aggregates(*aggregates) -> pd.DataFrame:
+    """ This function adds up the counts of several aggregate tables, sorted so equal values are stored together """
+    merged = pd.concat(aggregates, ignore_index=True)
+    merged = merged.groupby(AGGREGATE_COLUMNS[:-1], sort=True, observed=True)['announcements'].sum().reset_index()
+    merged['announcements'] = merged['announcements'].astype('int64')
+    return merged[AGGREGATE_COLUMNS]
+
+def empty_aggregates() -> pd.DataFrame:
+    return pd.DataFrame({column: pd.Series(dtype='int64' if column == 'announcements' else str)
+                         for column in AGGREGATE_COLUMNS})
+
+def load_aggregates(bucket, key=AGGREGATES_KEY) -> pd.DataFrame:
+    """
+    This function loads the aggregate table, an empty one before the first run. The landing files
+    counted by the last incremental run are in attrs['source_files'], see store_aggregates.
+    """
+    import pyarrow.parquet as pq
+    body = read_bytes(f"s3://{bucket}/{key}")
+    if body is None:
+        aggregates = empty_aggregates()
+        aggregates.attrs['source_files'] = []
+        return aggregates
+    table = pq.read_table(io.BytesIO(body))
+    aggregates = table.to_pandas()
+    aggregates.attrs['source_files'] = json.loads((table.schema.metadata or {}).get(AGGREGATES_FILES_METADATA, b'[]'))
+    return aggregates
+
+def aggregates_parquet(aggregates, source_files=()) -> bytes:
+    """
+    This function encodes the aggregate table as zstd parquet, with the landing files of source_files in
+    its metadata. The text columns are dictionary encoded, so the file stays a few KB even with years of data.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    table = pa.Table.from_pandas(
+        aggregates.astype({column: 'category' for column in AGGREGATE_COLUMNS[:-1]}), preserve_index=False
+    )
+    metadata = dict(table.schema.metadata or {})
+    metadata[AGGREGATES_FILES_METADATA] = json.dumps(sorted(source_files)).encode()
+    buffer = io.BytesIO()
+    pq.write_table(table.replace_schema_metadata(metadata), buffer, compression='zstd')
+    return buffer.getvalue()
 
+def save_aggregates(bucket, aggregates, key=AGGREGATES_KEY, source_files=(), stats=None) -> str:
+    """ This function writes the aggregate table as a single parquet object """
+    s3 = get_client('s3')
+    body = aggregates_parquet(aggregates, source_files)
     try:
-        s3.Object(bucket_name, object_name).put(
-            Body=df.to_csv(
-                index=False, 
-                sep=';', 
-                columns=['id','date', 'product', 'category', 'link', 'title', 'description']
-            )
-        )
+        s3.put_object(Bucket=bucket, Key=key, Body=body)
+        add_bytes(stats, len(body))
+    except ClientError as e:
+        logging.error(e)
+        raise e
+    return f"s3://{bucket}/{key}"
+
+def store_aggregates(bucket, aggregates, incremental, key=AGGREGATES_KEY, source_files=(), stats=None) -> str:
+    """
+    This function stores the counts of a run. A full run replaces the aggregate table, an incremental
+    run adds its counts to the stored ones and records the landing files it has read (source_files) with
+    them. A run that stops after this step is processed again from the same files: it skips the rows of
+    the recorded files (see the counted_files of run_pipeline), so no file is counted twice. Every entry
+    lands once (see the seen index of the collector), so the counts of different files never overlap.
+    """
+    if incremental:
+        aggregates = merge_aggregates(load_aggregates(bucket, key), aggregates)
+    else:
+        aggregates, source_files = merge_aggregates(aggregates), ()
+    if stats is not None:
+        stats['rows'] = len(aggregates)
+    return save_aggregates(bucket, aggregates, key, source_files, stats)
+
+# save dataframe to s3 as a csv file, encoded and uploaded in chunks so the whole csv text is never in memory.
+# gzip or zstd compression adds .gz or .zst to the object name
+def save_df_to_s3(bucket_name, df, object_name=None, columns=REPORT_COLUMNS, compression=COMPRESSION_NONE,
+                  stats=None) -> str:
+    s3 = get_client('s3')
+
+    object_name = compressed_key(object_name, compression)
+    try:
+        upload_chunks(s3, bucket_name, object_name, iter_dataframe_csv(df, columns, sep=';'), compression, stats=stats)
     except ClientError as e:
         logging.error(e)
         raise e
@@ -84,8 +438,416 @@ def save_df_to_s3(bucket_name, df, object_name=None) -> str:
     s3_uri = f"s3://{bucket_name}/{object_name}"
     return s3_uri
 
+# --- chunked pipeline: the landing data is deduplicated in a first pass over its ids, then cleaned,
+# enriched, exploded and written chunk by chunk, so memory is bounded by the chunk size, not the table size
+
+def split_location(location):
+    """ This function splits an s3://bucket/key uri into (bucket, key), (None, path) for a local path """
+    if location.startswith('s3://'):
+        bucket, _, key = location[len('s3://'):].partition('/')
+        return bucket, key
+    return None, location
+
+def read_bytes(location, default=None) -> bytes:
+    """ This function reads the bytes of an s3://bucket/key uri or a local path, default when there is no such object """
+    bucket, key = split_location(location)
+    if bucket is None:
+        if not os.path.isfile(key):
+            return default
+        with open(key, 'rb') as f:
+            return f.read()
+    s3 = get_client('s3')
+    try:
+        return s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return default
+        logging.error(e)
+        raise e
+
+def write_bytes(location, body):
+    """ This function writes bytes to an s3://bucket/key uri or a local path """
+    bucket, key = split_location(location)
+    if bucket is None:
+        os.makedirs(os.path.dirname(key) or '.', exist_ok=True)
+        with open(key, 'wb') as f:
+            f.write(body)
+        return
+    s3 = get_client('s3')
+    try:
+        s3.put_object(Bucket=bucket, Key=key, Body=body)
+    except ClientError as e:
+        logging.error(e)
+        raise e
+
+def open_output(location, compression=COMPRESSION_NONE):
+    """
+    This function opens a text writer to an s3://bucket/key uri (a streaming MultipartWriter)
+    or to a local path, compressed with gzip or zstd.
+    """
+    bucket, key = split_location(location)
+    if bucket is not None:
+        return MultipartWriter(get_client('s3'), bucket, key, compression)
+    os.makedirs(os.path.dirname(key) or '.', exist_ok=True)
+    if compression == 'gzip':
+        return gzip.open(key, 'wt', encoding='utf-8', newline='')
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.open(key, 'wt', encoding='utf-8', newline='')
+    return open(key, 'w', encoding='utf-8', newline='')
+
+class CsvReportWriter:
+    """ Writes DataFrame chunks as one ';' separated csv with a single header """
+
+    def __init__(self, location, columns=REPORT_COLUMNS, compression=COMPRESSION_NONE):
+        self.location = compressed_key(location, compression)
+        self.columns = columns
+        self.compression = compression
+        # opened with the first chunk, a run without rows leaves nothing behind
+        self.output = None
+
+    def write(self, df):
+        header = self.output is None
+        if header:
+            self.output = open_output(self.location, self.compression)
+        self.output.write(df.to_csv(index=False, sep=';', columns=self.columns, header=header))
+
+    def close(self, stats=None) -> str:
+        if self.output is None:
+            # no rows, the report still has its header
+            self.write(pd.DataFrame(columns=self.columns))
+        self.output.close()
+        bucket, path = split_location(self.location)
+        add_bytes(stats, self.output.bytes_written if bucket is not None else os.path.getsize(path))
+        return self.location
+
+    def abort(self):
+        if isinstance(self.output, MultipartWriter):
+            self.output.abort()
+        elif self.output is not None:
+            self.output.close()
+
+class NormalizedReportWriter:
+    """ Writes enriched DataFrame chunks as the entries and bridge tables of the normalized report """
+
+    def __init__(self, base, timestamp, compression=COMPRESSION_NONE, extra_columns=()):
+        self.location = f"{base}/{NORMALIZED_PREFIX}"
+        self.tables = [
+            CsvReportWriter(f"{self.location}entries/entries_{timestamp}.csv", ENTRY_COLUMNS + list(extra_columns), compression),
+            CsvReportWriter(f"{self.location}entry_products/entry_products_{timestamp}.csv", ['id', 'product'], compression),
+            CsvReportWriter(f"{self.location}entry_categories/entry_categories_{timestamp}.csv", ['id', 'category'], compression),
+        ]
+
+    def write(self, df):
+        for writer, table in zip(self.tables, normalize(df)):
+            writer.write(table)
+
+    def close(self, stats=None) -> str:
+        for writer in self.tables:
+            writer.close(stats)
+        return self.location
+
+    def abort(self):
+        for writer in self.tables:
+            writer.abort()
+
+class ParquetReportWriter:
+    """ Writes exploded DataFrame chunks as snappy parquet files partitioned by publish date, one file per chunk and partition """
+
+    def __init__(self, base, prefix, file_stem, columns=REPORT_COLUMNS):
+        self.location = f"{base}/{prefix}/"
+        self.file_stem = file_stem
+        self.columns = columns
+        self.chunks = 0
+        self.bytes = 0
+
+    def write(self, df):
+        published = df['published_at']
+        partitions = df.groupby([
+            published.dt.strftime('%Y').fillna('__HIVE_DEFAULT_PARTITION__'),
+            published.dt.strftime('%m').fillna('__HIVE_DEFAULT_PARTITION__'),
+            published.dt.strftime('%d').fillna('__HIVE_DEFAULT_PARTITION__'),
+        ], sort=False)
+        for (year, month, day), partition in partitions:
+            buffer = io.BytesIO()
+            partition[self.columns].astype(str).to_parquet(buffer, index=False, compression='snappy')
+            write_bytes(f"{self.location}year={year}/month={month}/day={day}/{self.file_stem}_{self.chunks:05d}.snappy.parquet",
+                        buffer.getvalue())
+            self.bytes += buffer.tell()
+        self.chunks += 1
+
+    def close(self, stats=None) -> str:
+        add_bytes(stats, self.bytes)
+        return self.location
+
+    def abort(self):
+        # parquet files are complete once written, incremental runs only ever add files
+        pass
+
+def report_writer(base, report_layout='exploded', output_format='csv', incremental=False,
+                  compression=COMPRESSION_NONE, timestamp=None, extra_columns=()):
+    """
+    This function returns the writer of a report under base, an s3://bucket uri or a local directory.
+    extra_columns are written after the columns of the layout, see ARTICLE_COLUMN.
+    """
+    timestamp = timestamp or current_date()
+    columns = REPORT_COLUMNS + list(extra_columns)
+    if report_layout == 'normalized':
+        return NormalizedReportWriter(base, timestamp, compression, extra_columns)
+    if output_format == 'parquet':
+        # partitioned parquet is append only, incremental runs just add files to the partitions
+        return ParquetReportWriter(base, 'processed_parquet', f'report_{timestamp}', columns)
+    if incremental:
+        return CsvReportWriter(f"{base}/{DELTA_PREFIX}report_{timestamp}.csv", columns, compression)
+    return CsvReportWriter(f"{base}/processed/report_{timestamp}.csv", columns, compression)
+
+def athena_landing_source(bucket, database, table, start_date=None, end_date=None, after_file=None, paths=None,
+                          fetch='bulk', chunk_rows=DEFAULT_CHUNK_ROWS, athena=None, s3=None,
+                          shards=1, concurrency=DEFAULT_SHARD_CONCURRENCY, input_format='csv'):
+    """
+    This function runs the landing query once and returns a source: a function that returns a new
+    iterator of DataFrame chunks (optionally of some columns only) over its results, every time it is called.
+    fetch='bulk' streams the result file, fetch='cursor' loads the results through pyathena and slices them.
+    With shards above 1 the date shard queries are started here (see sharded_landing_queries) and the
+    first pass streams the result file of every shard as soon as its query finishes, while the others
+    are still running. Later passes read the result files in the same order.
+    """
+    if fetch != 'bulk':
+        df = read_file_from_s3(bucket, database, table, start_date, end_date, after_file, paths)
+        return lambda columns=None, stats=None: iter_frame_chunks(df if columns is None else df[columns], chunk_rows)
+
+    athena = athena or get_client('athena', region_name='us-east-1')
+    s3 = s3 or get_client('s3')
+    output_location = f's3://{bucket}/athena_output/'
+    queries = None
+    if paths is None:
+        queries = sharded_landing_queries(database, table, start_date, end_date, after_file, shards, input_format,
+                                          lambda: list_object_keys(bucket, LANDING_PREFIXES[input_format], s3))
+    if queries:
+        completed = submit_queries(athena, queries, output_location, concurrency)
+        results = []
+    else:
+        query = build_query(database, table, start_date, end_date, after_file, paths)
+        results = [query_result_file(athena, query, output_location)]
+        completed = iter(())
+
+    def chunks(columns=None, stats=None):
+        for i in itertools.count():
+            if i == len(results):
+                result = next(completed, None)
+                if result is None:
+                    return
+                results.append(result[1:])
+            result_uri, dtypes = results[i]
+            for chunk in iter_query_results(s3, result_uri, dtypes, chunk_rows, columns, stats):
+                # partition keys are not part of the report
+                yield chunk.drop(columns=['year', 'month', 'day'], errors='ignore')
+    return chunks
+
+def local_landing_files(path) -> list:
+    """ This function lists the landing csv files (optionally .gz or .zst) of a file or directory, sorted by name """
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for directory, _, names in os.walk(path):
+        files.extend(os.path.join(directory, name) for name in names if '.csv' in name)
+    return sorted(files)
+
+def local_landing_source(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    This function returns a source over local landing csv files, like athena_landing_source.
+    Rows are read like the landing table reads them: columns by position, the header skipped,
+    the file name in 'source_file'.
+    """
+    files = local_landing_files(path)
+
+    def chunks(columns=None, stats=None):
+        usecols = None if columns is None else [column for column in LANDING_COLUMNS if column in columns]
+        for file in files:
+            add_bytes(stats, os.path.getsize(file))
+            for chunk in pd.read_csv(file, sep=';', names=LANDING_COLUMNS, header=0, usecols=usecols, dtype=str,
+                                     keep_default_na=False, chunksize=chunk_rows,
+                                     compression=READ_COMPRESSION.get(os.path.splitext(file)[1])):
+                yield chunk.assign(source_file=os.path.basename(file))
+    return chunks
+
+def iter_frame_chunks(df, chunk_rows=DEFAULT_CHUNK_ROWS):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def dedup_mask(source, stats=None):
+    """
+    This function reads the ids and file names of a source and returns a boolean mask over all of
+    its rows that keeps the row of the newest landing file of every id ('source_file', collector file
+    names start with the upload timestamp), the number of removed rows and the sorted file names.
+    Only the 64 bit id hashes and the file name codes are kept in memory.
+    """
+    keys, files = [], []
+    for chunk in source(['id', 'source_file'], stats):
+        keys.append(pd.util.hash_pandas_object(chunk['id'], index=False).to_numpy())
+        files.append(chunk['source_file'].astype('category'))
+    if not keys:
+        return np.zeros(0, dtype=bool), 0, []
+    keys = np.concatenate(keys)
+    # file names are ranked by name, whatever order the chunks brought them in
+    files = union_categoricals(files, sort_categories=True)
+    ranks, names = pd.factorize(files, sort=True)
+    mask = np.zeros(len(keys), dtype=bool)
+    mask[latest_positions(keys, ranks)] = True
+    return mask, len(keys) - int(mask.sum()), list(names)
+
+def transform_chunk(df, report_layout='exploded'):
+    """ This function runs cleanup, enrich and explode on a chunk, returns it with {stage: (seconds, output rows)} """
+    stages = {}
+    start = time.perf_counter()
+    df = cleanup_data(df)
+    stages['cleanup'] = (time.perf_counter() - start, len(df))
+    start = time.perf_counter()
+    df = enrich_data(df)
+    stages['enrich'] = (time.perf_counter() - start, len(df))
+    if report_layout != 'normalized':
+        start = time.perf_counter()
+        df = explode(df)
+        stages['explode'] = (time.perf_counter() - start, len(df))
+    return df, stages
+
+def _timed(chunks, totals):
+    """ This function yields the chunks of an iterator and adds the time spent reading them to totals['read'] """
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        totals['read']['seconds'] += time.perf_counter() - start
+        if chunk is None:
+            return
+        totals['read']['rows'] += len(chunk)
+        yield chunk
+
+def _ordered_results(pool, function, items, window):
+    """
+    This function yields function(item) for every item, computed in a process pool, in item order.
+    At most window items are in flight, unlike Pool.imap, which reads the whole iterable ahead.
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.apply_async(function, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def run_pipeline(source, writer, report_layout='exploded', workers=1, aggregates=True, metrics=None,
+                 articles=None, clusters=None, counted_files=()) -> dict:
+    """
+    This function runs the processing pipeline from a source (see athena_landing_source) to a report writer
+    (see report_writer): dedup over the whole source, then cleanup, enrich and explode per chunk,
+    in a process pool when workers > 1, and every processed chunk written in source order.
+    With articles, the keyword arguments of add_articles ({'cache_path', 'rate_per_host', ...}), the linked
+    pages are fetched for every chunk in this process, so the rate limits hold across workers.
+    With clusters, a MinHashIndex, every processed chunk gets its near-duplicate clusters in this process
+    before it is written, see add_clusters; the index grows with the new entries.
+    Rows of the landing files in counted_files are written, but left out of the aggregate counts, see store_aggregates.
+    Stage durations are added up over the chunks and emitted once per stage.
+    Returns the report uri, row counts, the landing files (sorted) and the newest of them, and the aggregate
+    counts (None when disabled).
+    """
+    metrics = metrics or MetricsLogger('processor')
+    with metrics.stage('dedup') as stage:
+        mask, duplicates, source_files = dedup_mask(source, stats=stage)
+        stage['rows'] = int(mask.sum())
+    metrics.emit('dedup', {'Duplicates': duplicates})
+    if len(mask) == 0:
+        writer.abort()
+        return {'uri': None, 'rows': 0, 'duplicates': 0, 'output_rows': 0, 'source_files': [], 'last_file': None,
+                'aggregates': None, 'articles': None}
+
+    totals = {name: {'seconds': 0.0, 'rows': 0}
+              for name in ['read', 'cleanup', 'enrich', 'explode', 'cluster', 'save', 'aggregate']}
+    read_stats, save_stats, article_stats = {'bytes': 0}, {'bytes': 0}, {}
+
+    def kept_chunks():
+        offset = 0
+        for chunk in source(stats=read_stats):
+            keep = mask[offset:offset + len(chunk)]
+            offset += len(chunk)
+            if keep.any():
+                yield chunk[keep]
+
+    def with_articles(chunks):
+        for chunk in chunks:
+            yield add_articles(chunk, stats=article_stats, **articles)
+
+    pool = Pool(workers) if workers > 1 else None
+    counts = empty_aggregates() if aggregates else None
+    counted_files = set(counted_files)
+    try:
+        chunks = _timed(kept_chunks(), totals)
+        if articles:
+            chunks = with_articles(chunks)
+        transform = functools.partial(transform_chunk, report_layout=report_layout)
+        results = _ordered_results(pool, transform, chunks, workers) if pool else map(transform, chunks)
+        for df, stages in results:
+            for name, (seconds, rows) in stages.items():
+                totals[name]['seconds'] += seconds
+                totals[name]['rows'] += rows
+            if clusters is not None:
+                start = time.perf_counter()
+                df = add_clusters(df, clusters)
+                totals['cluster']['seconds'] += time.perf_counter() - start
+                totals['cluster']['rows'] += len(df)
+            start = time.perf_counter()
+            writer.write(df)
+            totals['save']['seconds'] += time.perf_counter() - start
+            totals['save']['rows'] += len(df)
+            if aggregates:
+                start = time.perf_counter()
+                exploded = df if report_layout != 'normalized' else explode(df[['id', 'published_at', 'product', 'category', 'source_file']])
+                if counted_files:
+                    exploded = exploded[~exploded['source_file'].isin(counted_files)]
+                counts = merge_aggregates(counts, aggregate_announcements(exploded))
+                totals['aggregate']['seconds'] += time.perf_counter() - start
+                totals['aggregate']['rows'] += len(exploded)
+        uri = writer.close(save_stats)
+    except Exception as e:
+        logging.error(e)
+        writer.abort()
+        raise e
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    for name, total in totals.items():
+        if total['rows'] or name == 'read':
+            metrics.emit(name, {
+                'Duration': total['seconds'] * 1000,
+                'Rows': total['rows'],
+                'Bytes': {'read': read_stats, 'save': save_stats}.get(name, {}).get('bytes'),
+            })
+    if articles:
+        seconds, urls = article_stats.get('seconds', 0.0), article_stats.get('urls', 0)
+        article_stats['pages_per_second'] = article_stats.get('misses', 0) / seconds if seconds else 0.0
+        article_stats['hit_ratio'] = article_stats.get('hits', 0) / urls if urls else 0.0
+        metrics.emit('articles', {
+            'Duration': seconds * 1000,
+            'Rows': urls,
+            'Bytes': article_stats.get('bytes', 0),
+            'Errors': article_stats.get('errors', 0),
+            'PagesPerSecond': article_stats['pages_per_second'],
+            'CacheHitRatio': 100.0 * article_stats['hit_ratio'],
+        })
+    return {
+        'uri': uri,
+        'rows': int(mask.sum()),
+        'duplicates': duplicates,
+        'output_rows': totals['save']['rows'],
+        'source_files': source_files,
+        'last_file': source_files[-1],
+        'aggregates': counts,
+        'articles': article_stats if articles else None,
+    }
+
 def send_sns_message(topic_arn, s3_uri):
-    sns = boto3.client('sns')
+    sns = get_client('sns')
 
     try:
         response = sns.publish(
@@ -98,28 +860,206 @@ def send_sns_message(topic_arn, s3_uri):
         logging.error(e)
         raise e
 
-if __name__ == "__main__":
+def main(argv):
+    # only available inside of Glue
+    from awsglue.utils import getResolvedOptions
+
+    args = getResolvedOptions(argv, ['bucket','topic_arn','table', 'database'])
+    optional_args = resolve_optional_args(argv, {
+        'input_format': 'csv',
+        'output_format': 'csv',
+        'start_date': '',
+        'end_date': '',
+        # 'incremental' only reads landing objects newer than the watermark and writes delta reports
+        'mode': 'full',
+        'compact_every': '30',
+        # 'bulk' streams the Athena result file, 'cursor' pages through pyathena
+        'athena_fetch': 'bulk',
+        # date shards of a bulk read whose Athena queries run concurrently, at most athena_concurrency at a time
+        'athena_shards': '1',
+        'athena_concurrency': str(DEFAULT_SHARD_CONCURRENCY),
+        # 'exploded' writes one row per product x category, 'normalized' an entries table and bridge tables
+        'report_layout': 'exploded',
+        # 'gzip' or 'zstd' compresses csv reports while they are uploaded
+        'compression': COMPRESSION_NONE,
+        # 'true' maintains the announcement counts by product, category and week/month, see AGGREGATES_KEY
+        'aggregates': 'true',
+        # landing rows processed at a time, and the processes that clean, enrich and explode the chunks
+        'chunk_rows': str(DEFAULT_CHUNK_ROWS),
+        'workers': '1',
+        # 'true' adds the text of the linked page of every entry as the 'article' column. pages are cached in
+        # ARTICLE_CACHE_KEY, at most article_rate requests per second go to one host
+        'articles': 'false',
+        'article_rate': str(DEFAULT_RATE_PER_HOST),
+        'article_concurrency': str(DEFAULT_MAX_CONCURRENCY),
+        # 'true' adds the near-duplicate cluster of every entry as the 'cluster_id' column, the MinHash
+        # signatures of the entries seen so far are kept in CLUSTER_INDEX_KEY
+        'clusters': 'false',
+        # stage metrics are printed as CloudWatch EMF, or appended to this file when it is set
+        'metrics_file': '',
+        # set by Glue for jobs started by a workflow, the run properties hold the batch manifest
+        'WORKFLOW_NAME': '',
+        'WORKFLOW_RUN_ID': '',
+    })
 
-    args = getResolvedOptions(sys.argv, ['bucket','topic_arn','table', 'database'])
-    
     bucket = args['bucket']
     topic_arn = args['topic_arn']
     table = args['table']
     database = args['database']
+    incremental = optional_args['mode'] == 'incremental'
+    compression = optional_args['compression']
+    metrics = MetricsLogger('processor', path=optional_args['metrics_file'] or None)
 
-    df = read_file_from_s3(bucket, database, table)
+    start_date, end_date = None, None
+    if optional_args['input_format'] == 'parquet':
+        # landing data partitioned by publish date, see the parquet tables in ProcessorStack.
+        # only this table can be restricted to a date range
+        table = f"{table}_parquet"
+        start_date, end_date = optional_args['start_date'], optional_args['end_date']
 
-    df = cleanup_data(df)
+    watermark = load_watermark(bucket) if incremental else {}
+    after_file, paths = watermark.get('last_file'), None
+    manifest = workflow_manifest(optional_args['WORKFLOW_NAME'], optional_args['WORKFLOW_RUN_ID'])
+    # the messages of a batch are gone once its run has started, the manifest of a failed run is the only
+    # record of its landing objects, so they are processed with the next batch
+    manifests = pending_manifests(manifest) if manifest else []
+    if incremental and manifests:
+        # a batch run reads exactly the landing objects of its manifests instead of everything after the watermark
+        paths = sorted(set(itertools.chain.from_iterable(load_manifest(uri) for uri in manifests)))
+        after_file = None
+        print(f"Processing {len(paths)} landing objects of the batch manifests {manifests}")
+    # the Athena query, its result file is read in chunks by the pipeline. date shard queries are only
+    # started here, they finish while the first pass of the pipeline reads the shards that are done
+    with metrics.stage('query'):
+        source = athena_landing_source(bucket, database, table, start_date, end_date, after_file, paths,
+                                       fetch=optional_args['athena_fetch'], chunk_rows=int(optional_args['chunk_rows']),
+                                       shards=int(optional_args['athena_shards']),
+                                       concurrency=int(optional_args['athena_concurrency']),
+                                       input_format=optional_args['input_format'])
 
-    df = enrich_data(df)
+    # a date restricted full run only sees part of the data, it would replace the aggregates with partial counts
+    update_cube = optional_args['aggregates'] == 'true' and (incremental or not (start_date or end_date))
+    articles = None
+    if optional_args['articles'] == 'true':
+        articles = {
+            'cache_path': os.path.join('/tmp', os.path.basename(ARTICLE_CACHE_KEY)),
+            'rate_per_host': float(optional_args['article_rate']),
+            'max_concurrency': int(optional_args['article_concurrency']),
+        }
+        download_article_cache(bucket, articles['cache_path'])
+    clusters = None
+    if optional_args['clusters'] == 'true':
+        with metrics.stage('load_clusters') as stage:
+            clusters = load_cluster_index(f"s3://{bucket}/{CLUSTER_INDEX_KEY}")
+            stage['rows'] = len(clusters)
+    extra_columns = [ARTICLE_COLUMN] * bool(articles) + [CLUSTER_COLUMN] * bool(clusters is not None)
+    # files of an earlier run that stopped after it had stored its counts, see store_aggregates
+    counted_files = load_aggregates(bucket).attrs['source_files'] if update_cube and incremental else ()
+    writer = report_writer(f"s3://{bucket}", optional_args['report_layout'], optional_args['output_format'],
+                           incremental, compression, extra_columns=extra_columns)
+    result = run_pipeline(source, writer, optional_args['report_layout'], int(optional_args['workers']),
+                          aggregates=update_cube, metrics=metrics, articles=articles, clusters=clusters,
+                          counted_files=counted_files)
+    print(f"Removed {result['duplicates']} duplicate entries")
+    if result['articles']:
+        # the cache is kept even if a later stage fails, the pages it holds do not have to be fetched again
+        upload_article_cache(bucket, articles['cache_path'])
+        print(f"Articles: {json.dumps(result['articles'])}")
+
+    if result['rows'] == 0:
+        print(f"No new landing data since {watermark.get('last_file')}")
+        for uri in manifests:
+            delete_manifest(uri)
+        sys.exit(0)
+    last_file = max(result['last_file'], watermark.get('last_file') or '')
+    s3_uri = result['uri']
+
+    if (optional_args['report_layout'] == 'exploded' and optional_args['output_format'] == 'csv' and incremental
+            and len(list_object_keys(bucket, DELTA_PREFIX)) >= int(optional_args['compact_every'])):
+        with metrics.stage('compact'):
+            s3_uri = compact_reports(bucket, compression=compression)
 
-    df = explode(df)
+    # after the report, so a failed save does not leave counts without a report. the landing files are
+    # stored with the counts, a run that fails after this step does not count them again when it is rerun
+    if update_cube:
+        with metrics.stage('save_aggregates') as stage:
+            store_aggregates(bucket, result['aggregates'], incremental, source_files=result['source_files'], stats=stage)
+    if clusters is not None and clusters.changed:
+        with metrics.stage('save_clusters') as stage:
+            save_cluster_index(f"s3://{bucket}/{CLUSTER_INDEX_KEY}", clusters, stats=stage)
+            stage['rows'] = len(clusters)
 
-    s3_uri = save_df_to_s3(bucket, df, f'processed/report_{current_date()}.csv')
+    if incremental:
+        # the watermark only moves once the report covering these objects has been written
+        save_watermark(bucket, {'last_file': last_file, 'updated': current_date()})
+    # a failed run keeps its manifests, their landing objects are read again by the next batch run
+    for uri in manifests:
+        delete_manifest(uri)
 
-    send_sns_message(topic_arn, s3_uri)
+    with metrics.stage('notify'):
+        send_sns_message(topic_arn, s3_uri)
 
+    print(f"AWS call latencies: {json.dumps(call_latencies())}")
     print('Done')
-    
 
+def local_main(argv):
+    """
+    Runs the pipeline outside of Glue, from local landing csv files to a local directory:
 
+        python script.py --local-input ./landing --local-output ./out --workers 4
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="Process local landing csv files like the Glue job")
+    parser.add_argument("--local-input", required=True, help="landing csv file or directory, .gz and .zst are decompressed")
+    parser.add_argument("--local-output", required=True, help="directory of the report, laid out like the bucket")
+    parser.add_argument("--report_layout", default="exploded", choices=["exploded", "normalized"])
+    parser.add_argument("--output_format", default="csv", choices=["csv", "parquet"])
+    parser.add_argument("--compression", default=COMPRESSION_NONE, choices=["none", "gzip", "zstd"])
+    parser.add_argument("--chunk_rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--aggregates", default="true", choices=["true", "false"])
+    parser.add_argument("--articles", default="false", choices=["true", "false"])
+    parser.add_argument("--article_cache", help="SQLite article cache, <local-output>/state/article_cache.sqlite by default")
+    parser.add_argument("--article_rate", type=float, default=DEFAULT_RATE_PER_HOST)
+    parser.add_argument("--article_concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--clusters", default="false", choices=["true", "false"])
+    parser.add_argument("--cluster_index", help="MinHash index, <local-output>/state/minhash_index.npz by default")
+    parser.add_argument("--metrics_file", default="")
+    args = parser.parse_args(argv)
+
+    metrics = MetricsLogger('processor', path=args.metrics_file or None)
+    output = args.local_output.rstrip('/')
+    articles = None
+    if args.articles == 'true':
+        articles = {
+            'cache_path': args.article_cache or os.path.join(output, ARTICLE_CACHE_KEY),
+            'rate_per_host': args.article_rate,
+            'max_concurrency': args.article_concurrency,
+        }
+        os.makedirs(os.path.dirname(articles['cache_path']) or '.', exist_ok=True)
+    clusters, cluster_index = None, args.cluster_index or os.path.join(output, CLUSTER_INDEX_KEY)
+    if args.clusters == 'true':
+        clusters = load_cluster_index(cluster_index)
+    extra_columns = [ARTICLE_COLUMN] * bool(articles) + [CLUSTER_COLUMN] * bool(clusters is not None)
+    writer = report_writer(output, args.report_layout, args.output_format, compression=args.compression,
+                           extra_columns=extra_columns)
+    result = run_pipeline(local_landing_source(args.local_input, args.chunk_rows), writer, args.report_layout,
+                          args.workers, aggregates=args.aggregates == 'true', metrics=metrics, articles=articles,
+                          clusters=clusters)
+    if args.aggregates == 'true' and result['rows']:
+        with metrics.stage('save_aggregates'):
+            write_bytes(f"{output}/{AGGREGATES_KEY}", aggregates_parquet(merge_aggregates(result['aggregates'])))
+    if clusters is not None and clusters.changed:
+        with metrics.stage('save_clusters') as stage:
+            save_cluster_index(cluster_index, clusters, stats=stage)
+    print(f"Processed {result['rows']} entries ({result['duplicates']} duplicates removed) "
+          f"into {result['output_rows']} rows: {result['uri']}")
+    if result['articles']:
+        print(f"Articles: {json.dumps(result['articles'])}")
+    return result
+
+if __name__ == "__main__":
+    if '--local-input' in sys.argv:
+        local_main(sys.argv[1:])
+    else:
+        main(sys.argv)
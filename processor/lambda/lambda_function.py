@@ -1,12 +1,24 @@
 # Set up logging
 import json
 import os
+import sys
 import logging
-import boto3
+import uuid
+from datetime import datetime
 
+# the shared modules of the collector are bundled next to this file, see ProcessorStack.
+# outside of Lambda they are imported from the collector Lambda package
+try:
+    from aws_clients import get_client
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'collector', 'lambda', 'common_utilities'))
+    from aws_clients import get_client
+from metrics import MetricsLogger
 
-# init client
-glue_client = boto3.client('glue')
+
+# init clients once per container, warm invocations reuse them
+glue_client = get_client('glue')
+s3_client = get_client('s3')
 
 # configure logging
 logger = logging.getLogger()
@@ -14,20 +26,61 @@ logger.setLevel(logging.INFO)
 
 # load environment variables
 glue_workflow_name = os.environ['GLUE_WORKFLOW_NAME']
+# prefix of the batch manifests, the Glue job reads the landing objects listed in the manifest of its run
+manifest_prefix = os.environ.get('MANIFEST_PREFIX', 'state/batches/')
+# stage metrics are printed as CloudWatch EMF, or appended to this file when it is set
+metrics = MetricsLogger('processor_trigger', path=os.environ.get('METRICS_FILE'))
+
+class BatchTriggerException(Exception):
+    pass
 
 def start_glue_workflow(workflow_name):
     response = glue_client.start_workflow_run(Name=workflow_name)
     print(response)
 
+def landing_objects(event) -> dict:
+    """
+    This function returns {bucket: sorted unique keys} of the S3 'Object Created' events in an event.
+    The event is either an SQS batch of EventBridge events (the batching trigger) or a single
+    EventBridge event (direct invocation by the rule).
+    """
+    if 'Records' in event:
+        details = [json.loads(record['body'])['detail'] for record in event['Records']]
+    else:
+        details = [event['detail']]
+    objects = {}
+    for detail in details:
+        objects.setdefault(detail['bucket']['name'], set()).add(detail['object']['key'])
+    return {bucket: sorted(keys) for bucket, keys in objects.items()}
+
+def write_manifest(bucket, keys) -> str:
+    """ This function stores the landing keys of a batch as a json manifest under the manifest prefix, returns its S3 URI """
+    key = f"{manifest_prefix}{datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')}_{uuid.uuid4().hex[:8]}.json"
+    body = json.dumps({'bucket': bucket, 'keys': keys, 'created': datetime.utcnow().isoformat()})
+    s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+    return f"s3://{bucket}/{key}"
+
 def lambda_handler(event, context):
     logger.info('## INITIATED BY EVENT: ')
-    logger.info(event['detail'])
+    logger.info(event)
+    objects = landing_objects(event)
+    if len(objects) != 1:
+        raise BatchTriggerException(f"Expected events of one bucket, got {list(objects)}")
+    bucket, keys = next(iter(objects.items()))
+    logger.info(f'## BATCH OF {len(keys)} LANDING OBJECTS')
+
+    manifest = write_manifest(bucket, keys)
     try:
-        response = glue_client.start_workflow_run(Name = glue_workflow_name)
+        # one run for the whole batch, the job reads the keys of the manifest
+        with metrics.stage('start_workflow') as stage:
+            response = glue_client.start_workflow_run(Name = glue_workflow_name, RunProperties={'manifest': manifest})
+            stage['rows'] = len(keys)
         logger.info('## STARTED GLUE WORKFLOW: ' + glue_workflow_name)
         logger.info('## GLUE WORKFLOW RUN ID: ' + response['RunId'])
+        logger.info('## MANIFEST: ' + manifest)
         return response
     except glue_client.exceptions.ConcurrentRunsExceededException as e:
         logger.error(e)
-        pass
-    
\ No newline at end of file
+        s3_client.delete_object(Bucket=bucket, Key=manifest[len(f"s3://{bucket}/"):])
+        # failing the invocation returns the messages to the queue, they are retried with the next batch
+        raise e
@@ -1,5 +1,12 @@
+import os
+import shutil
+
+import jsii
 from aws_cdk import (
+    AssetHashType,
+    BundlingOptions,
     Duration,
+    ILocalBundling,
     Stack,
     aws_events as events,
     aws_glue as glue,
@@ -7,9 +14,29 @@ from aws_cdk import (
     aws_events_targets as targets,
     aws_iam as iam,
     aws_lambda as _lambda,
+    aws_lambda_event_sources as lambda_event_sources,
+    aws_sqs as sqs,
 )
 from constructs import Construct
 
+# modules of the collector Lambda that the processor's Glue job and trigger Lambda use too.
+# the Glue job (extra_python_files) and the trigger Lambda (CopyFiles) get every module as a single
+# top-level file, so a shipped module only imports the standard library, installed packages and
+# other shipped modules by their own name, never through the common_utilities package
+COMMON_UTILITIES = "../collector/lambda/common_utilities"
+
+@jsii.implements(ILocalBundling)
+class CopyFiles:
+    """ Bundles an asset locally, without Docker, by copying files into it """
+
+    def __init__(self, files):
+        self.files = files
+
+    def try_bundle(self, output_dir, options) -> bool:
+        for file in self.files:
+            shutil.copy(file, os.path.join(output_dir, os.path.basename(file)))
+        return True
+
 class ProcessorStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
@@ -20,6 +47,29 @@ class ProcessorStack(Stack):
         account_id = self.node.try_get_context("aws_account_id")
         region = self.node.try_get_context("aws_region")
         sns_topic_arn = self.node.try_get_context("sns_topic_arn")
+        # csv (default) or parquet, for the landing data read by the glue job and for the processed report
+        input_format = self.node.try_get_context("input_format") or "csv"
+        output_format = self.node.try_get_context("output_format") or "csv"
+        # full (default) reprocesses all landing data, incremental only the objects newer than the watermark
+        processing_mode = self.node.try_get_context("processing_mode") or "full"
+        # exploded (default) or normalized, see README.md
+        report_layout = self.node.try_get_context("report_layout") or "exploded"
+        # none (default), gzip or zstd compression of the csv reports
+        compression = self.node.try_get_context("compression") or "none"
+        # landing rows processed at a time and the processes that clean, enrich and explode the chunks
+        chunk_rows = str(self.node.try_get_context("chunk_rows") or 10000)
+        workers = str(self.node.try_get_context("workers") or 1)
+        # true adds the text of the linked announcement pages as the 'article' column, see README.md
+        articles = self.node.try_get_context("articles") or "false"
+        # true adds the near-duplicate cluster of every entry as the 'cluster_id' column, see README.md
+        clusters = self.node.try_get_context("clusters") or "false"
+        # date shards of the landing query, run athena_concurrency at a time, see README.md
+        athena_shards = str(self.node.try_get_context("athena_shards") or 1)
+        athena_concurrency = str(self.node.try_get_context("athena_concurrency") or 4)
+        # landing events are collected for up to batch_window seconds (at most 300) or batch_size objects,
+        # then one workflow run processes the whole batch
+        batch_window = int(self.node.try_get_context("batch_window") or 300)
+        batch_size = int(self.node.try_get_context("batch_size") or 1000)
         table_name = self.node.try_get_context("table_name")
         database_name = self.node.try_get_context("database_name")
 
@@ -82,6 +132,95 @@ class ProcessorStack(Stack):
             )
         )
 
+        # a function that returns a parquet table partitioned by publish date (year/month/day).
+        # partition projection lets Athena prune partitions from the query predicate without MSCK REPAIR
+        def partitioned_parquet_table(construct_id, name, description, location, column_names):
+            return glue.CfnTable(self, construct_id,
+                catalog_id=account_id,
+                database_name=glue_db.database_name,
+                table_input=glue.CfnTable.TableInputProperty(
+                    name=name,
+                    description=description,
+                    table_type="EXTERNAL_TABLE",
+                    parameters={
+                        "EXTERNAL": "TRUE",
+                        "classification": "parquet",
+                        "parquet.compression": "SNAPPY",
+                        "projection.enabled": "true",
+                        "projection.year.type": "integer",
+                        "projection.year.range": "2004,2100",
+                        "projection.month.type": "integer",
+                        "projection.month.range": "1,12",
+                        "projection.month.digits": "2",
+                        "projection.day.type": "integer",
+                        "projection.day.range": "1,31",
+                        "projection.day.digits": "2",
+                        "storage.location.template": f"{location}/year=${{year}}/month=${{month}}/day=${{day}}",
+                    },
+                    partition_keys=[
+                        glue.CfnTable.ColumnProperty(name="year", type="string"),
+                        glue.CfnTable.ColumnProperty(name="month", type="string"),
+                        glue.CfnTable.ColumnProperty(name="day", type="string"),
+                    ],
+                    storage_descriptor=glue.CfnTable.StorageDescriptorProperty(
+                        columns=[glue.CfnTable.ColumnProperty(name=column, type="string") for column in column_names],
+                        location=location,
+                        input_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat",
+                        output_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat",
+                        serde_info=glue.CfnTable.SerdeInfoProperty(
+                            serialization_library="org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe",
+                        ),
+                    )
+                )
+            )
+
+        # landing data written by the collector with output_format=parquet
+        glue_parquet_table = partitioned_parquet_table("RssFeedProcessorGlueParquetTable",
+            name=f"{table_name}_parquet",
+            description="RSS Feed Table, parquet partitioned by publish date",
+            location=f"s3://{bucket_name}/landing_parquet",
+            column_names=["id", "services", "title", "link", "date", "description"],
+        )
+
+        # processed report written by the glue job with output_format=parquet
+        glue_processed_parquet_table = partitioned_parquet_table("RssFeedProcessorGlueProcessedParquetTable",
+            name=f"{table_name}_processed_parquet",
+            description="Processed RSS Feed report, parquet partitioned by publish date",
+            location=f"s3://{bucket_name}/processed_parquet",
+            column_names=["id", "date", "product", "category", "link", "title", "description", "article", "cluster_id"],
+        )
+
+        # announcement counts by product, category and week/month, maintained by the glue job
+        glue_aggregates_table = glue.CfnTable(self, "RssFeedProcessorGlueAggregatesTable",
+            catalog_id=account_id,
+            database_name=glue_db.database_name,
+            table_input=glue.CfnTable.TableInputProperty(
+                name=f"{table_name}_aggregates",
+                description="Announcements by product, category and period",
+                table_type="EXTERNAL_TABLE",
+                parameters={
+                    "EXTERNAL": "TRUE",
+                    "classification": "parquet",
+                    "parquet.compression": "ZSTD",
+                },
+                storage_descriptor=glue.CfnTable.StorageDescriptorProperty(
+                    columns=[
+                        glue.CfnTable.ColumnProperty(name="period_type", type="string"),
+                        glue.CfnTable.ColumnProperty(name="period_start", type="string"),
+                        glue.CfnTable.ColumnProperty(name="product", type="string"),
+                        glue.CfnTable.ColumnProperty(name="category", type="string"),
+                        glue.CfnTable.ColumnProperty(name="announcements", type="bigint"),
+                    ],
+                    location=f"s3://{bucket_name}/processed/aggregates",
+                    input_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat",
+                    output_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat",
+                    serde_info=glue.CfnTable.SerdeInfoProperty(
+                        serialization_library="org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe",
+                    ),
+                )
+            )
+        )
+
 
         # glue workflow
         workflow = glue.CfnWorkflow(self, "RssFeedProcessorGlueWorkflow", 
@@ -109,11 +248,52 @@ class ProcessorStack(Stack):
             ],
             resources=[
                 f"arn:aws:s3:::{bucket_name}/landing/*",
+                f"arn:aws:s3:::{bucket_name}/landing_parquet/*",
                 f"arn:aws:s3:::{bucket_name}/processed/*",
+                f"arn:aws:s3:::{bucket_name}/processed_parquet/*",
                 f"arn:aws:s3:::{bucket_name}/athena_output/*",
             ]
         ))
 
+        # watermark of incremental runs
+        iam_role_glue.add_to_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=[
+                "s3:GetObject",
+                "s3:PutObject",
+            ],
+            resources=[
+                f"arn:aws:s3:::{bucket_name}/state/*",
+            ]
+        ))
+
+        # the batch manifest of a run is removed once the run has processed it
+        iam_role_glue.add_to_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["s3:DeleteObject"],
+            resources=[f"arn:aws:s3:::{bucket_name}/state/batches/*"]
+        ))
+
+        # compaction lists and removes the delta reports of incremental runs
+        iam_role_glue.add_to_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["s3:ListBucket"],
+            resources=[f"arn:aws:s3:::{bucket_name}"]
+        ))
+
+        # large reports are written with multipart upload, a failed upload is aborted
+        iam_role_glue.add_to_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["s3:AbortMultipartUpload"],
+            resources=[f"arn:aws:s3:::{bucket_name}/processed/*"]
+        ))
+
+        iam_role_glue.add_to_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["s3:DeleteObject"],
+            resources=[f"arn:aws:s3:::{bucket_name}/processed/delta/*"]
+        ))
+
         iam_role_glue.add_to_policy(iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
             actions=[
@@ -126,6 +306,13 @@ class ProcessorStack(Stack):
             ] 
         ))
 
+        # the batch manifest of a run is passed as a workflow run property
+        iam_role_glue.add_to_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["glue:GetWorkflowRunProperties"],
+            resources=[f"arn:aws:glue:{region}:{account_id}:workflow/{workflow.name}"]
+        ))
+
         iam_role_glue.add_to_policy(iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
             actions=["sns:Publish"],
@@ -138,6 +325,17 @@ class ProcessorStack(Stack):
                 glue_version=glue_alpha.GlueVersion.V1_0,
                 python_version=glue_alpha.PythonVersion.THREE_NINE,
                 script=glue_alpha.Code.from_asset("assets/script.py"),
+                # modules shared with the collector Lambda
+                extra_python_files=[
+                    glue_alpha.Code.from_asset(f"{COMMON_UTILITIES}/date_parsing.py"),
+                    glue_alpha.Code.from_asset(f"{COMMON_UTILITIES}/streaming_upload.py"),
+                    glue_alpha.Code.from_asset(f"{COMMON_UTILITIES}/aws_clients.py"),
+                    glue_alpha.Code.from_asset(f"{COMMON_UTILITIES}/metrics.py"),
+                    # modules of the processor, next to the script
+                    glue_alpha.Code.from_asset("assets/article_fetch.py"),
+                    glue_alpha.Code.from_asset("assets/minhash.py"),
+                    glue_alpha.Code.from_asset("assets/athena_queries.py"),
+                ],
             ),
             description="Cleanup and Processing for AWS RSS Feed data",
             role=iam_role_glue
@@ -156,6 +354,17 @@ class ProcessorStack(Stack):
                         "--topic_arn": f"{sns_topic_arn}",
                         "--table": f"{table_name}",
                         "--database": f"{database_name}",
+                        "--input_format": input_format,
+                        "--output_format": output_format,
+                        "--mode": processing_mode,
+                        "--report_layout": report_layout,
+                        "--compression": compression,
+                        "--chunk_rows": chunk_rows,
+                        "--workers": workers,
+                        "--articles": articles,
+                        "--clusters": clusters,
+                        "--athena_shards": athena_shards,
+                        "--athena_concurrency": athena_concurrency,
                     }
                 )
             ]
@@ -169,6 +378,21 @@ class ProcessorStack(Stack):
         )
         
 
+        # landing events are queued and the lambda trigger receives them in batches.
+        # a batch that can not start a run (one is still running) returns to the queue and is retried
+        dead_letter_queue = sqs.Queue(self, "RssFeedProcessorLandingEventsDLQ",
+            retention_period=Duration.days(14),
+        )
+        # a message stays invisible while it waits in the batching window and then for the retries of
+        # the lambda, the visibility timeout must be at least 6 times the lambda timeout plus the window
+        lambda_timeout = 30
+        landing_events = sqs.Queue(self, "RssFeedProcessorLandingEvents",
+            visibility_timeout=Duration.seconds(6 * lambda_timeout + batch_window),
+            retention_period=Duration.days(4),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=50, queue=dead_letter_queue),
+        )
+
+        landing_prefix = "landing_parquet/" if input_format == "parquet" else "landing/"
         # event bridge rule to launch glue workflow via lambda trigger 
         rule = events.Rule(self, "RssFeedProcessorEventBridgeToGlueWorkflowRule",
             description="Start an AWS Glue workflow upon new file arrival in an Amazon S3 bucket",
@@ -180,7 +404,9 @@ class ProcessorStack(Stack):
                         "name": [bucket_name]
                         },
                     "object": {
-                        "key": [{ "prefix": "landing" }]
+                        # only the landing objects of the table the job reads, the trailing slash keeps
+                        # landing/ and landing_parquet/ apart
+                        "key": [{ "prefix": landing_prefix }]
                     }
                 }
             ),
@@ -194,6 +420,15 @@ class ProcessorStack(Stack):
             ]
         )
 
+        # batch manifests, the lambda removes the manifest of a batch that could not start a run
+        lambda_target_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["s3:PutObject", "s3:DeleteObject"],
+                resources=[f"arn:aws:s3:::{bucket_name}/state/batches/*"]
+            )
+        )
+
         lambda_target_role.add_to_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
@@ -206,19 +441,37 @@ class ProcessorStack(Stack):
             )
         )
 
+        # the lambda is bundled with the shared modules it imports, the asset hash covers them too
         lambda_target = _lambda.Function(self, "RssFeedProcessorLambdaTarget",
             runtime=_lambda.Runtime.PYTHON_3_9,
             role=lambda_target_role,
-            code=_lambda.Code.from_asset("lambda"),
+            code=_lambda.Code.from_asset("lambda",
+                asset_hash_type=AssetHashType.OUTPUT,
+                bundling=BundlingOptions(
+                    image=_lambda.Runtime.PYTHON_3_9.bundling_image,
+                    local=CopyFiles([
+                        "lambda/lambda_function.py",
+                        f"{COMMON_UTILITIES}/aws_clients.py",
+                        f"{COMMON_UTILITIES}/metrics.py",
+                    ]),
+                ),
+            ),
             handler="lambda_function.lambda_handler",
-            timeout=Duration.seconds(15),
+            timeout=Duration.seconds(lambda_timeout),
+            # one batch at a time, the workflow only runs one batch at a time anyway
+            reserved_concurrent_executions=1,
             environment={
-                'GLUE_WORKFLOW_NAME': workflow.name
+                'GLUE_WORKFLOW_NAME': workflow.name,
+                'MANIFEST_PREFIX': 'state/batches/',
             }
         )
 
         # add target to event bridge rule
-        rule.add_target(targets.LambdaFunction(lambda_target))
+        rule.add_target(targets.SqsQueue(landing_events))
+        lambda_target.add_event_source(lambda_event_sources.SqsEventSource(landing_events,
+            batch_size=batch_size,
+            max_batching_window=Duration.seconds(batch_window),
+        ))
          
 
         
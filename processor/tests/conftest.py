@@ -0,0 +1,9 @@
+import os
+import sys
+
+PROCESSOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the Glue job is deployed from assets/script.py, make it importable as the 'script' module
+sys.path.insert(0, os.path.join(PROCESSOR_DIR, "assets"))
+# local stand-ins for the AWS clients
+sys.path.insert(0, os.path.join(os.path.dirname(PROCESSOR_DIR), "benchmarks"))
@@ -0,0 +1,51 @@
+import pandas as pd
+
+from local_aws import LocalS3Client, local_boto3
+from script import aggregate_announcements, load_aggregates, store_aggregates
+import aws_clients
+
+
+def exploded(ids, dates):
+    return pd.DataFrame({
+        'id': ids,
+        'product': ['p1', 'p2', 'p1', 'p1'][:len(ids)],
+        'category': ['c1'] * len(ids),
+        'published_at': pd.to_datetime(dates),
+    })
+
+
+def update_aggregates(df, incremental):
+    store_aggregates('bucket', aggregate_announcements(df), incremental)
+
+
+def test_counts_by_week_and_month():
+    df = exploded(['a', 'a', 'b', 'b'], ['2022-09-15', '2022-09-15', '2022-09-19', '2022-09-19'])
+
+    counts = aggregate_announcements(df).set_index(['period_type', 'period_start', 'product'])['announcements']
+
+    # 2022-09-15 is a thursday, 2022-09-19 a monday
+    assert counts.to_dict() == {
+        ('week', '2022-09-12', 'p1'): 1,
+        ('week', '2022-09-12', 'p2'): 1,
+        ('week', '2022-09-19', 'p1'): 1,
+        ('month', '2022-09-01', 'p1'): 2,
+        ('month', '2022-09-01', 'p2'): 1,
+    }
+
+
+def test_incremental_runs_add_to_the_stored_counts(tmp_path):
+    s3 = LocalS3Client(str(tmp_path))
+    aws_clients.reset_clients()
+    with local_boto3({'s3': s3}):
+        update_aggregates(exploded(['a', 'b'], ['2022-09-15', '2022-09-16']), incremental=False)
+        update_aggregates(exploded(['c'], ['2022-09-30']), incremental=True)
+        aggregates = load_aggregates('bucket')
+        # a full run starts over
+        update_aggregates(exploded(['c'], ['2022-09-30']), incremental=False)
+        rebuilt = load_aggregates('bucket')
+    aws_clients.reset_clients()
+
+    months = aggregates.query("period_type == 'month'").set_index('product')['announcements']
+    assert months.to_dict() == {'p1': 2, 'p2': 1}
+    assert len(aggregates.query("period_type == 'week'")) == 3
+    assert rebuilt['announcements'].sum() == 2
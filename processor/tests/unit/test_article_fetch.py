@@ -0,0 +1,104 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from article_fetch import extract_text, fetch_articles
+
+PAGE = """<html><head><title>t</title><script>var x = 1;</script></head><body>
+<nav>Products Solutions Pricing</nav>
+<main><h1>Amazon S3 adds {n}</h1><p>Full   announcement
+text {n}.</p><footer>Share</footer></main>
+</body></html>"""
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        PageHandler.requests.append((self.path, self.headers.get('If-None-Match')))
+        n = self.path.rsplit('/', 1)[-1]
+        if n == 'missing':
+            self.send_error(404)
+            return
+        if n == 'truncated':
+            # the connection closes before the announced length is sent
+            self.send_response(200)
+            self.send_header('Content-Length', '1000')
+            self.end_headers()
+            self.wfile.write(b'<html><main><p>Part')
+            self.close_connection = True
+            return
+        charset = 'x-unknown' if n == 'charset' else 'utf-8'
+        etag = f'"{n}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = PAGE.format(n=n).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', f'text/html; charset={charset}')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    PageHandler.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_extract_text_keeps_the_main_content():
+    assert extract_text(PAGE.format(n=1)) == "Amazon S3 adds 1\nFull announcement text 1."
+    assert extract_text("<p>a <b>b</b></p><script>x</script><p>c</p>") == "a b\nc"
+
+
+def test_pages_are_fetched_once_across_runs(server, tmp_path):
+    urls = [f"{server}/pages/{n}" for n in range(5)] + [f"{server}/pages/missing"]
+    cache = str(tmp_path / "cache.sqlite")
+
+    texts, stats = fetch_articles(urls + urls[:2], cache, rate_per_host=0)
+    assert texts[urls[3]] == "Amazon S3 adds 3\nFull announcement text 3."
+    assert texts[urls[-1]] == ''
+    assert (stats['urls'], stats['misses'], stats['hits'], stats['errors']) == (6, 5, 0, 1)
+
+    _, stats = fetch_articles(urls, cache, rate_per_host=0)
+    # only the failed url is requested again
+    assert (stats['hits'], stats['requests'], stats['hit_ratio']) == (5, 0, 5 / 6)
+
+    _, stats = fetch_articles(urls[:2], cache, rate_per_host=0, revalidate=True)
+    assert (stats['hits'], stats['requests']) == (2, 2)
+    assert PageHandler.requests[-1][1] is not None
+
+
+def test_requests_to_a_host_are_rate_limited(server, tmp_path):
+    urls = [f"{server}/pages/{n}" for n in range(6)]
+
+    start = time.perf_counter()
+    _, stats = fetch_articles(urls, str(tmp_path / "cache.sqlite"), rate_per_host=20)
+
+    # 6 requests spaced by 50 ms
+    assert time.perf_counter() - start >= 0.25
+    assert stats['misses'] == 6
+    assert stats['pages_per_second'] <= 24
+
+
+def test_unknown_charsets_and_truncated_pages_only_affect_their_url(server, tmp_path):
+    urls = [f"{server}/pages/charset", f"{server}/pages/truncated", f"{server}/pages/1"]
+
+    texts, stats = fetch_articles(urls, str(tmp_path / "cache.sqlite"), rate_per_host=0)
+
+    assert texts[urls[0]] == "Amazon S3 adds charset\nFull announcement text charset."
+    assert texts[urls[1]] == ''
+    assert texts[urls[2]] == "Amazon S3 adds 1\nFull announcement text 1."
+    assert (stats['misses'], stats['errors']) == (2, 1)
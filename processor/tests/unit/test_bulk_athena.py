@@ -0,0 +1,168 @@
+import pandas as pd
+
+from local_aws import LocalAthenaClient, LocalS3Client, PagedResultsConnection
+from athena_queries import build_query, date_shards, landing_date_range, partition_predicate
+from script import athena_landing_source, cleanup_data, list_object_keys
+
+COLUMNS = ['id', 'services', 'title', 'link', 'date', 'description']
+
+
+def landing_file(rows):
+    lines = ["id;category;title;link;published;summary"]
+    lines += [f"id{i};general:products/amazon-s3;title {i};https://aws.amazon.com/{i};"
+              f"Thu, 15 Sep 2022 17:37:29 +0000;\"summary; {i}\"" for i in rows]
+    return "\n".join(lines) + "\n"
+
+
+def read_landing(table, athena, s3, **kwargs):
+    """ all the chunks of an athena_landing_source in one DataFrame """
+    return pd.concat(list(athena_landing_source('bucket', 'aws_feed', table, athena=athena, s3=s3, **kwargs)()),
+                     ignore_index=True)
+
+
+def local_athena(tmp_path):
+    s3 = LocalS3Client(str(tmp_path))
+    s3.put_object(Bucket='bucket', Key='landing/2022-09-15T00:02:00_feed.csv', Body=landing_file(range(0, 3)))
+    s3.put_object(Bucket='bucket', Key='landing/2022-09-16T00:02:00_feed.csv', Body=landing_file(range(3, 5)))
+    athena = LocalAthenaClient(s3)
+    athena.register_landing_table('aws_feed', 'aws_feed_landing', 'bucket', 'landing/', COLUMNS)
+    return s3, athena
+
+
+def test_bulk_fetch_matches_paged_cursor(tmp_path):
+    s3, athena = local_athena(tmp_path)
+
+    bulk = read_landing('aws_feed_landing', athena, s3)
+    paged = pd.read_sql(build_query('aws_feed', 'aws_feed_landing'),
+                        PagedResultsConnection(athena, 's3://bucket/athena_output/'))
+
+    assert bulk.columns.tolist() == COLUMNS + ['source_file']
+    assert len(bulk) == 5
+    assert bulk.loc[0, 'description'] == 'summary; 0'
+    assert bulk.astype(str).values.tolist() == paged.astype(str).values.tolist()
+
+
+def test_watermark_reads_only_newer_objects(tmp_path):
+    s3, athena = local_athena(tmp_path)
+
+    df = read_landing('aws_feed_landing', athena, s3, after_file='2022-09-15T00:02:00_feed.csv')
+
+    assert df['id'].tolist() == ['id3', 'id4']
+    assert set(df['source_file']) == {'2022-09-16T00:02:00_feed.csv'}
+
+
+def test_manifest_paths_select_exactly_those_objects(tmp_path):
+    s3, athena = local_athena(tmp_path)
+
+    df = read_landing('aws_feed_landing', athena, s3, paths=['s3://bucket/landing/2022-09-16T00:02:00_feed.csv'])
+
+    assert df['id'].tolist() == ['id3', 'id4']
+    assert build_query('aws_feed', 'aws_feed_landing', paths=[]).endswith("WHERE false")
+
+
+def test_chunked_source_reads_the_result_file_again_without_a_new_query(tmp_path):
+    s3, athena = local_athena(tmp_path)
+
+    source = athena_landing_source('bucket', 'aws_feed', 'aws_feed_landing', chunk_rows=2, athena=athena, s3=s3)
+    chunks = list(source())
+    ids = list(source(['id', 'source_file']))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert pd.concat(chunks)['id'].tolist() == [f"id{i}" for i in range(5)]
+    assert ids[0].columns.tolist() == ['id', 'source_file']
+    assert len(athena.executions) == 1
+
+
+def daily_landing(tmp_path, days=10, rows_per_day=3, partitioned=False, **athena_args):
+    """ one landing object per day, in the csv table or in the date partitions of the parquet table """
+    s3 = LocalS3Client(str(tmp_path))
+    columns = COLUMNS + ['year', 'month', 'day'] if partitioned else COLUMNS
+    for day in range(1, days + 1):
+        rows = range((day - 1) * rows_per_day, day * rows_per_day)
+        body = landing_file(rows)
+        if partitioned:
+            body = "\n".join(line + f";2022;09;{day:02d}" for line in body.splitlines()) + "\n"
+            key = f'landing_parquet/year=2022/month=09/day={day:02d}/part.csv'
+        else:
+            key = f'landing/2022-09-{day:02d}T00:02:00_feed.csv'
+        s3.put_object(Bucket='bucket', Key=key, Body=body)
+    athena = LocalAthenaClient(s3, **athena_args)
+    table = 'aws_feed_landing_parquet' if partitioned else 'aws_feed_landing'
+    athena.register_landing_table('aws_feed', table, 'bucket', 'landing_parquet/' if partitioned else 'landing/', columns)
+    return s3, athena, table
+
+
+def test_date_shards_cover_the_range_without_overlap():
+    assert date_shards('2022-09-01', '2022-09-10', 3) == [
+        ('2022-09-01', '2022-09-03'), ('2022-09-04', '2022-09-06'), ('2022-09-07', '2022-09-10')
+    ]
+    assert date_shards('2022-09-01', '2022-09-02', 8) == [('2022-09-01', '2022-09-01'), ('2022-09-02', '2022-09-02')]
+
+
+def test_sharded_read_matches_one_query_and_limits_concurrency(tmp_path):
+    s3, athena, table = daily_landing(tmp_path, query_seconds=0.05)
+    # an object whose name does not start with a date is still read, by an open ended shard
+    s3.put_object(Bucket='bucket', Key='landing/backfill.csv', Body=landing_file(range(100, 102)))
+    athena.register_landing_table('aws_feed', table, 'bucket', 'landing/', COLUMNS)
+
+    single = read_landing(table, athena, s3)
+    sharded = read_landing(table, athena, s3, shards=5, concurrency=2)
+
+    assert landing_date_range(list_object_keys('bucket', 'landing/', s3)) == ('2022-09-01', '2022-09-10')
+    assert len(athena.executions) == 1 + 5
+    assert athena.max_running == 2
+    assert sorted(sharded['id']) == sorted(single['id'])
+    assert len(sharded) == 32
+
+
+def test_sharded_source_reads_the_partitions_of_each_shard(tmp_path):
+    s3, athena, table = daily_landing(tmp_path, partitioned=True)
+
+    source = athena_landing_source('bucket', 'aws_feed', table, chunk_rows=4, athena=athena, s3=s3,
+                                   shards=3, input_format='parquet')
+    first = pd.concat(list(source()))
+    second = pd.concat(list(source(['id', 'source_file'])))
+
+    assert len(athena.executions) == 3
+    assert sorted(first['id'], key=lambda value: int(value[2:])) == [f"id{i}" for i in range(30)]
+    # every pass reads the shards in the same order, so dedup masks line up with later passes
+    assert first['id'].tolist() == second['id'].tolist()
+    assert 'year' not in first.columns
+
+
+def test_date_bounded_read_only_reads_the_partitions_of_the_range(tmp_path):
+    s3, athena, table = daily_landing(tmp_path, partitioned=True)
+
+    source = athena_landing_source('bucket', 'aws_feed', table, '2022-09-03', '2022-09-05', athena=athena, s3=s3,
+                                   input_format='parquet')
+    df = pd.concat(list(source()))
+
+    assert sorted(df['id'], key=lambda value: int(value[2:])) == [f"id{i}" for i in range(6, 15)]
+    assert len(athena.executions) == 1
+    assert build_query('aws_feed', table, '2022-09-03', '2022-09-05').endswith(
+        "WHERE ((year = '2022' AND month = '09' AND day IN ('03', '04', '05')))")
+    # a range across months lists the days of every month
+    assert partition_predicate('2022-09-30', '2022-10-01') == (
+        "(year = '2022' AND month = '09' AND day IN ('30')) OR (year = '2022' AND month = '10' AND day IN ('01'))")
+
+
+def test_empty_and_null_like_strings_are_kept_like_the_cursor_read(tmp_path):
+    s3 = LocalS3Client(str(tmp_path))
+    lines = ["id;category;title;link;published;summary",
+             "id0;general:products/amazon-s3;title 0;https://aws.amazon.com/0;Thu, 15 Sep 2022 17:37:29 +0000;",
+             "id1;general:products/amazon-s3;NA;https://aws.amazon.com/1;Thu, 15 Sep 2022 17:37:29 +0000;null",
+             "id2;general:products/amazon-s3;title 2;https://aws.amazon.com/2;Thu, 15 Sep 2022 17:37:29 +0000;\"\""]
+    s3.put_object(Bucket='bucket', Key='landing/2022-09-15T00:02:00_feed.csv', Body="\n".join(lines) + "\n")
+    athena = LocalAthenaClient(s3)
+    athena.register_landing_table('aws_feed', 'aws_feed_landing', 'bucket', 'landing/', COLUMNS)
+
+    bulk = read_landing('aws_feed_landing', athena, s3)
+    chunks = read_landing('aws_feed_landing', athena, s3, chunk_rows=2)
+    paged = pd.read_sql(build_query('aws_feed', 'aws_feed_landing'),
+                        PagedResultsConnection(athena, 's3://bucket/athena_output/'))
+
+    assert bulk['description'].tolist() == ['', 'null', '']
+    assert bulk.loc[1, 'title'] == 'NA'
+    expected = cleanup_data(paged)
+    for df in (bulk, chunks):
+        assert cleanup_data(df)[COLUMNS].values.tolist() == expected[COLUMNS].values.tolist()
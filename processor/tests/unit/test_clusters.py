@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from minhash import MinHashIndex, minhash_signatures, shingle_hashes
+from script import local_main, CLUSTER_INDEX_KEY
+
+LAUNCH = ("Amazon EC2 M7g instances are now available in the AWS {region} Region. M7g instances are powered by "
+          "AWS Graviton3 processors and deliver up to 25% better price performance than M6g instances for "
+          "general purpose workloads such as application servers, microservices and mid-size data stores.")
+OTHER = [
+    "Amazon S3 now supports conditional writes that check for the existence of an object before creating it.",
+    "AWS Lambda adds support for Python 3.12 as a managed runtime and a container base image.",
+    "Amazon Aurora PostgreSQL zero-ETL integration with Amazon Redshift is now generally available.",
+]
+REGIONS = ["Europe (Paris)", "Asia Pacific (Tokyo)", "South America (Sao Paulo)", "Canada (Central)"]
+
+
+def test_signatures_estimate_the_shingle_similarity():
+    hashes, counts = shingle_hashes(["one two three four", "Two", "", None])
+    assert counts.tolist() == [2, 1, 0, 0]
+    assert len(hashes) == 3
+
+    signatures = minhash_signatures([LAUNCH.format(region=REGIONS[0]), LAUNCH.format(region=REGIONS[1])] + OTHER)
+    assert signatures.shape == (5, 64)
+    assert (signatures[0] == signatures[1]).mean() > 0.7
+    assert (signatures[0] == signatures[2]).mean() < 0.2
+
+
+def test_region_variants_share_a_cluster():
+    texts = [LAUNCH.format(region=region) for region in REGIONS] + OTHER + [""]
+    ids = np.array([f"id{i}" for i in range(len(texts))], dtype=object)
+
+    clusters = MinHashIndex().assign(ids, texts)
+
+    assert len(set(clusters[:4])) == 1
+    assert len(set(clusters[4:])) == 4
+    assert clusters[0] not in clusters[4:]
+
+
+def test_new_entries_are_matched_against_the_stored_signatures():
+    index = MinHashIndex()
+    first = index.assign(np.array(["a", "b"], dtype=object), [LAUNCH.format(region=REGIONS[0]), OTHER[0]])
+    stored = MinHashIndex.from_bytes(index.to_bytes())
+    assert not stored.changed
+
+    # known entries keep their cluster without a new signature, even with another text
+    again = stored.assign(np.array(["b", "a"], dtype=object), ["changed", "changed"])
+    assert again.tolist() == first[::-1].tolist()
+    assert not stored.changed
+
+    new = stored.assign(np.array(["c", "d"], dtype=object), [LAUNCH.format(region=REGIONS[2]), OTHER[1]])
+    assert new[0] == first[0]
+    assert new[1] not in first
+    assert len(stored) == 4 and stored.changed
+
+
+def test_cluster_column_in_the_local_report(tmp_path):
+    directory = tmp_path / "landing"
+    directory.mkdir()
+    lines = ["id;category;title;link;published;summary"]
+    lines += [f"id{i};general:products/amazon-ec2;M7g in {region};https://aws.amazon.com/{i};"
+              f"Thu, 15 Sep 2022 17:37:29 +0000;{LAUNCH.format(region=region)}" for i, region in enumerate(REGIONS)]
+    lines += [f"other{i};general:products/other;Other {i};https://aws.amazon.com/other{i};"
+              f"Thu, 15 Sep 2022 17:37:29 +0000;{text}" for i, text in enumerate(OTHER)]
+    (directory / "2022-09-15T00:02:00_feed.csv").write_text("\n".join(lines) + "\n")
+    output = str(tmp_path / "out")
+
+    local_main(["--local-input", str(directory), "--local-output", output, "--clusters", "true", "--chunk_rows", "3"])
+
+    report_dir = os.path.join(output, "processed")
+    name = next(name for name in os.listdir(report_dir) if name.startswith("report_"))
+    report = pd.read_csv(os.path.join(report_dir, name), sep=';', dtype=str)
+    clusters = report.groupby('id')['cluster_id'].first()
+    assert clusters[[f"id{i}" for i in range(4)]].nunique() == 1
+    assert clusters.nunique() == 4
+    assert os.path.exists(os.path.join(output, CLUSTER_INDEX_KEY))
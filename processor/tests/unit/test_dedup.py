@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from script import dedup_mask, iter_frame_chunks
+
+
+def source(df, chunk_rows=2):
+    return lambda columns=None, stats=None: iter_frame_chunks(df if columns is None else df[columns], chunk_rows)
+
+
+def test_keeps_the_row_of_the_newest_landing_file():
+    df = pd.DataFrame({
+        'id': ['a', 'b', 'a', 'c', 'a'],
+        'title': ['a new', 'b', 'a old', 'c', 'a older'],
+        'source_file': ['2022-09-16T00:02:00_feed.csv', '2022-09-16T00:02:00_feed.csv',
+                        '2022-09-15T00:02:00_feed.csv', '2022-09-15T00:02:00_feed.csv',
+                        '2022-09-14T00:02:00_feed.csv'],
+    })
+
+    mask, removed, files = dedup_mask(source(df))
+
+    assert removed == 2
+    # rows keep their order
+    assert df[mask]['title'].tolist() == ['a new', 'b', 'c']
+    assert files == ['2022-09-14T00:02:00_feed.csv', '2022-09-15T00:02:00_feed.csv', '2022-09-16T00:02:00_feed.csv']
+
+
+def test_within_a_landing_file_the_last_row_wins():
+    df = pd.DataFrame({'id': ['a', 'a', 'b'], 'title': ['1', '2', '3'], 'source_file': ['f.csv'] * 3})
+
+    mask, removed, _ = dedup_mask(source(df))
+
+    assert removed == 1
+    assert df[mask]['title'].tolist() == ['2', '3']
+
+
+def test_an_empty_source_keeps_nothing():
+    mask, removed, files = dedup_mask(source(pd.DataFrame(columns=['id', 'source_file'])))
+
+    assert mask.dtype == np.bool_ and len(mask) == 0
+    assert (removed, files) == (0, [])
@@ -0,0 +1,20 @@
+from end_to_end import run_pipeline
+
+
+def test_pipeline_runs_offline(tmp_path):
+    results = {result['stage']: result for result in run_pipeline(str(tmp_path), 200, parse_mode='stream', trace_memory=False)}
+
+    assert [stage for stage in results if not stage.startswith(' ')] == [
+        'collector', 'collector_rerun', 'trigger', 'query', 'pipeline', 'save_aggregates', 'notify'
+    ]
+    # stage metrics of the collector
+    assert results['  fetch']['rows'] == 200
+    assert results['  upload']['bytes'] > 0
+    # stage metrics of the processor pipeline
+    assert results['pipeline']['rows'] == 200
+    assert results['  dedup']['rows'] == 200
+    assert results['  read']['bytes'] > 0
+    # 1 to 3 products x 1 to 2 categories per entry
+    assert results['pipeline']['output_rows'] > 200
+    assert results['  save']['rows'] == results['pipeline']['output_rows']
+    assert results['save_aggregates']['rows'] > 0
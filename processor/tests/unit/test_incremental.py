@@ -0,0 +1,181 @@
+import io
+import itertools
+import json
+import sys
+import types
+
+import pandas as pd
+import pytest
+
+import script
+# importable once script has added the modules shared with the collector to the path
+import aws_clients
+from local_aws import LocalAthenaClient, LocalClientError, LocalGlueClient, LocalS3Client, LocalSNSClient, local_boto3
+from script import AGGREGATES_KEY, CONSOLIDATED_REPORT_KEY, DELTA_PREFIX, WATERMARK_KEY
+
+COLUMNS = ['id', 'services', 'title', 'link', 'date', 'description']
+ARGS = ['script.py', '--bucket', 'bucket', '--topic_arn', 'arn:aws:sns:us-east-1:000000000000:local',
+        '--database', 'aws_feed', '--table', 'aws_feed_landing', '--mode', 'incremental', '--compact_every', '3',
+        '--aggregates', 'false']
+
+
+def get_resolved_options(argv, names):
+    """ getResolvedOptions of the Glue runtime, for --name value arguments, the last one wins like in argparse """
+    return {name: argv[len(argv) - argv[::-1].index(f'--{name}')] for name in names}
+
+
+class FailingS3(LocalS3Client):
+    """ Fails the uploads of keys under fail_prefix """
+    fail_prefix = None
+
+    def _check(self, key):
+        if self.fail_prefix and key.startswith(self.fail_prefix):
+            raise LocalClientError('InternalError', f"Upload of {key} failed")
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        self._check(Key)
+        return super().put_object(Bucket=Bucket, Key=Key, Body=Body, **kwargs)
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._check(Key)
+        return super().complete_multipart_upload(Bucket=Bucket, Key=Key, UploadId=UploadId, MultipartUpload=MultipartUpload)
+
+
+@pytest.fixture
+def glue_job(tmp_path, monkeypatch):
+    """
+    Returns run(day, ids), which lands a collector file and runs the Glue job once (with the optional
+    extra job arguments), the S3 and the Glue stand-ins
+    """
+    utils = types.ModuleType('awsglue.utils')
+    utils.getResolvedOptions = get_resolved_options
+    monkeypatch.setitem(sys.modules, 'awsglue', types.ModuleType('awsglue'))
+    monkeypatch.setitem(sys.modules, 'awsglue.utils', utils)
+    # one delta report per run, even within the same second
+    runs = itertools.count()
+    monkeypatch.setattr(script, 'current_date', lambda: f"2022-09-30T00:00:{next(runs):02d}")
+
+    s3 = FailingS3(str(tmp_path))
+    athena = LocalAthenaClient(s3)
+    glue = LocalGlueClient()
+
+    def run(day, ids, args=()):
+        lines = ["id;category;title;link;published;summary"]
+        lines += [f"id{i};general:products/amazon-s3;title {i};https://aws.amazon.com/{i};"
+                  f"Thu, {day:02d} Sep 2022 17:37:29 +0000;summary {i}" for i in ids]
+        s3.put_object(Bucket='bucket', Key=f'landing/2022-09-{day:02d}T00:02:00_feed.csv', Body="\n".join(lines) + "\n")
+        athena.register_landing_table('aws_feed', 'aws_feed_landing', 'bucket', 'landing/', COLUMNS)
+        aws_clients.reset_clients()
+        with local_boto3({'s3': s3, 'athena': athena, 'sns': LocalSNSClient(), 'glue': glue}):
+            script.main(ARGS + list(args))
+        aws_clients.reset_clients()
+
+    return run, s3, glue
+
+
+def keys(s3, prefix):
+    return [item['Key'] for item in s3.list_objects_v2(Bucket='bucket', Prefix=prefix).get('Contents', [])]
+
+
+def read_report(s3, key):
+    return pd.read_csv(s3.get_object(Bucket='bucket', Key=key)['Body'], sep=';', dtype=str)
+
+
+def watermark(s3):
+    return json.loads(s3.get_object(Bucket='bucket', Key=WATERMARK_KEY)['Body'].read())['last_file']
+
+
+def test_delta_reports_are_compacted_every_n_runs(glue_job):
+    run, s3, _ = glue_job
+
+    run(1, range(0, 3))
+    run(2, range(3, 5))
+    deltas = keys(s3, DELTA_PREFIX)
+    assert len(deltas) == 2
+    # every delta only holds the entries of its run
+    assert sorted(read_report(s3, deltas[1])['id']) == ['id3', 'id4']
+    assert watermark(s3) == '2022-09-02T00:02:00_feed.csv'
+    assert not keys(s3, CONSOLIDATED_REPORT_KEY)
+
+    run(3, range(5, 6))
+    assert keys(s3, DELTA_PREFIX) == []
+    report = read_report(s3, CONSOLIDATED_REPORT_KEY)
+    assert sorted(report['id'], key=lambda value: int(value[2:])) == [f"id{i}" for i in range(6)]
+
+    run(4, range(6, 8))
+    assert len(keys(s3, DELTA_PREFIX)) == 1
+    assert watermark(s3) == '2022-09-04T00:02:00_feed.csv'
+
+
+def test_the_watermark_stays_when_the_report_write_fails(glue_job):
+    run, s3, _ = glue_job
+    run(1, range(0, 3))
+
+    s3.fail_prefix = DELTA_PREFIX
+    with pytest.raises(Exception):
+        run(2, range(3, 5))
+    assert watermark(s3) == '2022-09-01T00:02:00_feed.csv'
+    assert len(keys(s3, DELTA_PREFIX)) == 1
+
+    # the next run processes the objects of the failed one again
+    s3.fail_prefix = None
+    run(3, range(5, 6))
+    assert sorted(read_report(s3, keys(s3, DELTA_PREFIX)[-1])['id']) == ['id3', 'id4', 'id5']
+    assert watermark(s3) == '2022-09-03T00:02:00_feed.csv'
+
+
+def test_the_batch_manifest_is_removed_after_its_run(glue_job):
+    run, s3, glue = glue_job
+    run(1, range(0, 3))
+
+    s3.put_object(Bucket='bucket', Key='state/batches/1.json',
+                  Body=json.dumps({'bucket': 'bucket', 'keys': ['landing/2022-09-02T00:02:00_feed.csv']}))
+    run_id = glue.start_workflow_run(Name='workflow', RunProperties={'manifest': 's3://bucket/state/batches/1.json'})['RunId']
+    run(2, range(3, 5), ['--WORKFLOW_NAME', 'workflow', '--WORKFLOW_RUN_ID', run_id])
+
+    assert sorted(read_report(s3, keys(s3, DELTA_PREFIX)[-1])['id']) == ['id3', 'id4']
+    assert keys(s3, 'state/batches/') == []
+
+
+def test_the_objects_of_a_failed_batch_are_processed_with_the_next_batch(glue_job):
+    run, s3, glue = glue_job
+    run(1, range(0, 3))
+
+    def batch_run(day, ids, manifest):
+        s3.put_object(Bucket='bucket', Key=f'state/batches/{manifest}.json',
+                      Body=json.dumps({'bucket': 'bucket', 'keys': [f'landing/2022-09-{day:02d}T00:02:00_feed.csv']}))
+        run_id = glue.start_workflow_run(Name='workflow', RunProperties={'manifest': f's3://bucket/state/batches/{manifest}.json'})['RunId']
+        run(day, ids, ['--WORKFLOW_NAME', 'workflow', '--WORKFLOW_RUN_ID', run_id])
+
+    s3.fail_prefix = DELTA_PREFIX
+    with pytest.raises(Exception):
+        batch_run(2, range(3, 5), '2022-09-02T00:05:00_a')
+    assert keys(s3, 'state/batches/') == ['state/batches/2022-09-02T00:05:00_a.json']
+
+    s3.fail_prefix = None
+    batch_run(3, range(5, 6), '2022-09-03T00:05:00_b')
+    assert sorted(read_report(s3, keys(s3, DELTA_PREFIX)[-1])['id']) == ['id3', 'id4', 'id5']
+    assert keys(s3, 'state/batches/') == []
+    assert watermark(s3) == '2022-09-03T00:02:00_feed.csv'
+
+
+def read_aggregates(s3):
+    aggregates = pd.read_parquet(io.BytesIO(s3.get_object(Bucket='bucket', Key=AGGREGATES_KEY)['Body'].read()))
+    return aggregates.query("period_type == 'month'").set_index('product')['announcements'].to_dict()
+
+
+def test_a_rerun_after_the_counts_were_stored_does_not_count_them_again(glue_job):
+    run, s3, glue = glue_job
+    aggregates = ['--aggregates', 'true']
+    run(1, range(0, 3), aggregates)
+
+    # the counts of the second run are stored, the watermark is not
+    s3.fail_prefix = WATERMARK_KEY
+    with pytest.raises(Exception):
+        run(2, range(3, 5), aggregates)
+    assert read_aggregates(s3) == {'amazon-s3': 5}
+
+    s3.fail_prefix = None
+    run(3, range(5, 6), aggregates)
+    assert read_aggregates(s3) == {'amazon-s3': 6}
+    assert watermark(s3) == '2022-09-03T00:02:00_feed.csv'
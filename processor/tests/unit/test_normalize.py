@@ -0,0 +1,29 @@
+import pandas as pd
+
+from script import enrich_data, explode, normalize
+
+
+def enriched():
+    df = pd.DataFrame({
+        'id': ['a', 'b'],
+        'services': [
+            "general:products/p1,general:products/p2,general:products/p3,"
+            "marketing:marchitecture/c1,marketing:marchitecture/c2",
+            "marketing:marchitecture/c3",
+        ],
+        'title': ['A', 'B'],
+        'link': ['https://a', 'https://b'],
+        'date': ['Thu, 15 Sep 2022 17:37:29 +0000'] * 2,
+        'description': ['text a', 'text b'],
+    })
+    return enrich_data(df)
+
+
+def test_normalized_rows_grow_linearly_with_tags():
+    entries, products, categories = normalize(enriched())
+
+    assert entries['id'].tolist() == ['a', 'b']
+    assert products.values.tolist() == [['a', 'p1'], ['a', 'p2'], ['a', 'p3']]
+    assert categories.values.tolist() == [['a', 'c1'], ['a', 'c2'], ['b', 'c3']]
+    # the exploded layout has products x categories rows for the same entry
+    assert len(explode(enriched()).query("id == 'a'")) == 6
@@ -0,0 +1,104 @@
+import os
+
+import pandas as pd
+
+from script import cleanup_data, enrich_data, explode, local_main, REPORT_COLUMNS, AGGREGATES_KEY
+
+
+def landing_file(path, ids, title):
+    lines = ["id;category;title;link;published;summary"]
+    lines += [f"id{i};general:products/p{i % 3},general:products/p{i % 5},marketing:marchitecture/c{i % 2};"
+              f"{title} {i};https://aws.amazon.com/{i};Thu, {10 + i % 15} Sep 2022 17:37:29 +0000;summary {i}"
+              for i in ids]
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def landing(tmp_path):
+    directory = tmp_path / "landing"
+    directory.mkdir()
+    landing_file(directory / "2022-09-15T00:02:00_feed.csv", range(0, 60), "old")
+    # ids 40 to 59 again, with new titles
+    landing_file(directory / "2022-09-16T00:02:00_feed.csv", range(40, 100), "new")
+    return str(directory)
+
+
+def in_memory_report(directory):
+    frames = [
+        pd.read_csv(os.path.join(directory, name), sep=';', header=0, dtype=str, keep_default_na=False,
+                    names=['id', 'services', 'title', 'link', 'date', 'description']).assign(source_file=name)
+        for name in sorted(os.listdir(directory))
+    ]
+    # the newest landing file wins, files are read in name order
+    df = pd.concat(frames, ignore_index=True).drop_duplicates('id', keep='last').sort_index()
+    return explode(enrich_data(cleanup_data(df)))[REPORT_COLUMNS]
+
+
+def read_report(output):
+    directory = os.path.join(output, "processed")
+    name = next(name for name in os.listdir(directory) if name.startswith("report_"))
+    return pd.read_csv(os.path.join(directory, name), sep=';', dtype=str, keep_default_na=False)
+
+
+def test_chunked_pipeline_matches_the_in_memory_one(tmp_path):
+    directory = landing(tmp_path)
+    expected = in_memory_report(directory)
+
+    for workers in (1, 2):
+        output = str(tmp_path / f"out{workers}")
+        result = local_main(["--local-input", directory, "--local-output", output,
+                             "--chunk_rows", "7", "--workers", str(workers)])
+
+        assert result['rows'] == 100
+        assert result['duplicates'] == 20
+        assert read_report(output).values.tolist() == expected.values.tolist()
+        assert os.path.exists(os.path.join(output, AGGREGATES_KEY))
+
+
+def test_normalized_gzip_output(tmp_path):
+    output = str(tmp_path / "out")
+    local_main(["--local-input", landing(tmp_path), "--local-output", output, "--report_layout", "normalized",
+                "--compression", "gzip", "--chunk_rows", "16", "--aggregates", "false"])
+
+    entries = pd.read_csv(next((tmp_path / "out" / "processed" / "normalized" / "entries").iterdir()), sep=';')
+    assert sorted(entries['id']) == sorted(f"id{i}" for i in range(100))
+    assert entries.set_index('id').loc['id45', 'title'] == 'new 45'
+
+
+def test_articles_column_from_the_linked_pages(tmp_path):
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = f"<html><nav>menu</nav><main><p>Full text of {self.path}</p></main></html>".encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    directory = tmp_path / "landing"
+    directory.mkdir()
+    landing_file(directory / "2022-09-15T00:02:00_feed.csv", range(0, 10), "title")
+    text = (directory / "2022-09-15T00:02:00_feed.csv").read_text()
+    (directory / "2022-09-15T00:02:00_feed.csv").write_text(
+        text.replace("https://aws.amazon.com/", f"http://127.0.0.1:{httpd.server_address[1]}/")
+    )
+    try:
+        output = str(tmp_path / "out")
+        args = ["--local-input", str(directory), "--local-output", output, "--articles", "true", "--article_rate", "0"]
+        first = local_main(args)
+        second = local_main(args)
+    finally:
+        httpd.shutdown()
+
+    report = read_report(output)
+    assert report.columns.tolist() == REPORT_COLUMNS + ['article']
+    assert report.loc[report['id'] == 'id3', 'article'].iloc[0] == 'Full text of /3'
+    assert (first['articles']['misses'], first['articles']['hit_ratio']) == (10, 0.0)
+    assert (second['articles']['requests'], second['articles']['hit_ratio']) == (0, 1.0)
@@ -0,0 +1,21 @@
+import pandas as pd
+
+from script import extract_category_names, extract_product_names, parse_tags
+
+
+def test_parse_tags_matches_per_row_functions():
+    services = pd.Series([
+        "general:products/amazon-appflow,marketing:marchitecture/application-integration",
+        "general:products/amazon-s3,general:products/aws-backup,marketing:marchitecture/storage",
+        "marketing:marchitecture/analytics",
+        "general:products/amazon-appflow,marketing:marchitecture/application-integration",
+        "",
+    ], index=[10, 11, 12, 13, 14])
+
+    tags = parse_tags(services)
+
+    assert tags.index.tolist() == services.index.tolist()
+    assert tags['product'].tolist() == services.apply(extract_product_names).tolist()
+    assert tags['category'].tolist() == services.apply(extract_category_names).tolist()
+    assert tags.loc[11, 'products'] == ['amazon-s3', 'aws-backup']
+    assert tags.loc[12, 'products'] == []
@@ -0,0 +1,65 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+from local_aws import LocalGlueClient, LocalS3Client, local_boto3
+import script
+# importable once script has added the modules shared with the collector to the path
+import aws_clients
+from metrics import read_metrics_file
+
+LAMBDA_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'lambda_function.py')
+
+
+def load_trigger(clients, monkeypatch):
+    monkeypatch.setenv('GLUE_WORKFLOW_NAME', 'workflow')
+    # the processor Lambda is also named lambda_function, load it under another module name
+    spec = importlib.util.spec_from_file_location('processor_trigger', LAMBDA_PATH)
+    module = importlib.util.module_from_spec(spec)
+    aws_clients.reset_clients()
+    with local_boto3(clients):
+        spec.loader.exec_module(module)
+    return module
+
+
+def sqs_batch(keys):
+    return {'Records': [
+        {'body': json.dumps({'detail': {'bucket': {'name': 'bucket'}, 'object': {'key': key}}})} for key in keys
+    ]}
+
+
+def read_manifest(s3, uri):
+    return json.loads(s3.get_object(Bucket='bucket', Key=uri[len('s3://bucket/'):])['Body'].read())
+
+
+def test_batch_starts_one_run_with_a_manifest(tmp_path, monkeypatch):
+    s3, glue = LocalS3Client(str(tmp_path)), LocalGlueClient()
+    trigger = load_trigger({'s3': s3, 'glue': glue}, monkeypatch)
+
+    trigger.lambda_handler(sqs_batch(['landing/b.csv', 'landing/a.csv', 'landing/b.csv']), None)
+
+    # the clients come from the registry shared with the collector and the Glue job
+    assert trigger.glue_client is aws_clients.get_client('glue')
+    assert len(glue.runs) == 1
+    manifest = glue.runs[0]['RunProperties']['manifest']
+    assert manifest.startswith('s3://bucket/state/batches/')
+    assert read_manifest(s3, manifest)['keys'] == ['landing/a.csv', 'landing/b.csv']
+
+
+def test_busy_workflow_fails_the_batch(tmp_path, monkeypatch):
+    s3, glue = LocalS3Client(str(tmp_path)), LocalGlueClient(max_concurrent_runs=1)
+    monkeypatch.setenv('METRICS_FILE', str(tmp_path / "metrics.jsonl"))
+    trigger = load_trigger({'s3': s3, 'glue': glue}, monkeypatch)
+    trigger.lambda_handler(sqs_batch(['landing/a.csv']), None)
+
+    # the exception returns the messages to the queue, they are retried later
+    with pytest.raises(glue.exceptions.ConcurrentRunsExceededException):
+        trigger.lambda_handler(sqs_batch(['landing/b.csv']), None)
+    assert len(s3.list_objects_v2(Bucket='bucket', Prefix='state/batches/')['Contents']) == 1
+    # the stage metrics of both invocations, the second one failed
+    documents = read_metrics_file(str(tmp_path / "metrics.jsonl"))
+    assert [(document['Stage'], document.get('Rows'), document['Errors']) for document in documents] == [
+        ('start_workflow', 1, 0), ('start_workflow', None, 1)
+    ]